@@ -0,0 +1,82 @@
+"""
+动作解析基准：以已保存轨迹（trajectory.json）中的 history_response 为语料，
+统计 action_grammar 的解析吞吐与失败率（按失败原因、动作类型分类）。
+
+用法：
+    python bench_action_parser.py --result_dir result/uitars_1_5 --family uitars_1_5
+    python bench_action_parser.py --result_dir result --family all --show_failures 5
+"""
+import argparse
+import collections
+import glob
+import json
+import os
+import statistics
+import time
+
+from utils import action_grammar
+
+
+def load_corpus(result_dir):
+    """递归读取 trajectory.json，返回所有 history_response。"""
+    responses = []
+    for path in sorted(glob.glob(os.path.join(result_dir, "**", "trajectory.json"), recursive=True)):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                traj = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[Bench] 跳过无法读取的轨迹 {path}: {e}")
+            continue
+        responses.extend(r for r in traj.get("history_response") or [] if isinstance(r, str))
+    return responses
+
+
+def bench_family(family, responses, repeat):
+    costs = []
+    outcomes = []
+    for _ in range(repeat):
+        outcomes = []
+        for content in responses:
+            start = time.perf_counter()
+            outcome = action_grammar.parse(family, content)
+            costs.append(time.perf_counter() - start)
+            outcomes.append(outcome)
+    kinds = collections.Counter(action.kind for action, _ in outcomes if action is not None)
+    reasons = collections.Counter(error.reason for _, error in outcomes if error is not None)
+    failures = [(content, error) for content, (_, error) in zip(responses, outcomes) if error is not None]
+    return sorted(costs), kinds, reasons, failures
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark action parsing over stored trajectories")
+    parser.add_argument("--result_dir", type=str, default="result", help="轨迹目录（递归查找 trajectory.json）")
+    parser.add_argument("--family", type=str, default="all",
+                        help="逗号分隔的模型家族，见 action_grammar.FAMILIES；all 表示全部")
+    parser.add_argument("--repeat", type=int, default=5, help="语料重复解析的轮数")
+    parser.add_argument("--show_failures", type=int, default=0, help="每个家族打印多少条解析失败的样例")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    responses = load_corpus(args.result_dir)
+    if not responses:
+        print(f"[Bench] {args.result_dir} 下没有找到 history_response")
+        return
+    families = list(action_grammar.FAMILIES) if args.family == "all" else args.family.split(",")
+    print(f"[Bench] 语料 {len(responses)} 条回复，重复 {args.repeat} 轮")
+
+    print(f"{'family':>14}{'resp/s':>12}{'mean us':>10}{'p95 us':>10}{'fail %':>9}  reasons")
+    for family in families:
+        costs, kinds, reasons, failures = bench_family(family, responses, args.repeat)
+        p95 = costs[min(len(costs) - 1, int(0.95 * len(costs)))]
+        reason_text = ", ".join(f"{k}={v}" for k, v in reasons.most_common()) or "-"
+        print(f"{family:>14}{len(costs) / sum(costs):>12.0f}{statistics.mean(costs) * 1e6:>10.1f}"
+              f"{p95 * 1e6:>10.1f}{100 * len(failures) / len(responses):>9.1f}  {reason_text}")
+        print(f"{'':>14}actions: " + ", ".join(f"{k}={v}" for k, v in kinds.most_common()))
+        for content, error in failures[:args.show_failures]:
+            print(f"{'':>14}- {error}  <- {content[-120:]!r}")
+
+
+if __name__ == "__main__":
+    main()
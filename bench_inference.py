@@ -0,0 +1,91 @@
+"""
+推理吞吐基准：在不同并发下通过 async_inference 发送请求，比较吞吐（req/s）与延迟。
+
+默认启动本地 mock 服务（llm_core/mock_openai_server.py），也可以指向真实的 vLLM 服务。
+
+用法：
+    python bench_inference.py --concurrency 1,2,4,8,16,32
+    python bench_inference.py --base_url http://10.0.0.1:8000/v1 --image result/debug_test/step_0.png
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from llm_core import async_inference, llm_client
+from llm_core.mock_openai_server import MockOpenAIServer
+from utils import action_parser_tool
+
+
+def build_messages(index, image_path, transport, unique):
+    content = [{"type": "text", "text": f"请完成任务：打开设置。(#{index if unique else 0})"}]
+    if image_path:
+        content.append({"type": "image_url",
+                        "image_url": {"url": action_parser_tool.image_to_uri(image_path, transport=transport)}})
+    return [{"role": "user", "content": content}]
+
+
+async def run_level(client, concurrency, requests, image_path, transport, unique):
+    """同时保持 concurrency 个请求在途，共发送 requests 个。"""
+    latencies = []
+    queue = list(range(requests))
+
+    async def worker():
+        while queue:
+            index = queue.pop()
+            messages = build_messages(index, image_path, transport, unique)
+            start = time.perf_counter()
+            await client.call_async(messages, max_tokens=64)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, sorted(latencies)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark inference throughput versus concurrency")
+    parser.add_argument("--base_url", type=str, default=None, help="OpenAI 兼容服务地址，缺省时启动本地 mock 服务")
+    parser.add_argument("--model", type=str, default=None, help="模型名，缺省时从 /v1/models 获取")
+    parser.add_argument("--api_key", type=str, default="123456")
+    parser.add_argument("--concurrency", type=str, default="1,2,4,8,16,32", help="逗号分隔的并发数")
+    parser.add_argument("--requests", type=int, default=64, help="每个并发级别发送的请求数")
+    parser.add_argument("--image", type=str, default=None, help="可选，随请求发送的截图")
+    parser.add_argument("--transport", type=str, default="lossless",
+                        help="截图的传输配置，见 action_parser_tool.TRANSPORT_PROFILES")
+    parser.add_argument("--duplicate", action="store_true", help="所有请求内容相同，用于观察请求合并的效果")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = MockOpenAIServer().start()
+        base_url = server.base_url
+        print(f"[Bench] 使用本地 mock 服务 {base_url}")
+    model = args.model
+    if model is None:
+        model = llm_client.discover_model(llm_client.get_openai_client(base_url, args.api_key), base_url)
+    transport = action_parser_tool.get_transport(args.transport)
+
+    print(f"{'concurrency':>12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'coalesced':>11}")
+    for level in [int(c) for c in args.concurrency.split(",")]:
+        # 每个级别单独的引擎，确保并发上限与合并计数互不影响
+        engine = async_inference.AsyncInferenceEngine(max_concurrency=level)
+        client = async_inference.AsyncOpenAI_Client(base_url, model, args.api_key, engine=engine)
+        wall, latencies = engine.run(run_level(client, level, args.requests, args.image, transport,
+                                               unique=not args.duplicate))
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        print(f"{level:>12}{len(latencies) / wall:>10.2f}{statistics.median(latencies) * 1000:>10.0f}"
+              f"{p95 * 1000:>10.0f}{engine.coalesced:>11}")
+        engine.close()
+
+    if server is not None:
+        print(f"[Bench] mock 服务峰值并发 {server.backend.peak}, 共处理 {server.backend.served} 个请求")
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
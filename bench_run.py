@@ -0,0 +1,274 @@
+"""
+整轮评测基准：衡量评测框架本身——任务 / 步骤吞吐、各阶段单步延迟分位数、设备与模型的空闲比例、重试 / 重连次数，
+结果写入带 schema 版本与代码版本的 JSON，用于对比框架改动、模型服务前后的变化。
+
+两种模式：
+- 在线：用 main_task 的调度器在真机上跑一个任务 CSV（或随机抽样的子集），结果写入 result/bench/ 下的新目录；
+  --serial replay:<结果目录> 时用 utils/replay_device.py 回放已保存的轨迹代替手机；
+- 回放：不连接手机，直接统计已保存的结果目录（trajectory.json 中的 step_timings）。
+
+用法：
+    python bench_run.py --task_file top12.csv --model_name uitars_1_5 --serial 12345678 --sample 20
+    python bench_run.py --task_file top12.csv --model_name uitars_1_5 --serial "replay:result/round1?scale=0.5" --sample 20
+    python bench_run.py --replay result/round1,result/round2
+    python bench_run.py --replay result/round1 --compare bench/20250101-120000_round1.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils import app_reset, trace_export, trajectory_index
+from utils.evaluator_xpath import categorize
+
+SCHEMA_VERSION = 1
+BENCH_DIR = Path("bench")
+
+# 占用手机的阶段与占用模型服务的阶段，其余（编码、写盘、解析……）为本机开销
+DEVICE_PHASES = ("screenshot", "dump_hierarchy", "execute", "settle", "clear_background", "app_reset", "launch_app")
+MODEL_PHASES = ("inference",)
+
+# compare 时打印的指标：(名称, 取值路径)
+_COMPARE_KEYS = [
+    ("tasks/hour", ("throughput", "tasks_per_hour")),
+    ("steps/hour", ("throughput", "steps_per_hour")),
+    ("step p50", ("step_latency", "wall", "p50")),
+    ("step p95", ("step_latency", "wall", "p95")),
+    ("inference p50", ("step_latency", "inference", "p50")),
+    ("inference p95", ("step_latency", "inference", "p95")),
+    ("device idle", ("idle", "device_idle_ratio")),
+    ("model idle", ("idle", "model_idle_ratio")),
+    ("success rate", ("outcome", "success_rate")),
+]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"n": 0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4)
+
+    return {"n": len(ordered), "mean": round(sum(ordered) / len(ordered), 4),
+            "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1], 4)}
+
+
+def _span_wall(trajectories: List[Dict[str, Any]]) -> float:
+    """回放模式的墙钟时长：最早开始到最晚结束（多设备并行时不重复计算）。"""
+    starts, ends = [], []
+    for data in trajectories:
+        if data.get("started_at") is None:
+            continue
+        starts.append(data["started_at"])
+        ends.append(data["started_at"] + (data.get("timings") or {}).get("total", 0.0))
+    if starts:
+        return max(ends) - min(starts)
+    return sum((data.get("timings") or {}).get("total", 0.0) for data in trajectories)
+
+
+def summarize(trajectories: List[Dict[str, Any]], wall_seconds: float) -> Dict[str, Any]:
+    """由轨迹计算吞吐、延迟分位数、空闲比例与结果分布。"""
+    phase_samples: Dict[str, List[float]] = {"wall": []}
+    task_phase_samples: Dict[str, List[float]] = {}
+    task_totals, steps, retries, success = [], 0, 0, 0
+    device_time = model_time = busy_time = 0.0
+    categories: Dict[str, int] = {}
+    for data in trajectories:
+        actions = data.get("history_action") or []
+        step_timings = data.get("step_timings") or []
+        steps += max(len(actions), sum(1 for step in step_timings if step["step"] > 0))
+        retries += max(0, (data.get("attempt") or 1) - 1)
+        success += bool(data.get("success"))
+        finished = bool(actions) and isinstance(actions[-1], dict) and actions[-1].get("action") == "terminate"
+        category = categorize(bool(data.get("success")), finished)
+        categories[category] = categories.get(category, 0) + 1
+        total = (data.get("timings") or {}).get("total")
+        if total is not None:
+            task_totals.append(total)
+            busy_time += total
+        for step in step_timings:
+            # step 0 为任务级阶段（清后台、启动 app、评估……），单独统计
+            target = task_phase_samples if step["step"] == 0 else phase_samples
+            if step["step"] > 0:
+                phase_samples["wall"].append(step["wall"])
+            for name, cost in step["phases"].items():
+                target.setdefault(name, []).append(cost)
+                if name in DEVICE_PHASES:
+                    device_time += cost
+                elif name in MODEL_PHASES:
+                    model_time += cost
+
+    hours = wall_seconds / 3600 if wall_seconds > 0 else 0.0
+    return {
+        "tasks": len(trajectories),
+        "steps": steps,
+        "wall_seconds": round(wall_seconds, 2),
+        "throughput": {
+            "tasks_per_hour": round(len(trajectories) / hours, 2) if hours else None,
+            "steps_per_hour": round(steps / hours, 2) if hours else None,
+            "steps_per_task": round(steps / len(trajectories), 2) if trajectories else None,
+        },
+        "task_latency": percentiles(task_totals),
+        "step_latency": {name: percentiles(values) for name, values in sorted(phase_samples.items())},
+        "task_phase_latency": {name: percentiles(values) for name, values in sorted(task_phase_samples.items())},
+        # 任务执行期间手机 / 模型服务没有在工作的时间占比；流水线模式下两者重叠，比例之和可小于 1
+        "idle": {
+            "device_busy_seconds": round(device_time, 2),
+            "model_busy_seconds": round(model_time, 2),
+            "device_idle_ratio": round(max(0.0, 1 - device_time / busy_time), 4) if busy_time else None,
+            "model_idle_ratio": round(max(0.0, 1 - model_time / busy_time), 4) if busy_time else None,
+        },
+        "outcome": {
+            "success_rate": round(success / len(trajectories), 4) if trajectories else None,
+            "categories": categories,
+            "task_retries": retries,
+        },
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_live(args) -> Dict[str, Any]:
+    """在真机上跑一轮任务，返回轨迹、墙钟秒数与各类计数。"""
+    import main_task
+    from llm_core import backends
+    from utils import artifact_store
+
+    tasks = main_task.load_tasks(Path(args.task_file))
+    if args.sample and args.sample < len(tasks):
+        tasks = random.Random(args.seed).sample(tasks, args.sample)
+    serials = main_task.discover_serials() if args.serial == "auto" else \
+        [s.strip() for s in args.serial.split(",") if s.strip()]
+    base_dir = Path("result") / "bench" / f"{args.model_name}_{datetime.now():%Y%m%d-%H%M%S}"
+    artifact_store.configure(None if args.plain_artifacts else Path("result") / artifact_store.ARTIFACTS_DIR)
+    backends.load(args.model_name)
+    transport = backends.transport_for(args.model_name, args.transport)
+
+    # 结果在 result/bench/ 下，索引仍写入共享的 result/trajectory_index.db，view_data 等工具才能查到
+    sink = main_task.ResultSink(base_dir, model=args.model_name, index_path=trajectory_index.DEFAULT_INDEX_PATH)
+    scheduler = main_task.DevicePoolScheduler(serials, args.model_name, sink, base_dir, args.connect_retry,
+                                              args.fail_retry, args.reset, pipelined=args.pipelined,
+                                              app_reset_mode=args.app_reset, snapshot_dir=args.snapshot_dir,
+                                              async_inference=args.async_inference, transport=transport)
+    main_task.HARNESS_STATS.clear()
+    app_reset.RESET_STATS.clear()
+    print(f"[Bench] {len(tasks)} 个任务，设备 {serials}，截图传输 {transport}，结果目录 {base_dir}")
+    start = time.perf_counter()
+    scheduler.run_round(tasks)
+    wall = time.perf_counter() - start
+
+    from llm_core import llm_client
+    trajectories = [data for _, data in trace_export.load_trajectories([str(base_dir)])]
+    counters = dict(main_task.HARNESS_STATS.snapshot(), tasks_attempted=len(tasks))
+    return {"trajectories": trajectories, "wall": wall, "counters": counters,
+            "llm_requests": llm_client.request_stats(), "app_reset": app_reset.RESET_STATS.summary(),
+            "result_dir": str(base_dir), "transport": transport,
+            "backend_import_times": backends.import_times()}
+
+
+def run_replay(args) -> Dict[str, Any]:
+    result_dirs = [d for d in args.replay.split(",") if d]
+    trajectories = [data for _, data in trace_export.load_trajectories(result_dirs)]
+    return {"trajectories": trajectories, "wall": _span_wall(trajectories), "counters": {},
+            "result_dir": result_dirs}
+
+
+def _get(report: Dict[str, Any], path) -> Optional[float]:
+    value: Any = report.get("metrics", {})
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]):
+    if old.get("schema_version") != new.get("schema_version"):
+        print(f"[Bench] schema 版本不同（{old.get('schema_version')} vs {new.get('schema_version')}），只比较共有字段")
+    print(f"{'metric':<16}{'before':>12}{'after':>12}{'change':>10}")
+    for name, path in _COMPARE_KEYS:
+        before, after = _get(old, path), _get(new, path)
+        if before is None or after is None:
+            continue
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "-"
+        print(f"{name:<16}{before:>12.4g}{after:>12.4g}{change:>10}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the evaluation harness end to end")
+    parser.add_argument("--replay", type=str, default=None,
+                        help="逗号分隔的已有结果目录：不连接手机，直接统计其中的轨迹")
+    parser.add_argument("--task_file", type=str, default="top12.csv")
+    parser.add_argument("--sample", type=int, default=0, help="随机抽取的任务数，0 表示全部")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model_name", type=str, default="uitars_1_5")
+    parser.add_argument("--serial", type=str, default="auto")
+    parser.add_argument("--connect_retry", type=int, default=3)
+    parser.add_argument("--fail_retry", type=int, default=1)
+    parser.add_argument("--reset", action="store_true")
+    parser.add_argument("--pipelined", action="store_true")
+    parser.add_argument("--plain_artifacts", action="store_true")
+    parser.add_argument("--app_reset", type=str, default="relaunch", choices=app_reset.RESET_MODES)
+    parser.add_argument("--snapshot_dir", type=str, default=app_reset.SNAPSHOT_DIR)
+    parser.add_argument("--async_inference", type=int, default=0, help="大于 0 时启用异步推理层，值为每个 endpoint 的并发上限")
+    parser.add_argument("--transport", type=str, default=None, help="截图传输配置，默认取后端在 llm_core/backends.py 中的配置")
+    parser.add_argument("--label", type=str, default=None, help="报告文件名中的标签，默认为模型名或结果目录名")
+    parser.add_argument("--output", type=str, default=None, help="报告路径，默认 bench/<时间>_<标签>.json")
+    parser.add_argument("--compare", type=str, default=None, help="与之前的报告对比")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    outcome = run_replay(args) if args.replay else run_live(args)
+    trajectories = outcome.pop("trajectories")
+    if not trajectories:
+        print("[Bench] 没有可统计的轨迹（需要带 step_timings 的 trajectory.json）")
+        return
+    report = {
+        "schema_version": SCHEMA_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "mode": "replay" if args.replay else "live",
+        "harness": {"git_commit": _git_commit(), "python": platform.python_version(), "host": platform.node()},
+        "config": vars(args),
+        "metrics": summarize(trajectories, outcome.pop("wall")),
+        **outcome,
+    }
+
+    label = args.label or (Path(args.replay.split(",")[0]).name if args.replay else args.model_name)
+    output = Path(args.output) if args.output else BENCH_DIR / f"{datetime.now():%Y%m%d-%H%M%S}_{label}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    metrics = report["metrics"]
+    print(f"[Bench] {metrics['tasks']} tasks / {metrics['steps']} steps in {metrics['wall_seconds']:.0f}s: "
+          f"{metrics['throughput']['tasks_per_hour']} tasks/h, {metrics['throughput']['steps_per_hour']} steps/h")
+    print(f"{'phase':>18}{'n':>7}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, stats in metrics["step_latency"].items():
+        if stats["n"]:
+            print(f"{name:>18}{stats['n']:>7}{stats['p50']:>9.3f}{stats['p95']:>9.3f}{stats['p99']:>9.3f}")
+    print(f"[Bench] idle: device {metrics['idle']['device_idle_ratio']}, model {metrics['idle']['model_idle_ratio']}; "
+          f"retries {metrics['outcome']['task_retries']}, counters {report['counters']}")
+    print(f"[Bench] 报告已写入 {output}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
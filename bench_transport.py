@@ -0,0 +1,88 @@
+"""
+图片传输配置基准：对已保存的截图，比较不同 transport 的 payload 大小、编码耗时，
+可选地对真实模型服务测量端到端单步延迟。
+
+用法：
+    python bench_transport.py --image_dir result/debug_test
+    python bench_transport.py --image_dir result/debug_test --wrapper llm_core.llm_core_qwen2_5vl:qwen2_5vl_Wrapper --goal "打开设置"
+"""
+import argparse
+import glob
+import importlib
+import os
+import statistics
+import time
+
+from PIL import Image
+
+from utils import action_parser_tool
+
+
+def collect_images(image_dir, limit):
+    paths = sorted(glob.glob(os.path.join(image_dir, "**", "*.png"), recursive=True))
+    return paths[:limit]
+
+
+def bench_encode(paths, transport):
+    sizes, costs = [], []
+    for path in paths:
+        # 预先解码，只统计编码 + base64 的耗时；同时绕开 URI 缓存
+        image = Image.open(path)
+        image.load()
+        start = time.perf_counter()
+        uri = action_parser_tool.image_to_uri(image, transport=transport)
+        costs.append(time.perf_counter() - start)
+        sizes.append(len(uri))
+        action_parser_tool.IMAGE_URI_CACHE.clear()
+    return sizes, costs
+
+
+def bench_end_to_end(wrapper_spec, transport, goal, paths):
+    module_name, class_name = wrapper_spec.split(":")
+    wrapper_cls = getattr(importlib.import_module(module_name), class_name)
+    llm = wrapper_cls(transport=transport)
+    history = {"history_response": [], "history_image_path": [], "history_action": []}
+    costs = []
+    for path in paths:
+        start = time.perf_counter()
+        llm.predict_mm(goal, path, history)
+        costs.append(time.perf_counter() - start)
+    return costs
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark image transport profiles")
+    parser.add_argument("--image_dir", type=str, default="result", help="截图所在目录（递归查找 *.png）")
+    parser.add_argument("--limit", type=int, default=50, help="最多使用多少张截图")
+    parser.add_argument("--profiles", type=str, default=",".join(action_parser_tool.TRANSPORT_PROFILES),
+                        help="逗号分隔的 transport 名称，见 action_parser_tool.TRANSPORT_PROFILES")
+    parser.add_argument("--wrapper", type=str, default=None,
+                        help="可选，module:Class 形式的模型 wrapper，用于测量端到端单步延迟")
+    parser.add_argument("--goal", type=str, default="打开设置", help="端到端测试使用的任务指令")
+    parser.add_argument("--steps", type=int, default=5, help="端到端测试的请求次数")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    paths = collect_images(args.image_dir, args.limit)
+    if not paths:
+        print(f"[Bench] 在 {args.image_dir} 下未找到截图")
+        return
+    width, height = Image.open(paths[0]).size
+    print(f"[Bench] {len(paths)} 张截图, 原始尺寸 {width}x{height}")
+    print(f"{'profile':<16}{'sent size':>12}{'avg KB':>10}{'encode ms':>12}{'e2e ms':>10}")
+    for name in args.profiles.split(","):
+        transport = action_parser_tool.TRANSPORT_PROFILES[name]
+        sizes, costs = bench_encode(paths, transport)
+        sent_w, sent_h = transport.target_size(width, height)
+        e2e = "-"
+        if args.wrapper:
+            e2e_costs = bench_end_to_end(args.wrapper, transport, args.goal, paths[:args.steps])
+            e2e = f"{statistics.median(e2e_costs) * 1000:.0f}"
+        print(f"{name:<16}{f'{sent_w}x{sent_h}':>12}{statistics.mean(sizes) / 1024:>10.1f}"
+              f"{statistics.median(costs) * 1000:>12.1f}{e2e:>10}")
+
+
+if __name__ == "__main__":
+    main()
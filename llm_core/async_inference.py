@@ -0,0 +1,285 @@
+"""
+基于 asyncio 的推理层：多个设备 / 轨迹并发提交请求，让 vLLM 的 continuous batching 真正吃满。
+
+- 后台线程里跑一个事件循环，同步调用方（设备 worker 线程）通过 submit() 拿到 Future
+- 每个 endpoint 一个并发上限（asyncio.Semaphore）
+- 请求合并：完全相同的请求（同 endpoint / 模型 / 参数 / messages）在途时只发一次；
+  请求摘要（messages 含 MB 级的 base64 截图）在调用方线程计算，不占用事件循环
+- 重试、退避与请求统计复用 llm_client
+- 配置了多副本（endpoint_pool）的模型同样支持：每次请求选一个副本，可重试错误时换副本
+
+与现有 wrapper 的衔接：
+    llm = llm_core_qwen2_5vl.qwen2_5vl_Wrapper()
+    async_inference.enable_async_inference(llm, max_concurrency=16)   # 之后 predict_mm 走异步层
+或在协程里直接：
+    response, output = await async_inference.predict_mm_async(llm, goal, image_path, history)
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Optional, Tuple
+
+import openai
+from openai import AsyncOpenAI
+
+from llm_core import endpoint_pool, llm_client
+
+
+class AsyncInferenceEngine:
+    """一个事件循环 + 每 endpoint 的 AsyncOpenAI 客户端与并发上限。"""
+
+    def __init__(self, max_concurrency: int = 16, coalesce: bool = True,
+                 config: llm_client.ClientConfig = llm_client.DEFAULT_CONFIG):
+        self.max_concurrency = max_concurrency
+        self.coalesce = coalesce
+        self.config = config
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="async-inference", daemon=True)
+        self._thread.start()
+        self._clients: Dict[Tuple[str, str], AsyncOpenAI] = {}
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+
+    # ---------- 事件循环内 ----------
+
+    def _client(self, base_url: str, api_key: str) -> AsyncOpenAI:
+        key = (base_url, api_key)
+        if key not in self._clients:
+            self._clients[key] = AsyncOpenAI(base_url=base_url, api_key=api_key, max_retries=0,
+                                             timeout=self.config.timeout)
+        return self._clients[key]
+
+    def _limit(self, base_url: str, limit: Optional[int]) -> asyncio.Semaphore:
+        if base_url not in self._limits:
+            self._limits[base_url] = asyncio.Semaphore(limit or self.max_concurrency)
+        return self._limits[base_url]
+
+    @staticmethod
+    def request_digest(model: str, messages, params: Dict[str, Any]) -> str:
+        """请求体（模型 / messages / 参数）的摘要，用于合并相同请求；应在调用方线程计算。"""
+        body = json.dumps([model, messages, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.blake2b(body.encode("utf-8"), digest_size=16).hexdigest()
+
+    async def _send(self, base_url: str, api_key: str, model: str, messages, params, limit,
+                    retries: Optional[int] = None) -> str:
+        client = self._client(base_url, api_key)
+        max_retries = self.config.max_retries if retries is None else retries
+        size = llm_client.payload_bytes(messages)
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                async with self._limit(base_url, limit):
+                    result = await client.chat.completions.create(model=model, messages=messages, **params)
+                usage = getattr(result, "usage", None)
+                llm_client.REQUEST_STATS.record(
+                    endpoint=base_url, model=model, ok=True, attempts=attempt + 1,
+                    latency=time.perf_counter() - start, payload_bytes=size,
+                    prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+                    completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+                )
+                content = result.choices[0].message.content
+                if content is None:
+                    raise llm_client.LLMRequestError(f"[LLM] {base_url} 返回空内容")
+                return content
+            except llm_client.RETRYABLE_ERRORS as e:
+                if attempt >= max_retries:
+                    error = e
+                    break
+                # 退避期间不占用并发名额
+                await asyncio.sleep(llm_client.backoff_delay(attempt, self.config, e))
+                attempt += 1
+            except openai.APIError as e:
+                error = e
+                break
+        llm_client.REQUEST_STATS.record(
+            endpoint=base_url, model=model, ok=False, attempts=attempt + 1,
+            latency=time.perf_counter() - start, payload_bytes=size, prompt_tokens=0, completion_tokens=0,
+        )
+        raise llm_client.LLMRequestError(
+            f"[LLM] {base_url} 请求失败（{attempt + 1} 次尝试）: {type(error).__name__}: {error}") from error
+
+    async def request(self, base_url: str, api_key: str, model: str, messages,
+                      limit: Optional[int] = None, retries: Optional[int] = None,
+                      digest: Optional[str] = None, **params) -> str:
+        """
+        发送一次 chat completion；相同请求在途时直接等待已有结果。retries 覆盖 config.max_retries。
+        digest 为 request_digest() 的结果；未给出时在线程池中计算，避免序列化大请求时阻塞事件循环。
+        """
+        if not self.coalesce:
+            return await self._send(base_url, api_key, model, messages, params, limit, retries)
+        if digest is None:
+            digest = await asyncio.get_running_loop().run_in_executor(None, self.request_digest, model, messages, params)
+        key = f"{base_url}|{digest}"
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+        task = asyncio.ensure_future(self._send(base_url, api_key, model, messages, params, limit, retries))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    # ---------- 线程侧接口 ----------
+
+    def submit(self, base_url: str, api_key: str, model: str, messages,
+               limit: Optional[int] = None, **params) -> Future:
+        """从任意线程提交请求，返回 concurrent.futures.Future；请求摘要在当前线程计算。"""
+        digest = self.request_digest(model, messages, params) if self.coalesce else None
+        coro = self.request(base_url, api_key, model, messages, limit=limit, digest=digest, **params)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro):
+        """在引擎的事件循环上运行协程并阻塞等待结果（供同步代码驱动批量任务）。"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def close(self):
+        """关闭各 endpoint 的连接并停止事件循环。"""
+        async def _close():
+            for client in self._clients.values():
+                await client.close()
+        self.run(_close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+_engine: Optional[AsyncInferenceEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine(max_concurrency: int = 16) -> AsyncInferenceEngine:
+    """进程内共享的推理引擎，首次调用时创建。"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncInferenceEngine(max_concurrency=max_concurrency)
+        return _engine
+
+
+class AsyncOpenAI_Client:
+    """
+    与 llm_client.OpenAI_Client 同接口（call 同步返回文本），请求经由共享的异步引擎发送。
+    多个设备线程同时 call 时，请求会并发进入 vLLM 的同一批次。
+    """
+
+    def __init__(self, base_url: str, model: str, api_key: str = "123456",
+                 max_concurrency: Optional[int] = None, engine: Optional[AsyncInferenceEngine] = None):
+        self.base_url = base_url
+        self.model = model
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.engine = engine or get_engine()
+
+    @classmethod
+    def from_client(cls, client: "llm_client.OpenAI_Client", max_concurrency: Optional[int] = None):
+        return cls(client.base_url, client.model, client.client.api_key, max_concurrency=max_concurrency)
+
+    def _params(self, temparature, top_p, max_tokens) -> Dict[str, Any]:
+        params = {"max_tokens": max_tokens, "temperature": temparature}
+        if top_p is not None:
+            params["top_p"] = top_p
+        return params
+
+    def call(self, messages, temparature=0.0, top_p=None, max_tokens=512):
+        return self.engine.submit(self.base_url, self.api_key, self.model, messages,
+                                  limit=self.max_concurrency,
+                                  **self._params(temparature, top_p, max_tokens)).result()
+
+    async def call_async(self, messages, temparature=0.0, top_p=None, max_tokens=512):
+        return await self.engine.request(self.base_url, self.api_key, self.model, messages,
+                                         limit=self.max_concurrency,
+                                         **self._params(temparature, top_p, max_tokens))
+
+
+class AsyncPooledOpenAI_Client(AsyncOpenAI_Client):
+    """
+    endpoint_pool.PooledOpenAI_Client 的异步版本：副本的选择、摘除与健康检查仍由共享的 EndpointPool 负责，
+    单个副本上不重试，可重试错误时立即换下一个副本，所有副本都失败后再整体退避。
+    max_concurrency 是每个副本的并发上限。
+    """
+
+    def __init__(self, pool: "endpoint_pool.EndpointPool", api_key: str = "123456",
+                 max_concurrency: Optional[int] = None, engine: Optional[AsyncInferenceEngine] = None):
+        super().__init__(pool.name, pool.model, api_key, max_concurrency=max_concurrency, engine=engine)
+        self.pool = pool
+
+    @classmethod
+    def from_client(cls, client: "endpoint_pool.PooledOpenAI_Client", max_concurrency: Optional[int] = None):
+        pool = client.pool
+        return cls(pool, pool.endpoints[0].client.api_key, max_concurrency=max_concurrency)
+
+    def call(self, messages, temparature=0.0, top_p=None, max_tokens=512):
+        params = self._params(temparature, top_p, max_tokens)
+        digest = self.engine.request_digest(self.model, messages, params) if self.engine.coalesce else None
+        return self.engine.run(self.call_async(messages, temparature, top_p, max_tokens, digest=digest))
+
+    async def call_async(self, messages, temparature=0.0, top_p=None, max_tokens=512, digest: Optional[str] = None):
+        params = self._params(temparature, top_p, max_tokens)
+        if digest is None and self.engine.coalesce:
+            # 每个副本的请求体相同，只算一次
+            digest = await asyncio.get_running_loop().run_in_executor(
+                None, self.engine.request_digest, self.model, messages, params)
+        config = self.pool.config
+        tried = []
+        attempt = 0
+        while True:
+            endpoint = self.pool.acquire(exclude=tried)
+            if endpoint is None:
+                if attempt >= config.max_retries:
+                    raise error
+                delay = llm_client.backoff_delay(attempt, config, error.__cause__)
+                print(f"[Pool] {self.pool.name}: 所有副本均失败，{delay:.1f}s 后重试 ({attempt + 1}/{config.max_retries})")
+                await asyncio.sleep(delay)
+                attempt += 1
+                tried = []
+                continue
+            try:
+                content = await self.engine.request(endpoint.base_url, self.api_key, self.model, messages,
+                                                    limit=self.max_concurrency, retries=0, digest=digest, **params)
+            except llm_client.LLMRequestError as e:
+                retryable = isinstance(e.__cause__, llm_client.RETRYABLE_ERRORS)
+                self.pool.release(endpoint, ok=not retryable)
+                if not retryable:
+                    raise
+                error = e
+                tried.append(endpoint)
+                continue
+            self.pool.release(endpoint, ok=True)
+            return content
+
+
+def enable_async_inference(wrapper, max_concurrency: Optional[int] = None):
+    """
+    把 wrapper 的同步客户端替换为异步引擎客户端；wrapper.predict_mm 无需改动。
+    支持 OpenAI_Client 与多副本的 PooledOpenAI_Client；其他客户端（如 Azure）抛 TypeError。
+    """
+    client = wrapper.client
+    if isinstance(client, AsyncOpenAI_Client):
+        return wrapper
+    if isinstance(client, endpoint_pool.PooledOpenAI_Client):
+        wrapper.client = AsyncPooledOpenAI_Client.from_client(client, max_concurrency=max_concurrency)
+        return wrapper
+    if not isinstance(client, llm_client.OpenAI_Client):
+        raise TypeError(f"{type(wrapper).__name__} 使用的 {type(client).__name__} 不支持异步推理")
+    wrapper.client = AsyncOpenAI_Client.from_client(client, max_concurrency=max_concurrency)
+    return wrapper
+
+
+async def predict_mm_async(wrapper, goal, current_image_path, history,
+                           temparature=0.0, top_p=0.9, max_tokens=512, width=1080, height=2400):
+    """
+    协程版 predict_mm：沿用 wrapper 的 message_handler.process_message / process_response，
+    同一事件循环里可并发跑大量轨迹的推理。
+    """
+    if not isinstance(wrapper.client, AsyncOpenAI_Client):
+        enable_async_inference(wrapper)
+    req_messages = wrapper.message_handler.process_message(goal, current_image_path, history)
+    response = await wrapper.client.call_async(req_messages, temparature=temparature, top_p=top_p,
+                                               max_tokens=max_tokens)
+    output = wrapper.message_handler.process_response(response, width, height)
+    return response, output
@@ -0,0 +1,104 @@
+"""
+模型后端注册表：model_name 前缀 -> (wrapper 所在模块, wrapper 类名, agent 模块, 默认截图传输配置)。
+
+main_task 不再在顶层 import 全部 llm_core_xxx（openai / Azure 客户端、cv2、numpy、PIL 等都随之加载），
+而是在第一次创建某个后端的 agent 时才 import 对应模块，并记录每个模块的导入耗时；
+--help、参数错误、续跑时的启动都不再为用不到的后端付出导入代价。
+
+新增后端：在 BACKENDS 中加一行，或在运行时调用 register()。
+截图传输配置（action_parser_tool.TRANSPORT_PROFILES）按后端给默认值，main_task / bench_run 的 --transport 可覆盖；
+默认均为 lossless（PNG 原图），改成有损配置会影响模型看到的画面，需先用 bench_transport.py 与评测结果确认。
+"""
+
+import importlib
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Backend:
+    prefix: str                       # model_name 以此开头即选用该后端
+    module: str                       # wrapper 所在模块
+    wrapper: str                      # wrapper 类名，以 transport= 构造
+    agent_module: str = "utils.agent" # agent 所在模块，使用其中的 base_agent
+    transport: str = "lossless"       # 默认截图传输配置，见 action_parser_tool.TRANSPORT_PROFILES
+
+
+# 按顺序匹配前缀，较长的前缀须排在它的前缀之前（uitars_1_5 在 uitars 之前）
+BACKENDS: List[Backend] = [
+    Backend("uitars_1_5", "llm_core.llm_core_uitars_1_5", "uitars1_5_Wrapper", transport="lossless"),
+    Backend("uitars", "llm_core.llm_core_uitars", "uitars_Wrapper", transport="lossless"),
+    Backend("gpt4o", "llm_core.llm_core_gpt4o", "GPT4oWrapper", transport="lossless"),
+    Backend("cogagent", "llm_core.llm_core_cogagent", "cogagent_Wrapper", transport="lossless"),
+    Backend("os_altas", "llm_core.llm_core_os_altas", "os_altas_Wrapper", transport="lossless"),
+    Backend("qwen2.5vl", "llm_core.llm_core_qwen2_5vl", "qwen2_5vl_Wrapper", transport="lossless"),
+    Backend("qwen2vl", "llm_core.llm_core_qwen2vl", "qwen2vl_Wrapper", transport="lossless"),
+    Backend("uground", "llm_core.llm_core_uground_vl", "uground_Wrapper", transport="lossless"),
+    Backend("deepseek", "llm_core.llm_core_deepseek_vl2", "deepseek_vl2_Wrapper", transport="lossless"),
+    Backend("intern", "llm_core.llm_core_intern_vl2", "intern_vl2_Wrapper", transport="lossless"),
+    Backend("React_gpt4o", "llm_core.llm_core_gpt4o", "GPT4oWrapper", "utils.agent_React", transport="lossless"),
+    Backend("React_deepseek", "llm_core.llm_core_deepseek_vl2", "deepseek_vl2_Wrapper", "utils.agent_React", transport="lossless"),
+    Backend("React_uitars_1_5", "llm_core.llm_core_uitars_1_5", "uitars1_5_Wrapper", "utils.agent_React", transport="lossless"),
+]
+
+# 模块名 -> 首次导入耗时（秒），不包括已被先导入的模块分摊掉的公共依赖
+IMPORT_TIMES: Dict[str, float] = {}
+_import_lock = threading.Lock()
+
+
+def register(prefix: str, module: str, wrapper: str, agent_module: str = "utils.agent",
+             transport: str = "lossless"):
+    """注册一个后端；前缀与已有后端冲突时新注册的优先。"""
+    BACKENDS.insert(0, Backend(prefix, module, wrapper, agent_module, transport))
+
+
+def names() -> List[str]:
+    return [backend.prefix for backend in BACKENDS]
+
+
+def resolve(model_name: str) -> Backend:
+    for backend in BACKENDS:
+        if model_name.startswith(backend.prefix):
+            return backend
+    raise ValueError(f"unknown model_name {model_name!r}, expected one of: {', '.join(names())}")
+
+
+def _import(module_name: str):
+    # 多个设备 worker 同时创建 agent：串行导入，耗时只记录一次
+    with _import_lock:
+        if module_name in IMPORT_TIMES:
+            return importlib.import_module(module_name)
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        IMPORT_TIMES[module_name] = time.perf_counter() - start
+        print(f"[Backend] import {module_name}: {IMPORT_TIMES[module_name] * 1000:.0f}ms")
+        return module
+
+
+def load(model_name: str) -> Tuple[Any, Any]:
+    """返回 (agent 类, wrapper 类)，只导入该后端需要的模块。"""
+    backend = resolve(model_name)
+    agent_cls = _import(backend.agent_module).base_agent
+    wrapper_cls = getattr(_import(backend.module), backend.wrapper)
+    return agent_cls, wrapper_cls
+
+
+def transport_for(model_name: str, override: Optional[str] = None) -> str:
+    """该后端使用的截图传输配置名：override（--transport）优先，否则为后端默认值；配置名不存在时抛 ValueError。"""
+    name = override or resolve(model_name).transport
+    from utils.action_parser_tool import TRANSPORT_PROFILES
+    if name not in TRANSPORT_PROFILES:
+        raise ValueError(f"unknown transport {name!r}, expected one of: {', '.join(TRANSPORT_PROFILES)}")
+    return name
+
+
+def create_agent(model_name: str, device, transport: Optional[str] = None, **agent_kwargs):
+    agent_cls, wrapper_cls = load(model_name)
+    return agent_cls(device, wrapper_cls(transport=transport_for(model_name, transport)), **agent_kwargs)
+
+
+def import_times() -> Dict[str, float]:
+    with _import_lock:
+        return {name: round(cost, 3) for name, cost in IMPORT_TIMES.items()}
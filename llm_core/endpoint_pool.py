@@ -0,0 +1,253 @@
+"""
+模型服务的多副本负载均衡与故障转移。
+
+每个模型（按 wrapper 的 family 名，如 "uitars_1_5"）可以配置多个 vLLM 副本：
+- 选择在途请求数最少的健康副本（least outstanding requests）
+- 连续失败 eject_after 次的副本被摘除，冷却 readmit_after 秒后经健康检查（/v1/models）重新加入
+- 请求遇到可重试错误时立即换到另一个副本，对轨迹透明
+
+配置文件为 JSON，路径取环境变量 MOBILEBENCH_ENDPOINTS，缺省为仓库根目录下的 endpoints.json：
+    {
+        "uitars_1_5": ["10.221.105.108:42302", "10.221.105.109:42302"],
+        "qwen2_5vl": {"endpoints": ["10.221.105.108:42303", "10.221.105.110:42303"], "eject_after": 2}
+    }
+未配置的模型仍使用 wrapper 中写死的单个地址。
+"""
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional
+
+from llm_core import llm_client
+from llm_core.llm_client import LLMRequestError, OpenAI_Client
+
+CONFIG_ENV = "MOBILEBENCH_ENDPOINTS"
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "endpoints.json")
+
+
+@dataclass
+class PoolConfig:
+    endpoints: List[str]
+    eject_after: int = 3            # 连续失败多少次后摘除
+    readmit_after: float = 30.0     # 摘除后多久开始健康检查
+    health_interval: float = 10.0   # 健康检查线程的轮询间隔
+    probe_timeout: float = 5.0
+
+
+@dataclass(eq=False)
+class Endpoint:
+    address: str
+    base_url: str
+    client: object = field(repr=False, default=None)
+    outstanding: int = 0
+    served: int = 0
+    failures: int = 0               # 连续失败次数
+    ejected_until: Optional[float] = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.ejected_until is None
+
+
+def _split_address(address: str):
+    host, _, port = address.rpartition(":")
+    return host, int(port)
+
+
+def load_pool_configs(path: Optional[str] = None) -> Dict[str, PoolConfig]:
+    path = path or os.environ.get(CONFIG_ENV, DEFAULT_CONFIG_PATH)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    configs = {}
+    for name, value in raw.items():
+        if isinstance(value, list):
+            value = {"endpoints": value}
+        configs[name] = PoolConfig(**value)
+    return configs
+
+
+class EndpointPool:
+    """同一模型的一组副本；被该模型的所有 wrapper / 设备线程共享。"""
+
+    def __init__(self, name: str, pool_config: PoolConfig, api_key: str = "123456",
+                 config: llm_client.ClientConfig = llm_client.DEFAULT_CONFIG):
+        self.name = name
+        self.pool_config = pool_config
+        self.config = config
+        self._lock = threading.Lock()
+        self.endpoints: List[Endpoint] = []
+        for address in pool_config.endpoints:
+            host, port = _split_address(address)
+            base_url = f"http://{host}:{port}/v1"
+            self.endpoints.append(Endpoint(address, base_url, llm_client.get_openai_client(base_url, api_key, config)))
+        self.model = self._discover_model()
+        self._stop = threading.Event()
+        self._health_thread = threading.Thread(target=self._health_loop, name=f"pool-health-{name}", daemon=True)
+        self._health_thread.start()
+
+    def _discover_model(self) -> str:
+        """取第一个可达副本上的模型名；不可达的副本直接进入摘除状态。"""
+        error = None
+        for endpoint in self.endpoints:
+            try:
+                return llm_client.discover_model(endpoint.client, endpoint.base_url)
+            except Exception as e:
+                error = e
+                self._eject(endpoint, reason=f"{type(e).__name__}: {e}")
+        raise LLMRequestError(f"[Pool] {self.name}: 所有副本均不可达: {error}") from error
+
+    # ---------- 调度 ----------
+
+    def acquire(self, exclude=()) -> Optional[Endpoint]:
+        """选出在途请求最少的健康副本；没有健康副本时退而选择最早到期的被摘除副本。"""
+        with self._lock:
+            candidates = [e for e in self.endpoints if e.healthy and e not in exclude]
+            if not candidates:
+                candidates = sorted((e for e in self.endpoints if e not in exclude),
+                                    key=lambda e: e.ejected_until)[:1]
+            if not candidates:
+                return None
+            endpoint = min(candidates, key=lambda e: (e.outstanding, e.served))
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, ok: bool):
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.served += 1
+            if ok:
+                endpoint.failures = 0
+                if not endpoint.healthy:
+                    endpoint.ejected_until = None
+                    print(f"[Pool] {self.name}: {endpoint.address} 请求成功，重新加入")
+                return
+            endpoint.failures += 1
+            if endpoint.healthy and endpoint.failures >= self.pool_config.eject_after:
+                self._eject(endpoint, reason=f"连续失败 {endpoint.failures} 次")
+
+    def _eject(self, endpoint: Endpoint, reason: str):
+        endpoint.ejected_until = time.monotonic() + self.pool_config.readmit_after
+        print(f"[Pool] {self.name}: 摘除 {endpoint.address}（{reason}），{self.pool_config.readmit_after:.0f}s 后重新检查")
+
+    # ---------- 健康检查 ----------
+
+    def probe(self, endpoint: Endpoint) -> bool:
+        try:
+            endpoint.client.with_options(timeout=self.pool_config.probe_timeout).models.list()
+            return True
+        except Exception:
+            return False
+
+    def _health_loop(self):
+        while not self._stop.wait(self.pool_config.health_interval):
+            now = time.monotonic()
+            with self._lock:
+                due = [e for e in self.endpoints if not e.healthy and e.ejected_until <= now]
+            for endpoint in due:
+                ok = self.probe(endpoint)
+                with self._lock:
+                    if endpoint.healthy:
+                        continue
+                    if ok:
+                        endpoint.failures = 0
+                        endpoint.ejected_until = None
+                        print(f"[Pool] {self.name}: {endpoint.address} 健康检查通过，重新加入")
+                    else:
+                        endpoint.ejected_until = time.monotonic() + self.pool_config.readmit_after
+
+    def close(self):
+        self._stop.set()
+
+    def summary(self) -> Dict[str, Dict[str, object]]:
+        with self._lock:
+            return {e.address: {"healthy": e.healthy, "outstanding": e.outstanding,
+                                "served": e.served, "failures": e.failures}
+                    for e in self.endpoints}
+
+
+class PooledOpenAI_Client:
+    """与 OpenAI_Client 同接口，请求在副本间负载均衡，可重试错误时切换副本。"""
+
+    def __init__(self, pool: EndpointPool):
+        self.pool = pool
+        self.model = pool.model
+        self.base_url = pool.name
+        # 单个副本上不重试，失败立即换下一个；所有副本都失败后再整体退避
+        self._single_shot = replace(pool.config, max_retries=0)
+
+    def call(self, messages, temparature=0.0, top_p=None, max_tokens=512):
+        params = {"max_tokens": max_tokens, "temperature": temparature}
+        if top_p is not None:
+            params["top_p"] = top_p
+        config = self.pool.config
+        tried: List[Endpoint] = []
+        attempt = 0
+        while True:
+            endpoint = self.pool.acquire(exclude=tried)
+            if endpoint is None:
+                if attempt >= config.max_retries:
+                    raise error
+                delay = llm_client.backoff_delay(attempt, config, error.__cause__)
+                print(f"[Pool] {self.pool.name}: 所有副本均失败，{delay:.1f}s 后重试 ({attempt + 1}/{config.max_retries})")
+                time.sleep(delay)
+                attempt += 1
+                tried = []
+                continue
+            try:
+                content = llm_client.request_with_retry(endpoint.client.chat.completions.create, endpoint.base_url,
+                                                        self.model, messages, self._single_shot, **params)
+            except LLMRequestError as e:
+                retryable = isinstance(e.__cause__, llm_client.RETRYABLE_ERRORS)
+                self.pool.release(endpoint, ok=not retryable)
+                if not retryable:
+                    raise
+                error = e
+                tried.append(endpoint)
+                continue
+            self.pool.release(endpoint, ok=True)
+            return content
+
+
+_pools: Dict[str, EndpointPool] = {}
+_pools_lock = threading.Lock()
+_configs: Optional[Dict[str, PoolConfig]] = None
+
+
+def get_pool(name: str, pool_config: PoolConfig, api_key: str = "123456",
+             config: llm_client.ClientConfig = llm_client.DEFAULT_CONFIG) -> EndpointPool:
+    """同一模型名在进程内只建一个池，在途计数才能在所有设备线程间共享。"""
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = EndpointPool(name, pool_config, api_key, config)
+        return pool
+
+
+def pool_stats() -> Dict[str, Dict[str, Dict[str, object]]]:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.name: pool.summary() for pool in pools}
+
+
+def make_client(name: str, ip: str, port: int, api_key: str = "123456",
+                config: Optional[llm_client.ClientConfig] = None):
+    """
+    wrapper 的客户端工厂：配置文件中 name 有多个副本时返回 PooledOpenAI_Client，
+    否则返回指向（配置的或默认的）单个地址的 OpenAI_Client。
+    """
+    global _configs
+    with _pools_lock:
+        if _configs is None:
+            _configs = load_pool_configs()
+        pool_config = _configs.get(name)
+    if pool_config is None:
+        return OpenAI_Client(ip, port=port, api_key=api_key, config=config)
+    if len(pool_config.endpoints) == 1:
+        host, port = _split_address(pool_config.endpoints[0])
+        return OpenAI_Client(host, port=port, api_key=api_key, config=config)
+    return PooledOpenAI_Client(get_pool(name, pool_config, api_key, config or llm_client.DEFAULT_CONFIG))
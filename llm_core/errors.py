@@ -0,0 +1,5 @@
+"""llm_core 的异常类型。不依赖 openai，main_task 等可以在不加载任何后端的情况下引用。"""
+
+
+class LLMRequestError(RuntimeError):
+    """模型请求在重试后仍然失败（或遇到不可重试的错误）。"""
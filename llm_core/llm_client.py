@@ -0,0 +1,233 @@
+"""
+所有 llm_core wrapper 共用的 OpenAI 兼容客户端。
+
+- 同一 endpoint 的 wrapper / 线程共享一个 OpenAI 客户端（及 SDK 内部的连接池）
+- 可配置的超时；429 / 5xx / 连接错误按指数退避 + 抖动重试
+- 模型列表（models.list）每个 endpoint 只查询一次
+- 记录每次请求的延迟、token 用量、payload 大小，见 request_stats()
+- 重试耗尽后抛出 LLMRequestError，而不是静默返回 None
+"""
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import openai
+from openai import AzureOpenAI, OpenAI
+
+from llm_core.errors import LLMRequestError
+
+
+@dataclass
+class ClientConfig:
+    timeout: float = 120.0          # 单次请求超时（秒）
+    max_retries: int = 4            # 429 / 5xx / 连接错误的最大重试次数
+    backoff_base: float = 1.0       # 第 n 次重试等待 ~ backoff_base * 2**n 秒（带抖动）
+    backoff_max: float = 30.0
+
+
+DEFAULT_CONFIG = ClientConfig()
+
+# 可重试的错误：限流、服务端 5xx、连接失败、超时
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,      # APITimeoutError 是其子类
+)
+
+_lock = threading.Lock()
+_clients: Dict[tuple, Any] = {}
+_models: Dict[str, str] = {}
+
+
+def get_openai_client(base_url: str, api_key: str, config: ClientConfig = DEFAULT_CONFIG) -> OpenAI:
+    """同一 (base_url, api_key) 复用同一个 OpenAI 客户端及其连接池。"""
+    key = ("openai", base_url, api_key)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # 重试由本模块统一处理，关闭 SDK 自带的重试
+            client = _clients[key] = OpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                                            timeout=config.timeout)
+        return client
+
+
+def get_azure_client(azure_endpoint: str, api_key: str, api_version: str,
+                     config: ClientConfig = DEFAULT_CONFIG) -> AzureOpenAI:
+    key = ("azure", azure_endpoint, api_key, api_version)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = AzureOpenAI(api_key=api_key, azure_endpoint=azure_endpoint,
+                                                 api_version=api_version, max_retries=0,
+                                                 timeout=config.timeout)
+        return client
+
+
+def discover_model(client: OpenAI, base_url: str) -> str:
+    """返回 endpoint 上的第一个模型 id；每个 endpoint 只查询一次。"""
+    with _lock:
+        model = _models.get(base_url)
+    if model is None:
+        model = client.models.list().data[0].id
+        with _lock:
+            _models.setdefault(base_url, model)
+    return model
+
+
+# ---------- 请求统计 ----------
+
+class RequestStats:
+    """记录每次请求的延迟 / token / payload，线程安全。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records: List[Dict[str, Any]] = []
+
+    def record(self, **fields):
+        with self._lock:
+            self.records.append(fields)
+
+    def clear(self):
+        with self._lock:
+            self.records = []
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """按 endpoint 汇总：请求数、失败数、重试数、延迟 p50/p95、token、payload。"""
+        with self._lock:
+            records = list(self.records)
+        result: Dict[str, Dict[str, float]] = {}
+        for endpoint in sorted({r["endpoint"] for r in records}):
+            rs = [r for r in records if r["endpoint"] == endpoint]
+            latencies = sorted(r["latency"] for r in rs if r["ok"])
+
+            def pct(p):
+                return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+            result[endpoint] = {
+                "requests": len(rs),
+                "failed": sum(not r["ok"] for r in rs),
+                "retries": sum(r["attempts"] - 1 for r in rs),
+                "latency_p50": round(pct(0.50), 3),
+                "latency_p95": round(pct(0.95), 3),
+                "prompt_tokens": sum(r["prompt_tokens"] for r in rs),
+                "completion_tokens": sum(r["completion_tokens"] for r in rs),
+                "payload_mb": round(sum(r["payload_bytes"] for r in rs) / 1e6, 2),
+            }
+        return result
+
+
+REQUEST_STATS = RequestStats()
+
+
+def request_stats() -> Dict[str, Dict[str, float]]:
+    return REQUEST_STATS.summary()
+
+
+def payload_bytes(obj) -> int:
+    """估算请求体大小（字符串长度之和），避免为统计再序列化一遍几 MB 的 base64 图片。"""
+    if isinstance(obj, str):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(len(k) + payload_bytes(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sum(payload_bytes(v) for v in obj)
+    return 8
+
+
+def _retry_after(error) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, config: ClientConfig, error=None) -> float:
+    """指数退避 + 抖动；服务端给了 Retry-After 时以其为下限。"""
+    delay = min(config.backoff_max, config.backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+    retry_after = _retry_after(error) if error is not None else None
+    return max(delay, retry_after) if retry_after else delay
+
+
+def request_with_retry(create: Callable[..., Any], endpoint: str, model: str, messages,
+                       config: ClientConfig = DEFAULT_CONFIG, **params) -> str:
+    """
+    调用 chat.completions.create 并返回文本内容。
+    可重试错误按退避重试，重试耗尽或遇到 4xx 等不可重试错误时抛出 LLMRequestError。
+    """
+    size = payload_bytes(messages)
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        try:
+            result = create(model=model, messages=messages, **params)
+            content = result.choices[0].message.content
+            usage = getattr(result, "usage", None)
+            REQUEST_STATS.record(
+                endpoint=endpoint, model=model, ok=True, attempts=attempt + 1,
+                latency=time.perf_counter() - start, payload_bytes=size,
+                prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+                completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+            )
+            if content is None:
+                raise LLMRequestError(f"[LLM] {endpoint} 返回空内容")
+            return content
+        except RETRYABLE_ERRORS as e:
+            if attempt >= config.max_retries:
+                error = e
+                break
+            delay = backoff_delay(attempt, config, e)
+            print(f"[LLM] {endpoint} {type(e).__name__}，{delay:.1f}s 后重试 ({attempt + 1}/{config.max_retries})")
+            time.sleep(delay)
+            attempt += 1
+        except openai.APIError as e:
+            # 鉴权失败、请求格式错误等，重试无意义
+            error = e
+            break
+
+    REQUEST_STATS.record(
+        endpoint=endpoint, model=model, ok=False, attempts=attempt + 1,
+        latency=time.perf_counter() - start, payload_bytes=size, prompt_tokens=0, completion_tokens=0,
+    )
+    raise LLMRequestError(f"[LLM] {endpoint} 请求失败（{attempt + 1} 次尝试）: {type(error).__name__}: {error}") from error
+
+
+class OpenAI_Client:
+    """vLLM 等 OpenAI 兼容服务的客户端，各 llm_core_*.py 共用。"""
+
+    def __init__(self, ip, port=8000, api_key="123456", config: Optional[ClientConfig] = None):
+        self.base_url = f"http://{ip}:{port}/v1"
+        self.config = config or DEFAULT_CONFIG
+        print(self.base_url)
+        self.client = get_openai_client(self.base_url, api_key, self.config)
+        self.model = discover_model(self.client, self.base_url)
+        print(f"opai:{self.model}")
+
+    def call(self, messages, temparature=0.0, top_p=None, max_tokens=512):
+        params = {"max_tokens": max_tokens, "temperature": temparature}
+        if top_p is not None:
+            params["top_p"] = top_p
+        return request_with_retry(self.client.chat.completions.create, self.base_url, self.model,
+                                  messages, self.config, **params)
+
+
+class Azure_Openai_Client:
+    """Azure OpenAI 客户端，接口与原 llm_core_gpt4o.Azure_Openai_Client 一致。"""
+
+    def __init__(self, model, api_key, azure_endpoint, api_version, temperature, max_tokens,
+                 config: Optional[ClientConfig] = None):
+        self.config = config or DEFAULT_CONFIG
+        self.client = get_azure_client(azure_endpoint, api_key, api_version, self.config)
+        self.endpoint = azure_endpoint
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.model = model
+
+    def call(self, messages):
+        return request_with_retry(self.client.chat.completions.create, self.endpoint, self.model,
+                                  messages, self.config, temperature=self.temperature,
+                                  max_tokens=self.max_tokens)
@@ -1,5 +1,3 @@
-from openai import AzureOpenAI
-import openai
 import time
 from typing import List, Dict, Any, Optional, Tuple ,Union
 import re
@@ -9,6 +7,9 @@ from io import BytesIO
 from utils import representation_utils 
 from utils import m3a_utils
 from utils import action_parser_tool
+from utils import action_grammar
+from utils import timing
+from llm_core.llm_client import Azure_Openai_Client
 from utils import xml_screen_parser_tool
 import numpy as np
 
@@ -160,58 +161,11 @@ SUMMARY_PROMPT_TEMPLATE = (
 )
     
 
-class Azure_Openai_Client:
-    def __init__(self,model,api_key,azure_endpoint,api_version,temperature,max_tokens):
-        self.client = AzureOpenAI(
-            api_key=api_key,
-            azure_endpoint=azure_endpoint,
-            api_version=api_version
-        )
-        self.temperature = temperature
-        self.max_tokens = max_tokens
-        self.model = model
-    def call(self,messages):
-        trial = 0
-        while trial < 3:
-            trial += 1
-            try:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=self.temperature,
-                    max_tokens=self.max_tokens,
-                )
-                result = response.choices[0].message.content
-                return result
-            except openai.AuthenticationError as e:
-                print(f"OpenAI API returned an Authentication Error: {e}")
-            except openai.APIConnectionError as e:
-                # Handle connection error here
-                print(f"Failed to connect to OpenAI API: {e}")
-            except openai.BadRequestError as e:
-                 # Handle connection error here
-                 print(f"Invalid Request Error: {e}")
-            except openai.RateLimitError as e:
-                 # Handle rate limit error
-                 print(f"OpenAI API request exceeded rate limit: {e}")
-                 # 等待50s
-                 print("等待 50s...")
-                 time.sleep(50)
-            except openai.InternalServerError as e:
-                 # Handle Service Unavailable error
-                 print(f"Service Unavailable: {e}")
-            except openai.APITimeoutError as e:
-                 # Handle request timeout
-                 print(f"Request timed out: {e}")
-            except openai.APIError as e:
-                 # Handle API error here, e.g. retry or log
-                 print(f"OpenAI API returned an API Error: {e}")
-            except:
-                 # Handles all other exceptions
-                 print("An exception has occured.")
-        return result
-    
 class gpt4o_message_handler(object):
+    def __init__(self, transport=None):
+        # 图片传输配置（格式 / 质量 / 像素预算），见 action_parser_tool.TRANSPORT_PROFILES
+        self.transport = action_parser_tool.get_transport(transport)
+
     def process_message(
         self,
         task: str,
@@ -261,7 +215,7 @@ class gpt4o_message_handler(object):
                         "content": [
                             {
                                 "type": "image_url",
-                                "image_url": {"url": action_parser_tool.image_to_uri(shot)},
+                                "image_url": {"url": action_parser_tool.image_to_uri(shot, transport=self.transport)},
                             },
                         ],
                     }
@@ -279,7 +233,7 @@ class gpt4o_message_handler(object):
                 "content": [
                     {
                         "type": "image_url",
-                        "image_url": {"url": action_parser_tool.image_to_uri(image_path)},
+                        "image_url": {"url": action_parser_tool.image_to_uri(image_path, transport=self.transport)},
                     }
                 ],
             }
@@ -299,17 +253,9 @@ class gpt4o_message_handler(object):
             before_ui_elements,
             (1080,2400),
         )
-        before_pixels = np.asarray(Image.open(image_path)).copy()
-        for index, ui_element in enumerate(before_ui_elements):
-          if m3a_utils.validate_ui_element(ui_element, (1080,2400)):
-            m3a_utils.add_ui_element_mark(
-                before_pixels,
-                ui_element,
-                index,
-                (1080,2400),
-                (0,0,1080,2400),
-                0, 
-            )
+        before_pixels = m3a_utils.render_som(
+            image_path, before_ui_elements, (1080,2400), (0,0,1080,2400), 0
+        )
 
 
         save_path = f"{step_prefix}_som.png"
@@ -357,7 +303,7 @@ class gpt4o_message_handler(object):
                         "content": [
                             {
                                 "type": "image_url",
-                                "image_url": {"url": action_parser_tool.image_to_uri(shot)},
+                                "image_url": {"url": action_parser_tool.image_to_uri(shot, transport=self.transport)},
                             },
                         ],
                     }
@@ -375,7 +321,7 @@ class gpt4o_message_handler(object):
                 "content": [
                     {
                         "type": "image_url",
-                        "image_url": {"url": action_parser_tool.image_to_uri(image_path)},
+                        "image_url": {"url": action_parser_tool.image_to_uri(image_path, transport=self.transport)},
                     }
                 ],
             }
@@ -386,7 +332,7 @@ class gpt4o_message_handler(object):
                 "content": [
                     {
                         "type": "image_url",
-                        "image_url": {"url": action_parser_tool.image_to_uri(save_path)},
+                        "image_url": {"url": action_parser_tool.image_to_uri(save_path, transport=self.transport)},
                     }
                 ],
             }
@@ -397,8 +343,6 @@ class gpt4o_message_handler(object):
 
 
         before_path = history["history_image_path"][-1]
-        before_image = Image.open(before_path)
-        before_pixels = np.asarray(before_image).copy()
         before_xml_string = history["history_xml_string"][-1]
         reason = history["history_response"][-1]
         action = history["history_action"][-1]
@@ -412,26 +356,13 @@ class gpt4o_message_handler(object):
         after_ui_elements_list = xml_screen_parser_tool._generate_ui_elements_description_list(
             after_ui_elements, (1080,2400)
         )
-        for index, ui_element in enumerate(before_ui_elements):
-          if m3a_utils.validate_ui_element(ui_element, (1080,2400)):
-            m3a_utils.add_ui_element_mark(
-                before_pixels,
-                ui_element,
-                index,
-                (1080,2400),
-                (0,0,1080,2400),
-                0, 
-            )
-        for index, ui_element in enumerate(after_ui_elements):
-          if m3a_utils.validate_ui_element(ui_element, (1080,2400)):
-            m3a_utils.add_ui_element_mark(
-                after_pixels,
-                ui_element,
-                index,
-                (1080,2400),
-                (0,0,1080,2400),
-                0, 
-            )
+        # 标注结果按截图缓存，before 图通常在上一步的 SoM 提示中已经渲染过
+        before_pixels = m3a_utils.render_som(
+            before_path, before_ui_elements, (1080,2400), (0,0,1080,2400), 0
+        ).copy()
+        after_pixels = m3a_utils.render_som(
+            after_pixels, after_ui_elements, (1080,2400), (0,0,1080,2400), 0
+        ).copy()
         m3a_utils.add_screenshot_label(before_pixels, 'before')
         m3a_utils.add_screenshot_label(after_pixels, 'after')
         summary_prompt = SUMMARY_PROMPT_TEMPLATE.format(
@@ -458,7 +389,7 @@ class gpt4o_message_handler(object):
                 "content": [
                     {
                         "type": "image_url",
-                        "image_url": {"url": action_parser_tool.image_to_uri(before_pixels)},
+                        "image_url": {"url": action_parser_tool.image_to_uri(before_pixels, transport=self.transport)},
                     }
                 ],
             }
@@ -469,7 +400,7 @@ class gpt4o_message_handler(object):
                 "content": [
                     {
                         "type": "image_url",
-                        "image_url": {"url": action_parser_tool.image_to_uri(after_pixels)},
+                        "image_url": {"url": action_parser_tool.image_to_uri(after_pixels, transport=self.transport)},
                     }
                 ],
             }
@@ -477,96 +408,9 @@ class gpt4o_message_handler(object):
         return messages
 
     def process_response(self, content, width, height):
-        result = action_parser_tool.parse_agent_output(content)
-        extracted_action = result["action"]
-        try:
-            if "click" in extracted_action:
-                x,y = action_parser_tool.extract_xy_from_point(extracted_action)
-                normalized_params = {
-                    "position": [round(x / width, 2), round(y / height, 2)],
-                    "click_times":1
-                }
-                params = {
-                    "position":[x, y],
-                    "click_times":1
-                }
-                result.update({
-                    "action": "click",
-                    "params": params,
-                    "normalized_params": normalized_params
-                })
-            elif "type" in extracted_action:
-                text = re.search(r"content='(.*?)'", extracted_action).group(1)
-                result.update({
-                    "action": "type",
-                    "params": {"text": text},
-                    "normalized_params": {"text": text}
-                })
-            elif "scroll" in extracted_action or "swipe "in extracted_action:
-                x1,y1,x2,y2 = action_parser_tool.extract_swipe_points(extracted_action)
-                normalized_params = {
-                    "start_position": [round(x1 / width ,2), round(y1 / height,2)],
-                    "end_position": [round(x2 / width ,2), round(y2 / height,2)],
-                    "press_duration": -1
-                }
-                params = {
-                    "start_position": [int(x1), int(y1)],
-                    "end_position": [int(x2), int(y2)],
-                    "press_duration": -1
-                }
-                result.update({
-                    "action": "swipe",
-                    "params": params,
-                    "normalized_params": normalized_params
-                })
-            elif "navigate_back" in extracted_action or "press_back" in extracted_action:
-                result.update({
-                    "action": "back",
-                    "params": {},
-                    "normalized_params": {}
-                })
-            elif "navigate_home" in extracted_action or "press_home" in extracted_action:
-                result.update({
-                    "action": "home",
-                    "params": {},
-                    "normalized_params": {}
-                })
-            elif "wait" in extracted_action.lower():
-                result.update({
-                    "action": "wait",
-                    "params": {},
-                    "normalized_params": {}
-                })
-            elif "finished" in extracted_action:
-                try:
-                    text = re.search(r"content='(.*?)'", extracted_action).group(1)
-                except:
-                    text = ""
-                result.update({
-                    "action": "terminate",
-                    "params": {"text": text},
-                    "normalized_params": {"text": text}
-                })
-            elif "open" in extracted_action.lower():
-                try:
-                    text = re.search(r"content='(.*?)'", extracted_action).group(1)
-                except:
-                    text = ""
-                result.update({
-                    "action": "open",
-                    "params": {"app_name": text},
-                    "normalized_params": {"app_name": text},
-                })
-            else:
-                raise ValueError(f"Invalid action: {extracted_action}")
-        except:
-            result.update({
-                "action": "invalid",
-                "params": {},
-                "normalized_params": {}               
-            })
-        return result
-    
+        return action_grammar.parse_to_result("gpt4o", content, width, height)
+
+
 class GPT4oWrapper():
   """OpenAI GPT4 wrapper.
 
@@ -585,6 +429,7 @@ class GPT4oWrapper():
       max_retry: int = 2,
       temperature: float = 0.0,
       max_length: int = 256,
+      transport=None,
   ):
 
     if max_retry <= 0:
@@ -599,7 +444,7 @@ class GPT4oWrapper():
     azure_endpoint = "https://ui-agent-exp.openai.azure.com/"
     api_version="2025-01-01-preview"
     self.client=Azure_Openai_Client(model,api_key,azure_endpoint,api_version,temperature,max_tokens=max_tokens)
-    self.message_handler = gpt4o_message_handler()
+    self.message_handler = gpt4o_message_handler(transport)
 
   def predict_mm_som(self, goal, current_image_path, current_xml_string,history,step_prefix):
 
@@ -610,9 +455,12 @@ class GPT4oWrapper():
 
   def predict_mm(self, goal, current_image_path,history):
 
-    req_messages = self.message_handler.process_message(goal,current_image_path,history)
-    response = self.client.call(req_messages)
-    output = self.message_handler.process_response(response,1080,2400)
+    with timing.phase("request_build"):
+      req_messages = self.message_handler.process_message(goal,current_image_path,history)
+    with timing.phase("inference"):
+      response = self.client.call(req_messages)
+    with timing.phase("parse"):
+      output = self.message_handler.process_response(response,1080,2400)
     return response, output
   
   def summarize(self,history,after_pixels,after_xml_string,goal):
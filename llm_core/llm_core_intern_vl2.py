@@ -1,4 +1,3 @@
-from openai import OpenAI
 from typing import List, Dict, Any, Optional, Tuple ,Union
 import re
 import base64, math, requests
@@ -7,6 +6,9 @@ from io import BytesIO
 from utils import representation_utils 
 from utils import m3a_utils
 from utils import action_parser_tool
+from utils import action_grammar
+from utils import timing
+from llm_core.endpoint_pool import make_client
 from utils import xml_screen_parser_tool
 import numpy as np
 PROMPT_PREFIX = (
@@ -114,42 +116,12 @@ ACTION_SELECTION_PROMPT_TEMPLATE = (
 )
 
 
-class OpenAI_Client:
-    def __init__(self, ip, port=8000, api_key="123456"):
-        print(f"http://{ip}:{port}/v1")
-        openai_api_key = api_key
-        openai_api_base = f"http://{ip}:{port}/v1"
-        self.client = OpenAI(
-            api_key=openai_api_key,
-            base_url=openai_api_base,
-        )
-
-        models = self.client.models.list()
-        self.model = models.data[0].id
-        print(f"opai:{self.model}")
-
-    def call(self, messages, temparature, top_p, max_tokens):
-        try:
-            if top_p is not None:
-                result = self.client.chat.completions.create(
-                    messages=messages,
-                    model=self.model,
-                    max_tokens=max_tokens,
-                    temperature=temparature,
-                    top_p=top_p,
-                )
-            else:
-                result = self.client.chat.completions.create(
-                    messages=messages,
-                    model=self.model,
-                    max_tokens=max_tokens,
-                    temperature=temparature
-                )
-            return result.choices[0].message.content
-        except Exception as e:
-            print(e)
 
 class intern_vl2_message_handler(object):
+    def __init__(self, transport=None):
+        # 图片传输配置（格式 / 质量 / 像素预算），见 action_parser_tool.TRANSPORT_PROFILES
+        self.transport = action_parser_tool.get_transport(transport)
+
  
     def process_message(
         self,
@@ -182,7 +154,7 @@ class intern_vl2_message_handler(object):
                 "content": [
                     {
                         "type": "image_url",
-                        "image_url": {"url": action_parser_tool.image_to_uri(image_path)},
+                        "image_url": {"url": action_parser_tool.image_to_uri(image_path, transport=self.transport)},
                     }
                 ],
             }
@@ -190,96 +162,7 @@ class intern_vl2_message_handler(object):
         return messages
 
     def process_response(self, content, width, height):
-        result = action_parser_tool.parse_agent_output(content)
-        extracted_action = result["action"]
-        try:
-            if "click" in extracted_action:
-                x,y = action_parser_tool.extract_xy_from_point(extracted_action)
-                params = {
-                    "position":[int(x * width / 1000), int(y * height / 1000)],
-                    "click_times":1
-                }
-                normalized_params = {
-                    "position":[round(x/1000,2),round(y/1000,2)],
-                    "click_times":1
-                }
-                result.update({
-                    "action": "click",
-                    "params": params,
-                    "normalized_params": normalized_params
-                })
-            elif "type" in extracted_action:
-                text = re.search(r"content='(.*?)'", extracted_action).group(1)
-                result.update({
-                    "action": "type",
-                    "params": {"text": text},
-                    "normalized_params": {"text": text}
-                })
-            elif "scroll" in extracted_action or "swipe "in extracted_action:
-                x,y,dir = action_parser_tool.extract_swipe_point_direction(extracted_action)
-                params = {
-                    "position":[int(x/1000 * width), int(y/1000 * height)],
-                    "direction":dir
-                }
-                normalized_params = {
-                    "position":[round(x/1000,2),round(y/1000,2)],
-                    "direction":dir                    
-                }
-                result.update({
-                    "action": "scroll",
-                    "params": params,
-                    "normalized_params": normalized_params
-                })
-            elif "navigate_back" in extracted_action or "press_back" in extracted_action:
-                result.update({
-                    "action": "back",
-                    "params": {},
-                    "normalized_params": {}
-                })
-            elif "navigate_home" in extracted_action or "press_home" in extracted_action:
-                result.update({
-                    "action": "home",
-                    "params": {},
-                    "normalized_params": {}
-                })
-            elif "wait" in extracted_action.lower():
-                result.update({
-                    "action": "wait",
-                    "params": {},
-                    "normalized_params": {}
-                })
-            elif "finished" in extracted_action:
-                try:
-                    text = re.search(r"content='(.*?)'", extracted_action).group(1)
-                except:
-                    text = ""
-                result.update({
-                    "action": "terminate",
-                    "params": {"text": text},
-                    "normalized_params": {"text": text}
-                })
-            elif "open" in extracted_action.lower():
-                try:
-                    text = re.search(r"content='(.*?)'", extracted_action).group(1)
-                except:
-                    text = ""
-                result.update({
-                    "action": "open",
-                    "params": {"app_name": text},
-                    "normalized_params": {"app_name": text},
-                })
-            else:
-                raise ValueError(f"Invalid action: {extracted_action}")
-        except:
-            result.update({
-                "action": "invalid",
-                "params": {},
-                "normalized_params": {}               
-            })
-        return result
-
-
-    
+        return action_grammar.parse_to_result("intern_vl2", content, width, height)
 
 
 class intern_vl2_Wrapper():
@@ -292,6 +175,7 @@ class intern_vl2_Wrapper():
       max_retry: int = 2,
       temperature: float = 0.0,
       max_length: int = 256,
+      transport=None,
   ):
 
     if max_retry <= 0:
@@ -300,15 +184,18 @@ class intern_vl2_Wrapper():
     self.max_retry = min(max_retry, 5)
     self.temperature = temperature
     self.max_length=max_length
-    self.client=OpenAI_Client("10.221.105.108", port=42307)
-    self.message_handler = intern_vl2_message_handler()
+    self.client=make_client("intern_vl2", "10.221.105.108", 42307)
+    self.message_handler = intern_vl2_message_handler(transport)
 
 
 
 
   def predict_mm(self, goal, current_image_path, history):
 
-    req_messages = self.message_handler.process_message(goal,current_image_path,history)
-    response = self.client.call(req_messages, temparature=0, max_tokens=512, top_p=0.9)
-    output = self.message_handler.process_response(response,1080,2400)
+    with timing.phase("request_build"):
+      req_messages = self.message_handler.process_message(goal,current_image_path,history)
+    with timing.phase("inference"):
+      response = self.client.call(req_messages, temparature=0, max_tokens=512, top_p=0.9)
+    with timing.phase("parse"):
+      output = self.message_handler.process_response(response,1080,2400)
     return response,output
@@ -1,11 +1,13 @@
-import openai
-from openai import OpenAI
 import base64
 from typing import List, Dict, Any, Optional, Tuple
 import re
 
 import pathlib
 import mimetypes
+from utils import action_parser_tool
+from utils import action_grammar
+from utils import timing
+from llm_core.endpoint_pool import make_client
 sys_prompt = """
 You are now operating in Executable Language Grounding mode. Your goal is to help users accomplish tasks by suggesting executable actions that best fit their needs. Your skill set includes both basic and custom actions:
 
@@ -50,15 +52,17 @@ Actions: Specify the actual actions you will take based on your reasoning. You s
 Your current task instruction, action history, and associated screenshot are as follows:
 Screenshot: 
 """
-def to_data_uri(path_or_b64: str) -> str:
+def to_data_uri(path_or_b64: str, transport=None) -> str:
     """
     把本地路径或已是 dataURI 的字符串统一转成 dataURI。
+    transport 为有损 / 缩放配置时重新编码，否则直接发送原始文件字节。
     """
     if path_or_b64.startswith("data:image"):
         return path_or_b64                 # 已是 dataURI
-    mime = mimetypes.guess_type(path_or_b64)[0] or "image/png"
-    data = pathlib.Path(path_or_b64).read_bytes()
-    return f"data:{mime};base64," + base64.b64encode(data).decode()
+    transport = action_parser_tool.get_transport(transport)
+    if transport != action_parser_tool.LOSSLESS:
+        return action_parser_tool.image_to_uri(path_or_b64, transport=transport)
+    return action_parser_tool.file_to_uri(path_or_b64)
 def encode_image(image_path: str) -> str:
     """
     Encodes an image file into a base64 string.
@@ -81,42 +85,12 @@ def encode_image(image_path: str) -> str:
     except IOError as e:
         raise IOError(f"Error reading file {image_path}: {e}")
     
-class OpenAI_Client:
-    def __init__(self, ip, port=8000, api_key="123456"):
-        print(f"http://{ip}:{port}/v1")
-        openai_api_key = api_key
-        openai_api_base = f"http://{ip}:{port}/v1"
-        self.client = OpenAI(
-            api_key=openai_api_key,
-            base_url=openai_api_base,
-        )
-
-        models = self.client.models.list()
-        self.model = models.data[0].id
-        print(f"opai:{self.model}")
-
-    def call(self, messages, temparature, top_p, max_tokens):
-        try:
-            if top_p is not None:
-                result = self.client.chat.completions.create(
-                    messages=messages,
-                    model=self.model,
-                    max_tokens=max_tokens,
-                    temperature=temparature,
-                    top_p=top_p,
-                )
-            else:
-                result = self.client.chat.completions.create(
-                    messages=messages,
-                    model=self.model,
-                    max_tokens=max_tokens,
-                    temperature=temparature
-                )
-            return result.choices[0].message.content
-        except Exception as e:
-            print(e)
 
 class os_altas_message_handler(object):
+    def __init__(self, transport=None):
+        # 图片传输配置（格式 / 质量 / 像素预算），见 action_parser_tool.TRANSPORT_PROFILES
+        self.transport = action_parser_tool.get_transport(transport)
+
     
 
 
@@ -155,7 +129,7 @@ class os_altas_message_handler(object):
                         "content": [
                             {
                                 "type": "image_url",
-                                "image_url": {"url": to_data_uri(shot)},
+                                "image_url": {"url": to_data_uri(shot, self.transport)},
                             },
                         ],
                     }
@@ -174,7 +148,7 @@ class os_altas_message_handler(object):
                 "content": [
                     {
                         "type": "image_url",
-                        "image_url": {"url": to_data_uri(image_path)},
+                        "image_url": {"url": to_data_uri(image_path, self.transport)},
                     },
                     {
                         "type": "text",
@@ -189,73 +163,7 @@ class os_altas_message_handler(object):
 
 
     def process_response(self, response: str, width: int, height: int) -> Dict:
-        def _extract_action_block(resp: str) -> str:
-            m = re.search(r"actions:\s*(.+)", resp, flags=re.I | re.S)
-            return (m.group(1) if m else '').strip()
-
-        try:
-            if not response:
-                return {"action": "terminate", "params": {}, "normalized_params": {}}
-
-            s = _extract_action_block(response)
-
-            # ---------- TYPE ----------
-            m = re.match(r"TYPE\s*\[(.*?)\]", s, flags=re.I | re.S)
-            if m:
-                text = m.group(1).strip()
-                return {
-                    "action": "type",
-                    "params": {"text": text},
-                    "normalized_params": {"text": text},
-                }
-
-            # ---------- CLICK ----------
-            m = re.search(r"\[\[\s*(\d+)\s*,\s*(\d+)\s*\]\]", s)
-            if s.upper().startswith("CLICK") and m:
-                x, y = map(int, m.groups())
-                return {
-                    "action": "click",
-                    "params": {"position": [x * width // 1000, y * height // 1000], "click_times": 1},
-                    "normalized_params": {"position": [x / 1000, y / 1000], "click_times": 1},
-                }
-
-            # ---------- SCROLL_* → swipe ----------
-            m = re.match(r"SCROLL\s*\[(UP|DOWN|LEFT|RIGHT)\]", s, flags=re.I)
-            if m:
-                direction = m.group(1).upper()
-                cx, cy = 0.5, 0.5
-                offset = 0.2
-                dx = {"LEFT": -offset, "RIGHT": offset}.get(direction, 0)
-                dy = {"UP": -offset, "DOWN": offset}.get(direction, 0)
-                sx, sy = cx, cy
-                ex, ey = cx + dx, cy + dy
-                return {
-                    "action": "swipe",
-                    "params": {
-                        "start_position": [int(width * sx), int(height * sy)],
-                        "end_position":   [int(width * ex), int(height * ey)],
-                        "press_duration": -1,
-                    },
-                    "normalized_params": {
-                        "start_position": [sx, sy],
-                        "end_position":   [ex, ey],
-                        "press_duration": -1,
-                    },
-                }
-
-            if re.match(r"PRESS_BACK", s, flags=re.I):
-                return {"action": "back", "params": {}, "normalized_params": {}}
-            if re.match(r"PRESS_HOME", s, flags=re.I):
-                return {"action": "home", "params": {}, "normalized_params": {}}
-            if re.match(r"WAIT", s, flags=re.I):
-                return {"action": "wait", "params": {}, "normalized_params": {}}
-            if re.match(r"(COMPLETE|END\(\))", s, flags=re.I):
-                return {"action": "terminate", "params": {}, "normalized_params": {}}
-            return {"action": "invalid", "params": {}, "normalized_params": {}}
-
-        except Exception as e:
-            raise ValueError(f"[process_response] Failed to parse response: {repr(e)} | Raw: {response}")
-
+        return action_grammar.parse_to_result("os_altas", response, width, height)
 
 
 class os_altas_Wrapper():
@@ -268,6 +176,7 @@ class os_altas_Wrapper():
       max_retry: int = 2,
       temperature: float = 0.0,
       max_length: int = 256,
+      transport=None,
   ):
 
     if max_retry <= 0:
@@ -277,8 +186,8 @@ class os_altas_Wrapper():
     self.temperature = temperature
     self.max_length=max_length
     #self.url=url
-    self.client=OpenAI_Client("10.221.105.108", port=42309)
-    self.message_handler = os_altas_message_handler()
+    self.client=make_client("os_altas", "10.221.105.108", 42309)
+    self.message_handler = os_altas_message_handler(transport)
     self.message = []
 
 
@@ -286,7 +195,10 @@ class os_altas_Wrapper():
 
   def predict_mm(self, goal, current_image_path, history):
 
-    req_messages = self.message_handler.process_message(goal,current_image_path,history)
-    response = self.client.call(req_messages, temparature=0, max_tokens=512, top_p=0.9)
-    output = self.message_handler.process_response(response,1080,2400)
+    with timing.phase("request_build"):
+      req_messages = self.message_handler.process_message(goal,current_image_path,history)
+    with timing.phase("inference"):
+      response = self.client.call(req_messages, temparature=0, max_tokens=512, top_p=0.9)
+    with timing.phase("parse"):
+      output = self.message_handler.process_response(response,1080,2400)
     return response, output
@@ -1,4 +1,3 @@
-from openai import OpenAI
 from typing import List, Dict, Any, Optional, Tuple ,Union
 import re
 import base64, math, requests
@@ -7,6 +6,10 @@ from io import BytesIO
 from utils import representation_utils 
 from utils import m3a_utils
 from utils import action_parser_tool
+from utils import action_grammar
+from utils import timing
+from utils import artifact_store
+from llm_core.endpoint_pool import make_client
 from utils import xml_screen_parser_tool
 import numpy as np
 
@@ -84,87 +87,18 @@ SUMMARY_PROMPT_TEMPLATE = (
     'Summary of this step: '
 )
 MAX_IMAGE_COUNT = 10
-IMAGE_FACTOR = 28
-MIN_PIXELS = 100 * 28 * 28
-MAX_PIXELS = 16384 * 28 * 28
-MAX_RATIO = 200
-
-def round_by_factor(number: int, factor: int) -> int:
-    """Returns the closest integer to 'number' that is divisible by 'factor'."""
-    return round(number / factor) * factor
-
-def ceil_by_factor(number: int, factor: int) -> int:
-    """Returns the smallest integer greater than or equal to 'number' that is divisible by 'factor'."""
-    return math.ceil(number / factor) * factor
-
-def floor_by_factor(number: int, factor: int) -> int:
-    """Returns the largest integer less than or equal to 'number' that is divisible by 'factor'."""
-    return math.floor(number / factor) * factor
-
-def smart_resize(
-    height: int, width: int, factor: int = IMAGE_FACTOR, min_pixels: int = MIN_PIXELS, max_pixels: int = MAX_PIXELS
-) -> tuple[int, int]:
-    """
-    Rescales the image so that the following conditions are met:
-
-    1. Both dimensions (height and width) are divisible by 'factor'.
-
-    2. The total number of pixels is within the range ['min_pixels', 'max_pixels'].
-
-    3. The aspect ratio of the image is maintained as closely as possible.
-    """
-    if max(height, width) / min(height, width) > MAX_RATIO:
-        raise ValueError(
-            f"absolute aspect ratio must be smaller than {MAX_RATIO}, got {max(height, width) / min(height, width)}"
-        )
-    h_bar = max(factor, round_by_factor(height, factor))
-    w_bar = max(factor, round_by_factor(width, factor))
-    if h_bar * w_bar > max_pixels:
-        beta = math.sqrt((height * width) / max_pixels)
-        h_bar = floor_by_factor(height / beta, factor)
-        w_bar = floor_by_factor(width / beta, factor)
-    elif h_bar * w_bar < min_pixels:
-        beta = math.sqrt(min_pixels / (height * width))
-        h_bar = ceil_by_factor(height * beta, factor)
-        w_bar = ceil_by_factor(width * beta, factor)
-    return h_bar, w_bar
-
-class OpenAI_Client:
-    def __init__(self, ip, port=8000, api_key="123456"):
-        print(f"http://{ip}:{port}/v1")
-        openai_api_key = api_key
-        openai_api_base = f"http://{ip}:{port}/v1"
-        self.client = OpenAI(
-            api_key=openai_api_key,
-            base_url=openai_api_base,
-        )
+from utils.action_parser_tool import (
+    IMAGE_FACTOR, MIN_PIXELS, MAX_PIXELS, MAX_RATIO,
+    round_by_factor, ceil_by_factor, floor_by_factor, smart_resize,
+)
+
 
-        models = self.client.models.list()
-        self.model = models.data[0].id
-        print(f"opai:{self.model}")
-
-    def call(self, messages, temparature, top_p, max_tokens):
-        try:
-            if top_p is not None:
-                result = self.client.chat.completions.create(
-                    messages=messages,
-                    model=self.model,
-                    max_tokens=max_tokens,
-                    temperature=temparature,
-                    top_p=top_p,
-                )
-            else:
-                result = self.client.chat.completions.create(
-                    messages=messages,
-                    model=self.model,
-                    max_tokens=max_tokens,
-                    temperature=temparature
-                )
-            return result.choices[0].message.content
-        except Exception as e:
-            print(e)
 
 class uitars_1_5_message_handler(object):
+    def __init__(self, transport=None):
+        # 图片传输配置（格式 / 质量 / 像素预算），见 action_parser_tool.TRANSPORT_PROFILES
+        self.transport = action_parser_tool.get_transport(transport)
+
     def process_message_som_elements_list(
         self,
         task: str,
@@ -190,20 +124,11 @@ class uitars_1_5_message_handler(object):
             ],
         }
 
-        before_pixels = np.asarray(Image.open(image_path)).copy()
-        for index, ui_element in enumerate(before_ui_elements):
-          if m3a_utils.validate_ui_element(ui_element, (1080,2400)):
-            m3a_utils.add_ui_element_mark(
-                before_pixels,
-                ui_element,
-                index,
-                (1080,2400),
-                (0,0,1080,2400),
-                0, 
-            )
+        before_pixels = m3a_utils.render_som(
+            image_path, before_ui_elements, (1080,2400), (0,0,1080,2400), 0
+        )
         save_path = f"{step_prefix}_som.png"
-        image = Image.fromarray(before_pixels)
-        image.save(save_path, format='PNG')
+        artifact_store.save_image(Image.fromarray(before_pixels), save_path)
 
         # 起始 messages
         messages: List[Dict[str, Any]] = [sys_prompt_block]
@@ -226,7 +151,7 @@ class uitars_1_5_message_handler(object):
                         "content": [
                             {
                                 "type": "image_url",
-                                "image_url": {"url": action_parser_tool.image_to_uri(shot)},
+                                "image_url": {"url": action_parser_tool.image_to_uri(shot, transport=self.transport)},
                             },
                         ],
                     }
@@ -245,11 +170,11 @@ class uitars_1_5_message_handler(object):
                 "content": [
                     {
                         "type": "image_url",
-                        "image_url": {"url": action_parser_tool.image_to_uri(before_pixels)},
+                        "image_url": {"url": action_parser_tool.image_to_uri(before_pixels, transport=self.transport)},
                     },
                     {
                         "type": "image_url",
-                        "image_url": {"url": action_parser_tool.image_to_uri(image_path)},
+                        "image_url": {"url": action_parser_tool.image_to_uri(image_path, transport=self.transport)},
                     },
                     {
                         "type": "text",
@@ -292,7 +217,7 @@ class uitars_1_5_message_handler(object):
                         "content": [
                             {
                                 "type": "image_url",
-                                "image_url": {"url": action_parser_tool.image_to_uri(shot)},
+                                "image_url": {"url": action_parser_tool.image_to_uri(shot, transport=self.transport)},
                             },
                         ],
                     }
@@ -311,7 +236,7 @@ class uitars_1_5_message_handler(object):
                 "content": [
                     {
                         "type": "image_url",
-                        "image_url": {"url": action_parser_tool.image_to_uri(image_path)},
+                        "image_url": {"url": action_parser_tool.image_to_uri(image_path, transport=self.transport)},
                     },
                     {
                         "type": "text",
@@ -324,118 +249,12 @@ class uitars_1_5_message_handler(object):
         return messages
 
     def process_response(self, content, width, height):
-        result = action_parser_tool.parse_agent_output(content)
-        extracted_action = result["action"]
-        try:
-            if "click" in extracted_action:
-                x,y = action_parser_tool.extract_xy_from_point(extracted_action)
-                # new_height ,new_width = smart_resize(height,width)
-                # normalized_params = {
-                #     "position":[x/new_width, y/new_height],
-                #     "click_times":1
-                # }
-                # params = {
-                #     "position":[int(x * width / new_width), int(y * height / new_height)],
-                #     "click_times":1
-                # }
-                normalized_params = {
-                    "position": [round(x / width, 2), round(y / height, 2)],
-                    "click_times":1
-                }
-                params = {
-                    "position":[x, y],
-                    "click_times":1
-                }
-                result.update({
-                    "action": "click",
-                    "params": params,
-                    "normalized_params": normalized_params
-                })
-            elif "type" in extracted_action:
-                text = re.search(r"content='(.*?)'", extracted_action).group(1)
-                result.update({
-                    "action": "type",
-                    "params": {"text": text},
-                    "normalized_params": {"text": text}
-                })
-            elif "scroll" in extracted_action or "swipe "in extracted_action:
-                x,y,dir = action_parser_tool.extract_swipe_point_direction(extracted_action)
-                #new_height ,new_width = smart_resize(height,width)
-                # normalized_params = {
-                #     "position":[x/new_width, y/new_height],
-                #     "direction":dir
-                # }
-                # params = {
-                #     "position":[int(x * width / new_width), int(y * height / new_height)],
-                #     "direction":dir
-                # }
-                normalized_params = {
-                    "position":[round(x / width ,2), round(y / height,2)],
-                    "direction":dir
-                }
-                params = {
-                    "position":[x, y],
-                    "direction":dir
-                }
-                result.update({
-                    "action": "scroll",
-                    "params": params,
-                    "normalized_params": normalized_params
-                })
-            elif "navigate_back" in extracted_action or "press_back" in extracted_action:
-                result.update({
-                    "action": "back",
-                    "params": {},
-                    "normalized_params": {}
-                })
-            elif "navigate_home" in extracted_action or "press_home" in extracted_action:
-                result.update({
-                    "action": "home",
-                    "params": {},
-                    "normalized_params": {}
-                })
-            elif "wait" in extracted_action.lower():
-                result.update({
-                    "action": "wait",
-                    "params": {},
-                    "normalized_params": {}
-                })
-            elif "finished" in extracted_action:
-                try:
-                    text = re.search(r"content='(.*?)'", extracted_action).group(1)
-                except:
-                    text = ""
-                result.update({
-                    "action": "terminate",
-                    "params": {"text": text},
-                    "normalized_params": {"text": text}
-                })
-            elif "open" in extracted_action.lower():
-                try:
-                    text = re.search(r"content='(.*?)'", extracted_action).group(1)
-                except:
-                    text = ""
-                result.update({
-                    "action": "open",
-                    "params": {"app_name": text},
-                    "normalized_params": {"app_name": text},
-                })
-            else:
-                raise ValueError(f"Invalid action: {extracted_action}")
-        except:
-            result.update({
-                "action": "invalid",
-                "params": {},
-                "normalized_params": {}               
-            })
-        return result
-    
+        return action_grammar.parse_to_result("uitars_1_5", content, width, height, to_device=self.transport.to_device)
+
     def process_message_summary(self,history,after_pixels,after_xml_string,goal):
 
 
         before_path = history["history_image_path"][-1]
-        before_image = Image.open(before_path)
-        before_pixels = np.asarray(before_image).copy()
         before_xml_string = history["history_xml_string"][-1]
         reason = history["history_response"][-1]
         action = history["history_action"][-1]
@@ -449,26 +268,13 @@ class uitars_1_5_message_handler(object):
         after_ui_elements_list = xml_screen_parser_tool._generate_ui_elements_description_list(
             after_ui_elements, (1080,2400)
         )
-        for index, ui_element in enumerate(before_ui_elements):
-          if m3a_utils.validate_ui_element(ui_element, (1080,2400)):
-            m3a_utils.add_ui_element_mark(
-                before_pixels,
-                ui_element,
-                index,
-                (1080,2400),
-                (0,0,1080,2400),
-                0, 
-            )
-        for index, ui_element in enumerate(after_ui_elements):
-          if m3a_utils.validate_ui_element(ui_element, (1080,2400)):
-            m3a_utils.add_ui_element_mark(
-                after_pixels,
-                ui_element,
-                index,
-                (1080,2400),
-                (0,0,1080,2400),
-                0, 
-            )
+        # 标注结果按截图缓存，before 图通常在上一步的 SoM 提示中已经渲染过
+        before_pixels = m3a_utils.render_som(
+            before_path, before_ui_elements, (1080,2400), (0,0,1080,2400), 0
+        ).copy()
+        after_pixels = m3a_utils.render_som(
+            after_pixels, after_ui_elements, (1080,2400), (0,0,1080,2400), 0
+        ).copy()
         m3a_utils.add_screenshot_label(before_pixels, 'before')
         m3a_utils.add_screenshot_label(after_pixels, 'after')
         summary_prompt = SUMMARY_PROMPT_TEMPLATE.format(
@@ -495,7 +301,7 @@ class uitars_1_5_message_handler(object):
                 "content": [
                     {
                         "type": "image_url",
-                        "image_url": {"url": action_parser_tool.image_to_uri(before_pixels)},
+                        "image_url": {"url": action_parser_tool.image_to_uri(before_pixels, transport=self.transport)},
                     }
                 ],
             }
@@ -506,7 +312,7 @@ class uitars_1_5_message_handler(object):
                 "content": [
                     {
                         "type": "image_url",
-                        "image_url": {"url": action_parser_tool.image_to_uri(after_pixels)},
+                        "image_url": {"url": action_parser_tool.image_to_uri(after_pixels, transport=self.transport)},
                     }
                 ],
             }
@@ -523,6 +329,7 @@ class uitars1_5_Wrapper():
       max_retry: int = 2,
       temperature: float = 0.0,
       max_length: int = 256,
+      transport=None,
   ):
 
     if max_retry <= 0:
@@ -532,8 +339,8 @@ class uitars1_5_Wrapper():
     self.temperature = temperature
     self.max_length=max_length
     #self.url=url
-    self.client=OpenAI_Client("10.221.105.108", port=42302)
-    self.message_handler = uitars_1_5_message_handler()
+    self.client=make_client("uitars_1_5", "10.221.105.108", 42302)
+    self.message_handler = uitars_1_5_message_handler(transport)
 
 
   def predict_mm_som(self, goal, current_image_path, current_xml_string,history,step_prefix):
@@ -545,9 +352,12 @@ class uitars1_5_Wrapper():
 
   def predict_mm(self, goal, current_image_path,history):
 
-    req_messages = self.message_handler.process_message(goal,current_image_path,history)
-    response = self.client.call(req_messages)
-    output = self.message_handler.process_response(response,1080,2400)
+    with timing.phase("request_build"):
+      req_messages = self.message_handler.process_message(goal,current_image_path,history)
+    with timing.phase("inference"):
+      response = self.client.call(req_messages)
+    with timing.phase("parse"):
+      output = self.message_handler.process_response(response,1080,2400)
     return response, output
   
   def summarize(self,history,after_pixels,after_xml_string,goal):
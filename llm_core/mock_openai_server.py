@@ -0,0 +1,163 @@
+"""
+本地 OpenAI 兼容的 mock 服务，用于在没有 GPU 的情况下压测推理层的吞吐 / 并发。
+
+只实现 GET /v1/models 与 POST /v1/chat/completions。
+延迟模型近似 vLLM 的 continuous batching：
+    latency = prefill + decode_tokens * step_time * (1 + batch_penalty * (并发数 - 1))
+即并发越高单请求越慢，但总吞吐随并发上升，直到 max_batch 饱和后排队。
+
+用法：
+    python -m llm_core.mock_openai_server --port 18000 --prefill 0.2 --step_time 0.01
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "Thought: 点击屏幕中央的按钮。\nAction: click(start_box='(500,500)')"
+
+
+class MockBackend:
+    """模拟批处理的推理后端，记录当前并发与已处理请求数。"""
+
+    def __init__(self, model="mock-model", prefill=0.2, step_time=0.01, decode_tokens=32,
+                 batch_penalty=0.02, max_batch=64, error_rate=0.0, reply=DEFAULT_REPLY):
+        self.model = model
+        self.prefill = prefill
+        self.step_time = step_time
+        self.decode_tokens = decode_tokens
+        self.batch_penalty = batch_penalty
+        self.error_rate = error_rate
+        self.reply = reply
+        self._slots = threading.BoundedSemaphore(max_batch)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.served = 0
+
+    def _enter(self):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            return self.active
+
+    def _leave(self):
+        with self._lock:
+            self.active -= 1
+            self.served += 1
+
+    def complete(self, body):
+        with self._slots:
+            batch = self._enter()
+            try:
+                max_tokens = min(int(body.get("max_tokens") or self.decode_tokens), self.decode_tokens)
+                time.sleep(self.prefill + max_tokens * self.step_time * (1 + self.batch_penalty * (batch - 1)))
+            finally:
+                self._leave()
+        prompt_chars = len(json.dumps(body.get("messages", []), ensure_ascii=False))
+        return {
+            "id": f"chatcmpl-mock-{self.served}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": self.model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": self.reply}}],
+            "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": max_tokens,
+                      "total_tokens": prompt_chars // 4 + max_tokens},
+        }
+
+
+def _make_handler(backend: MockBackend):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, payload):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/v1/models":
+                self._send_json(200, {"object": "list",
+                                      "data": [{"id": backend.model, "object": "model", "owned_by": "mock"}]})
+            else:
+                self._send_json(404, {"error": {"message": f"not found: {self.path}"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.rstrip("/") != "/v1/chat/completions":
+                self._send_json(404, {"error": {"message": f"not found: {self.path}"}})
+                return
+            if backend.error_rate and random.random() < backend.error_rate:
+                self._send_json(429, {"error": {"message": "mock rate limit", "type": "rate_limit"}})
+                return
+            self._send_json(200, backend.complete(body))
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class MockOpenAIServer:
+    """在后台线程里运行的 mock 服务；port=0 时自动分配端口。"""
+
+    def __init__(self, host="127.0.0.1", port=0, **backend_kwargs):
+        self.backend = MockBackend(**backend_kwargs)
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self.backend))
+        self.httpd.daemon_threads = True
+        self.host, self.port = self.httpd.server_address[:2]
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible server")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--model", type=str, default="mock-model")
+    parser.add_argument("--prefill", type=float, default=0.2, help="每个请求的固定开销（秒）")
+    parser.add_argument("--step_time", type=float, default=0.01, help="单并发下每个输出 token 的耗时（秒）")
+    parser.add_argument("--decode_tokens", type=int, default=32, help="每个回复的输出 token 数")
+    parser.add_argument("--batch_penalty", type=float, default=0.02, help="每增加一个并发请求，decode 变慢的比例")
+    parser.add_argument("--max_batch", type=int, default=64, help="同时处理的最大请求数，超出则排队")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="随机返回 429 的比例，用于测试重试")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = MockOpenAIServer(host=args.host, port=args.port, model=args.model, prefill=args.prefill,
+                              step_time=args.step_time, decode_tokens=args.decode_tokens,
+                              batch_penalty=args.batch_penalty, max_batch=args.max_batch,
+                              error_rate=args.error_rate)
+    print(f"[MockServer] serving {args.model} at {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
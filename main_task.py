@@ -1,26 +1,24 @@
 
 from __future__ import annotations
-import csv, json, os, time, hashlib
-from dataclasses import dataclass
+import argparse, csv, json, os, queue, subprocess, threading, time, hashlib, traceback
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import List, Dict, Optional
 
-import uiautomator2 as u2
-from lxml import etree as ET
-from utils import agent
-from utils import agent_React
-from llm_core import llm_core_cogagent
-from llm_core import llm_core_os_altas
-from llm_core import llm_core_qwen2_5vl
-from llm_core import llm_core_qwen2vl
-from llm_core import llm_core_gpt4o
-from llm_core import llm_core_uitars_1_5
-from llm_core import llm_core_deepseek_vl2
-from llm_core import llm_core_intern_vl2
-from llm_core import llm_core_uitars
-from llm_core import llm_core_uground_vl
+# 模型后端（llm_core_xxx 及其 openai / cv2 等依赖）按需导入，见 llm_core/backends.py
+from llm_core import backends
+from llm_core.errors import LLMRequestError
 from utils import adb_executor
+from utils import settle
+from utils import hierarchy
+from utils import result_store
+from utils import trajectory_index
+from utils import artifact_store
+from utils import replay_device
+from utils import app_reset
+from utils import timing
 from utils import evaluator_xpath as ev
+from utils.timing import StepTimer
 @dataclass
 class Task:
     identifier: str
@@ -39,6 +37,41 @@ class Trajectory:
     history_response: list   
     summary: str
     success: bool
+    attempt: int = 1
+    timings: Dict[str, float] = field(default_factory=dict)
+    app: Optional[str] = None
+    # 每步 {"png": 哈希, "xml": 哈希}，对象位于 artifact_root（见 utils/artifact_store.py）
+    history_artifacts: list = field(default_factory=list)
+    artifact_root: Optional[str] = None
+    # 各步阶段耗时与相对 started_at 的 [名称, 开始, 结束, 线程]；step 0 为任务级阶段（清后台、启动 app、评估）
+    step_timings: list = field(default_factory=list)
+    started_at: Optional[float] = None
+    device: Optional[str] = None
+
+
+# ---------- 运行计数 ----------
+
+class HarnessStats:
+    """整轮运行中的重连、重试、跳过次数，所有设备 worker 共享；bench_run.py 写入报告。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+
+    def incr(self, name: str, n: int = 1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + n
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+HARNESS_STATS = HarnessStats()
 
 
 # ---------- 设备管理 ----------
@@ -57,6 +90,11 @@ class DeviceManager:
             return False
 
     def _connect(self):
+        # replay:<结果目录> 为离线回放设备，用已保存的轨迹代替真机
+        if replay_device.is_replay(self.serial):
+            return replay_device.connect(self.serial)
+        # uiautomator2 导入较慢，连接设备时才加载，--help 与参数检查不受影响
+        import uiautomator2 as u2
         for attempt in range(self.max_retry):
             try:
                 print(f"[DeviceManager] 尝试连接设备 {self.serial}，第 {attempt+1} 次")
@@ -72,6 +110,10 @@ class DeviceManager:
 
     def reconnect(self):
         print("[DeviceManager] 尝试重新连接设备...")
+        HARNESS_STATS.incr("reconnects")
+        # 回放设备没有连接可断，沿用原实例（重建会让回放进度回到首条录像，agent 手里的也还是旧实例）
+        if replay_device.is_replay(self.serial) and self.d is not None:
+            return
         self.d = self._connect()
 
     # ---------- 高层 API ----------
@@ -98,47 +140,27 @@ class DeviceManager:
 
 class AgentFactory:
     @staticmethod
-    def create(model_name: str, device):
-        if model_name.startswith("uitars_1_5"):
-            return agent.base_agent(device,llm_core_uitars_1_5.uitars1_5_Wrapper())  
-        elif model_name.startswith("uitars"):
-            return agent.base_agent(device,llm_core_uitars.uitars_Wrapper())
-        elif model_name.startswith("gpt4o"):
-            return agent.base_agent(device, llm_core_gpt4o.GPT4oWrapper())
-        elif model_name.startswith("cogagent"):
-            return agent.base_agent(device, llm_core_cogagent.cogagent_Wrapper())
-        elif model_name.startswith("os_altas"):
-            return agent.base_agent(device,llm_core_os_altas.os_altas_Wrapper())
-        elif model_name.startswith("qwen2.5vl"):
-            return agent.base_agent(device,llm_core_qwen2_5vl.qwen2_5vl_Wrapper())
-        elif model_name.startswith("qwen2vl"):
-            return agent.base_agent(device,llm_core_qwen2vl.qwen2vl_Wrapper())  
-        elif model_name.startswith("uground"):
-            return agent.base_agent(device,llm_core_uground_vl.uground_Wrapper())  
-        elif model_name.startswith("deepseek"):
-            return agent.base_agent(device,llm_core_deepseek_vl2.deepseek_vl2_Wrapper()) 
-        elif model_name.startswith("intern"):
-            return agent.base_agent(device,llm_core_intern_vl2.intern_vl2_Wrapper())
-        elif model_name.startswith("React_gpt4o"):
-            return agent_React.base_agent(device,llm_core_gpt4o.GPT4oWrapper())
-        elif model_name.startswith("React_deepseek"):
-            return agent_React.base_agent(device,llm_core_deepseek_vl2.deepseek_vl2_Wrapper())
-        elif model_name.startswith("React_uitars_1_5"):
-            return agent_React.base_agent(device,llm_core_uitars_1_5.uitars1_5_Wrapper())       
-        raise ValueError(f"Unknown model {model_name}")
+    def create(model_name: str, device, transport: Optional[str] = None):
+        """按 model_name 前缀选择后端，第一次使用时才导入对应的 wrapper 模块；transport 为空时用后端默认的传输配置。"""
+        return backends.create_agent(model_name, device, transport=transport)
 
 # ---------- Task 执行 ----------
 
 class TaskExecutor:
-    def __init__(self, device_mgr: DeviceManager, agent):
+    def __init__(self, device_mgr: DeviceManager, agent, settle_detector: Optional[settle.SettleDetector] = None,
+                 resetter: Optional[app_reset.AppResetter] = None):
         self.device_mgr = device_mgr
         self.agent = agent
+        # 与 agent 共用同一个稳定检测器，便于统一调参与统计
+        self.settle = settle_detector or getattr(agent, "settle", None) or settle.SettleDetector()
+        # 任务开始前的 app 重置：杀后台 / 清数据 / 加载快照，并以焦点 activity 确认启动完成
+        self.resetter = resetter or app_reset.AppResetter()
 
     def run(self, task: Task, save_dir: Path , reset: bool = False) -> Trajectory:
-        self.device_mgr.clear_background()
-        time.sleep(5)
-        self.device_mgr.launch_app(task.home_activity)
-        time.sleep(8)
+        started_at, start = time.time(), time.perf_counter()
+        task_timer = StepTimer(0)
+        with timing.activate(task_timer):
+            self.resetter.reset(self.device_mgr, task.home_activity, self.settle)
 
         self.agent.clear()
         max_steps = min(task.golden_steps * 2, 10)
@@ -148,14 +170,26 @@ class TaskExecutor:
                 ok, stepdata = self.agent.step(task.reset_query, path=str(save_dir))
                 if ok:
                     break
-            success = evaluator_xpath.evaluate(task.reset_xpath, stepdata)
+            # 截图 / XML 在后台写盘，保存与评估前等待全部落盘
+            with task_timer.phase("flush"):
+                self.agent.flush()
+            with task_timer.phase("evaluate"):
+                success = evaluator_xpath.evaluate(task.reset_xpath, stepdata)
         else:
             for _ in range(max_steps):
                 ok, stepdata = self.agent.step(task.goal, path=str(save_dir))
                 if ok:
                     break
-            time.sleep(3)
-            success = evaluator_xpath.evaluate(task.key_nodes, stepdata)
+            with task_timer.phase("flush"):
+                self.agent.flush()
+            with task_timer.phase("settle"):
+                self.settle.wait(self.device_mgr.d, "before_evaluate")
+            with task_timer.phase("evaluate"):
+                success = evaluator_xpath.evaluate(task.key_nodes, stepdata)
+        end = time.perf_counter()
+        step_timings = [task_timer.export(start)]
+        if hasattr(self.agent, "export_timings"):
+            step_timings += self.agent.export_timings(start)
 
         traj = Trajectory(
             task_id=task.identifier,
@@ -165,9 +199,25 @@ class TaskExecutor:
             history_response=stepdata["history_response"],
             summary=stepdata["summary"],
             success=success,
+            timings=self._timings(end - start, step_timings),
+            app=hierarchy.app_of(task.home_activity),
+            history_artifacts=stepdata.get("history_artifacts", []),
+            artifact_root=self.agent.writer.root() if hasattr(self.agent, "writer") else None,
+            step_timings=step_timings,
+            started_at=started_at,
+            device=self.device_mgr.serial,
         )
         return traj
 
+    @staticmethod
+    def _timings(total: float, step_timings: list) -> Dict[str, float]:
+        """任务总耗时，以及各阶段耗时之和（如 inference / screenshot / dump_hierarchy / evaluate）。"""
+        timings = {"total": round(total, 3)}
+        for step in step_timings:
+            for name, cost in step["phases"].items():
+                timings[name] = round(timings.get(name, 0.0) + cost, 3)
+        return timings
+
 
 class evaluator_xpath:
     @staticmethod
@@ -176,41 +226,41 @@ class evaluator_xpath:
 
 
 class ResultSink:
-    def __init__(self, base_dir: Path):
+    def __init__(self, base_dir: Path, model: Optional[str] = None, index_path: Optional[Path] = None):
         self.base_dir = base_dir
         self.base_dir.mkdir(parents=True, exist_ok=True)
-        self.cache: Dict[str, bool] = self._load_cache()
-
-    def _load_cache(self):
-        fp = self.base_dir / "result_list.txt"
-        if not fp.exists():
-            return {}
-        return {
-            line.split(",")[0]: line.split(",")[1].lower() == "true"
-            for line in fp.read_text().strip().split(" ")
-            if line
-        }
+        # 结果追加写入 results.jsonl（旧的 result_list.txt 首次打开时自动迁移），
+        # 多设备 worker、多个进程共享同一目录都安全
+        self.store = result_store.ResultStore(base_dir, model=model)
+        # 跨运行共享的轨迹索引：默认为结果目录旁的 trajectory_index.db（即 result/trajectory_index.db）
+        self.model = model
+        self.index = trajectory_index.get_index(index_path or self.base_dir.parent / "trajectory_index.db")
 
     def save(self, traj: Trajectory):
         task_dir = self.base_dir / traj.task_id
         task_dir.mkdir(exist_ok=True)
         with open(task_dir / "trajectory.json", "w", encoding="utf-8") as f:
             json.dump(traj.__dict__, f, ensure_ascii=False, indent=2)
-        self.cache[traj.task_id] = traj.success
-        self._flush_cache()
+        self.store.record(traj.task_id, traj.success, attempt=traj.attempt,
+                          steps=len(traj.history_action), timings=traj.timings)
+        try:
+            self.index.add(self.base_dir.name, traj.__dict__, model=self.model,
+                           path=str(task_dir / "trajectory.json"))
+        except trajectory_index.sqlite3.Error as e:
+            # 索引可随时用 --build 重建，写入失败不影响评测
+            print(f"[WARN] 轨迹索引写入失败 {traj.task_id}: {e}")
 
-    def _flush_cache(self):
-        fp = self.base_dir / "result_list.txt"
-        fp.write_text(
-            " ".join(f"{k},{v}" for k, v in self.cache.items()), encoding="utf-8"
-        )
+    def is_done(self, task_id: str) -> bool:
+        return task_id in self.store
+
+    @property
+    def cache(self) -> Dict[str, bool]:
+        """task_id -> 最后一次的结果。"""
+        return self.store.results()
 
     # 事后评估整轮通过率
     def summary(self):
-        if not self.cache:
-            return 0.0
-        passed = sum(self.cache.values())
-        return passed * 100 / len(self.cache)
+        return self.store.pass_rate()
 
 # ---------- CSV Loader ----------
 def load_tasks(csv_path: Path) -> List[Task]:
@@ -243,8 +293,13 @@ def run_with_reconnect(executor, task, task_dir, reset, dev_mgr, connect_retry=2
     for attempt in range(connect_retry):
         try:
             return executor.run(task, task_dir, reset)
+        except LLMRequestError:
+            # 模型服务不可用（llm_client 内已重试过），与设备无关，不重连手机
+            HARNESS_STATS.incr("llm_errors")
+            raise
         except Exception as e:
             print(f"[ERROR] 连接失败（第 {attempt + 1}/{connect_retry} 次）: {e}")
+            HARNESS_STATS.incr("run_errors")
             if attempt < connect_retry - 1:
                 print("[INFO] 尝试 reconnect...")
                 dev_mgr.reconnect()
@@ -271,14 +326,21 @@ def try_execute_task_with_retry(task:Task,BASE_DIR:str,executor:TaskExecutor,dev
 
         try:
             traj = run_with_reconnect(executor, task, task_dir, reset, dev_mgr, connect_retry=connent_retry)
+        except LLMRequestError as e:
+            print(f"[FAIL] 模型服务请求失败，任务跳过（不重连设备）: {e}")
+            HARNESS_STATS.incr("skipped_tasks")
+            return None
         except Exception as e:
             print(f"[FAIL] 连接失败，任务跳过: {e}")
+            HARNESS_STATS.incr("skipped_tasks")
             return None
+        traj.attempt = fail_attempt + 1
 
         if not traj.success:
             print(f"[WARN] 执行失败,检测是否还有重试次数 {fail_attempt + 1}/{fail_retry}")
             if fail_attempt < fail_retry - 1:
                 print("[INFO]重试任务...")
+                HARNESS_STATS.incr("task_retries")
                 dev_mgr.reconnect()
                 time.sleep(2)
                 continue
@@ -291,48 +353,199 @@ def try_execute_task_with_retry(task:Task,BASE_DIR:str,executor:TaskExecutor,dev
     return None
 
 
+# ---------- 多设备调度 ----------
+
+def discover_serials() -> List[str]:
+    """通过 adb devices 自动发现所有在线设备的序列号。"""
+    result = subprocess.run(["adb", "devices"], capture_output=True, text=True)
+    serials = []
+    for line in result.stdout.splitlines()[1:]:
+        parts = line.split()
+        if len(parts) >= 2 and parts[1] == "device":
+            serials.append(parts[0])
+    return serials
+
+
+class DevicePoolScheduler:
+    """
+    设备池调度器：每台设备一个 worker 线程，各自持有独立的 DeviceManager / agent / TaskExecutor，
+    从共享任务队列中取任务执行，结果统一写入同一个 ResultSink。
+    """
+    def __init__(self, serials: List[str], model_name: str, sink: ResultSink, base_dir: Path,
+                 connect_retry: int, fail_retry: int, reset: bool, pipelined: bool = False,
+                 app_reset_mode: str = "relaunch", snapshot_dir: str = app_reset.SNAPSHOT_DIR,
+                 async_inference: int = 0, transport: Optional[str] = None):
+        if not serials:
+            raise ValueError("设备列表为空，请检查 adb devices")
+        self.serials = serials
+        self.model_name = model_name
+        self.sink = sink
+        self.base_dir = base_dir
+        self.connect_retry = connect_retry
+        self.fail_retry = fail_retry
+        self.reset = reset
+        self.pipelined = pipelined
+        self.app_reset_mode = app_reset_mode
+        self.snapshot_dir = snapshot_dir
+        self.async_inference = async_inference
+        self.transport = transport
+        # serial -> (DeviceManager, TaskExecutor)，跨轮次复用，避免每轮重连设备、重建模型客户端
+        self._executors: Dict[str, tuple] = {}
+
+    def _get_executor(self, serial: str):
+        if serial not in self._executors:
+            dev_mgr = DeviceManager(serial)
+            agent = AgentFactory.create(self.model_name, dev_mgr.d, self.transport)
+            if self.pipelined:
+                if hasattr(agent, "enable_pipeline"):
+                    agent.enable_pipeline()
+                else:
+                    print(f"[Scheduler][{serial}] {type(agent).__module__} 不支持流水线模式，按顺序执行")
+            if self.async_inference:
+                from llm_core import async_inference
+                try:
+                    async_inference.enable_async_inference(agent.llm, max_concurrency=self.async_inference)
+                except (AttributeError, TypeError) as e:
+                    print(f"[Scheduler][{serial}] 无法启用异步推理，使用同步客户端: {e}")
+            resetter = app_reset.AppResetter(self.app_reset_mode, self.snapshot_dir)
+            self._executors[serial] = (dev_mgr, TaskExecutor(dev_mgr, agent, resetter=resetter))
+        return self._executors[serial]
+
+    def _worker(self, serial: str, task_queue: "queue.Queue[Task]", new_success: List[str]):
+        try:
+            dev_mgr, executor = self._get_executor(serial)
+        except Exception as e:
+            print(f"[Scheduler][{serial}] 设备初始化失败，该设备本轮不参与调度: {e}")
+            HARNESS_STATS.incr("device_init_failures")
+            return
+
+        while True:
+            try:
+                task = task_queue.get_nowait()
+            except queue.Empty:
+                return
+            if self.sink.is_done(task.identifier):
+                continue
+            print(f"[Scheduler][{serial}] 执行任务 {task.identifier}（剩余 {task_queue.qsize()}）")
+            try:
+                traj = try_execute_task_with_retry(task, self.base_dir, executor, dev_mgr,
+                                                   self.connect_retry, self.fail_retry, self.reset)
+                if traj is not None:
+                    self.sink.save(traj)
+                    print(f"[TRAJ SUCCESS][{serial}] {task.identifier}  ✅")
+                    new_success.append(task.identifier)
+            except Exception:
+                # 未预料的异常不能让 worker 线程静默退出：记录后继续取下一个任务，该任务留给下一轮补跑
+                print(f"[Scheduler][{serial}] 任务 {task.identifier} 异常，留待补跑:\n{traceback.format_exc()}")
+                HARNESS_STATS.incr("worker_errors")
+
+    def run_round(self, tasks: List[Task]) -> int:
+        """执行一轮：未在 sink.cache 中的任务入队，所有设备并行消费，返回本轮新保存的任务数。"""
+        task_queue: "queue.Queue[Task]" = queue.Queue()
+        for task in tasks:
+            if not self.sink.is_done(task.identifier):
+                task_queue.put(task)
+        if task_queue.empty():
+            return 0
+
+        new_success: List[str] = []
+        workers = [
+            threading.Thread(target=self._worker, args=(serial, task_queue, new_success),
+                             name=f"device-{serial}", daemon=True)
+            for serial in self.serials
+        ]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        return len(new_success)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="MobileBench-OL online evaluation")
+    parser.add_argument("--retry_rounds", type=int, default=2, help="未成功保存任务的补跑轮次")
+    parser.add_argument("--connect_retry", type=int, default=3, help="连接失败重试次数")
+    parser.add_argument("--fail_retry", type=int, default=1, help="单任务失败重试次数")
+    parser.add_argument("--reset", action="store_true", help="评测 reset 任务集")
+    parser.add_argument("--serial", type=str, default="n7emlbbmfyx8eybq",
+                        help="设备序列号，多台设备用逗号分隔；auto 表示自动发现所有在线设备；"
+                             "replay:<结果目录> 为离线回放设备")
+    parser.add_argument("--model_name", type=str, default="debug_test",
+                        help=f"模型名，按前缀选择后端：{', '.join(backends.names())}")
+    parser.add_argument("--task_file", type=str, default="top12.csv")
+    parser.add_argument("--trajectory_file", type=str, default=None,
+                        help="result 下的轨迹子目录，默认与 model_name 相同")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="流水线执行：本步控件树的 dump 与推理同时进行，推理期间预取历史图片")
+    parser.add_argument("--plain_artifacts", action="store_true",
+                        help="按旧格式逐步写 step_N.png / step_N.xml，不使用去重的 result/artifacts 存储")
+    parser.add_argument("--app_reset", type=str, default="relaunch", choices=app_reset.RESET_MODES,
+                        help="任务开始前的 app 重置方式：relaunch 杀后台重启；clear 另外 pm clear 并恢复 "
+                             "snapshots/<包名>.tar；snapshot 在模拟器上加载 AVD 快照")
+    parser.add_argument("--snapshot_dir", type=str, default=app_reset.SNAPSHOT_DIR,
+                        help="clear 模式下 app 数据快照所在目录，用 python -m utils.app_reset --capture 制作")
+    parser.add_argument("--async_inference", type=int, default=0,
+                        help="大于 0 时经 llm_core/async_inference 的共享事件循环发送推理请求，值为每个 endpoint 的并发上限")
+    parser.add_argument("--transport", type=str, default=None,
+                        help="截图传输配置（utils/action_parser_tool.py 的 TRANSPORT_PROFILES），默认取后端在 "
+                             "llm_core/backends.py 中的配置")
+    return parser.parse_args()
+
+
 def main():
     # -------- 模型和任务配置 --------
-    RETRY_ROUNDS = 2   # 未成功保存任务的补跑轮次
-    CONNECT_RETRY = 3  # 连接失败重试次数
-    FAIL_RETRY = 1     # 单任务失败重试次数
-    reset = False      # 任务是否为reset集
-    SERIAL ="n7emlbbmfyx8eybq" #"9945aam77ld6y9u4"#"orp7u4jrkjnrsw75"
-    MODEL_NAME = "debug_test" # model + task + date
-    BASE_DIR = Path("result") / MODEL_NAME #轨迹存放位置
-    task_file = "top12.csv" #任务文件
-    
+    args = parse_args()
+    RETRY_ROUNDS = args.retry_rounds   # 未成功保存任务的补跑轮次
+    CONNECT_RETRY = args.connect_retry  # 连接失败重试次数
+    FAIL_RETRY = args.fail_retry     # 单任务失败重试次数
+    reset = args.reset      # 任务是否为reset集
+    if args.serial == "auto":
+        SERIALS = discover_serials()
+    else:
+        SERIALS = [s.strip() for s in args.serial.split(",") if s.strip()]
+    MODEL_NAME = args.model_name # model + task + date
+    RUN_NAME = args.trajectory_file or MODEL_NAME
+    BASE_DIR = Path("result") / RUN_NAME #轨迹存放位置
+    task_file = args.task_file #任务文件
+    # 截图 / XML 按内容去重存放在 result/artifacts，所有运行共用
+    artifact_store.configure(None if args.plain_artifacts else Path("result") / artifact_store.ARTIFACTS_DIR)
+
     tasks = load_tasks(Path(task_file))
+    # 模型名写错时在连接设备之前失败，同时预先导入该后端
+    backends.load(MODEL_NAME)
+    print(f"[INFO] 截图传输配置: {backends.transport_for(MODEL_NAME, args.transport)}")
 
     # -------- Agent 初始化 --------
-    dev_mgr = DeviceManager(SERIAL)
-    agent = AgentFactory.create(MODEL_NAME, dev_mgr.d)
-    executor = TaskExecutor(dev_mgr, agent)
-    sink = ResultSink(BASE_DIR)
+    print(f"[INFO] 使用设备: {SERIALS}")
+    sink = ResultSink(BASE_DIR, model=MODEL_NAME)
+    scheduler = DevicePoolScheduler(SERIALS, MODEL_NAME, sink, BASE_DIR, CONNECT_RETRY, FAIL_RETRY, reset,
+                                    pipelined=args.pipelined, app_reset_mode=args.app_reset,
+                                    snapshot_dir=args.snapshot_dir, async_inference=args.async_inference,
+                                    transport=args.transport)
 
     # -------- 多轮补跑逻辑 --------
     for round_id in range(RETRY_ROUNDS):
         print(f"\n[INFO] 第 {round_id + 1} 轮任务执行开始...")
-        any_new_success = False
-
-        for task in tasks:
-            if task.identifier in sink.cache:
-                continue
-
-            traj = try_execute_task_with_retry(task,BASE_DIR,executor,dev_mgr,CONNECT_RETRY,FAIL_RETRY,reset)
-            if traj is not None:
-                sink.save(traj)
-                print(f"[TRAJ SUCCESS] {task.identifier}  ✅")
-                any_new_success = True
-
-        if not any_new_success:
+        if scheduler.run_round(tasks) == 0:
             print("[INFO] 本轮没有新任务成功，提前结束补跑")
             break
 
     # -------- 总结与评估 --------
     print(f"\n✅ Overall pass rate: {sink.summary():.2f}%")
-    ev.re_evaluate_all(MODEL_NAME, task_file,reset)
+    # 后端导入时已加载，这里不会再付出导入代价
+    from llm_core import endpoint_pool, llm_client
+    for endpoint, stats in llm_client.request_stats().items():
+        print(f"[LLM] {endpoint}: {stats}")
+    for name, replicas in endpoint_pool.pool_stats().items():
+        print(f"[Pool] {name}: {replicas}")
+    hierarchy.DUMP_STATS.report()
+    app_reset.RESET_STATS.report()
+    print(f"[Harness] {HARNESS_STATS.snapshot()}")
+    print(f"[Backend] import times: {backends.import_times()}")
+    if artifact_store.stats():
+        print(f"[Artifacts] {artifact_store.stats()}")
+    ev.re_evaluate_all(RUN_NAME, task_file,reset)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
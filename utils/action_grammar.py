@@ -0,0 +1,390 @@
+"""
+模型回复的动作解析：每个模型家族一份声明式语法，模块加载时预编译，一次匹配得到动作。
+
+原先各 wrapper 的 process_response 对同一段文本做一连串 `in` 判断和临时的 re.search，
+extract_xy_from_point 每次调用最多再扫描六遍。现在：
+- Grammar 描述回复格式：如何截取动作段、动词表、各参数的写法；
+- Family 描述坐标约定：相对坐标（0~1000）还是像素坐标、滑动的表示方式、归一化坐标的精度；
+- parse() 返回类型化的 Action 或带原因的 ParseError，to_result() 转成执行器使用的旧格式字典。
+
+语料基准见仓库根目录的 bench_action_parser.py。
+"""
+
+import re
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, Optional, Tuple
+
+# ---------- 解析失败原因 ----------
+EMPTY_RESPONSE = "empty_response"    # 回复为空
+MISSING_ACTION = "missing_action"    # 找不到动作段（Action: / actions: / Grounded Operation:）或要求的 Thought:
+UNKNOWN_ACTION = "unknown_action"    # 动作段中没有可识别的动作
+BAD_ARGUMENTS = "bad_arguments"      # 动作可识别，但缺少坐标 / 文本等参数
+
+ACTION_KINDS = ("click", "type", "scroll", "back", "home", "wait", "terminate", "open")
+
+
+@dataclass
+class Action:
+    """模型坐标系下的动作；坐标尚未映射到设备像素。"""
+    kind: str
+    point: Optional[Tuple[int, int]] = None
+    end_point: Optional[Tuple[int, int]] = None
+    direction: Optional[str] = None
+    text: Optional[str] = None
+    thought: Optional[str] = None
+
+
+@dataclass
+class ParseError:
+    reason: str
+    detail: str = ""
+
+    def __str__(self):
+        return f"{self.reason}: {self.detail}" if self.detail else self.reason
+
+
+# ---------- 预编译的参数写法 ----------
+
+_INT = re.compile(r"\d+")
+_POINT_TAG = re.compile(r"<point>\s*(\d+)[\s,]+(\d+)\s*</point>")
+_PAIR = re.compile(r"(\d+)\s*,\s*(\d+)")
+_XY = re.compile(r"x1?\s*=\s*[\"']?(\d+)[\"']?[\s,]+y1?\s*=\s*[\"']?(\d+)")
+# 滑动起点：2~4 位整数，允许中英文逗号或空格分隔
+_SCROLL_POINT = re.compile(r"(\d{2,4})\s*[,， ]\s*(\d{2,4})")
+_BOX = re.compile(r"\[\[\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*\]\]")
+_DIRECTION = re.compile(r"(?<![a-z])(up|down|left|right)(?![a-z])", re.I)
+_QUOTED = {key: re.compile(key + r"\s*=\s*'(.*?)'") for key in ("content", "text", "app_name")}
+_BRACKET = re.compile(r"\[(.*?)\]", re.S)
+_VERB = re.compile(r"[#\s]*([A-Za-z_]+)")
+
+
+def _first_point(text: str) -> Optional[Tuple[int, int]]:
+    """依次尝试 <point>x y</point>、x,y（含 (x,y) 与 [[x,y]]）、x=.. y=..，最后取前两个整数。"""
+    m = (_POINT_TAG.search(text) if "<point>" in text else None) or _PAIR.search(text) or _XY.search(text)
+    if m:
+        return int(m.group(1)), int(m.group(2))
+    nums = _INT.findall(text)
+    if len(nums) >= 2:
+        return int(nums[0]), int(nums[1])
+    return None
+
+
+def _quoted(text: str, keys: Tuple[str, ...]) -> Optional[str]:
+    for key in keys:
+        m = _QUOTED[key].search(text)
+        if m:
+            return m.group(1)
+    return None
+
+
+# ---------- 语法 ----------
+
+@dataclass(frozen=True)
+class Grammar:
+    """
+    一种回复格式。
+
+    Args:
+        section: 截取动作段的正则，group(1) 为动作文本。
+        thought_marker: 思考段的起始标记，思考段截止到动作段之前；None 表示不提取。
+        require_thought: 动作段之前必须有 thought_marker，否则按缺少动作段处理（parse_agent_output 的行为）。
+        verbs: 动作文本开头的动词（小写）→ 动作类型。
+        keywords: 动词不在表中时的兜底：在动作文本中查找最靠前的关键词，(正则片段, 动作类型)。
+        ignore_case: 动词与关键词是否忽略大小写；为 False 时可在片段中用 (?i:..) 单独放宽。
+        text_keys: 文本参数的 key='...' 写法，依次尝试。
+        bracket_text: 文本参数是否可写作 [..]（OS-Atlas 的 TYPE [..]）。
+        box_center: 点击坐标是否取 [[x1,y1,x2,y2]] 的中心（CogAgent）。
+        terminate_keyword: 动作文本中出现该词即视为结束（CogAgent 的 finished）。
+        clean: 截取后对动作文本的清洗。
+    """
+    name: str
+    section: "re.Pattern"
+    thought_marker: Optional[str] = None
+    require_thought: bool = False
+    verbs: Dict[str, str] = field(default_factory=dict)
+    keywords: Tuple[Tuple[str, str], ...] = ()
+    ignore_case: bool = True
+    text_keys: Tuple[str, ...] = ("content",)
+    bracket_text: bool = False
+    box_center: bool = False
+    terminate_keyword: Optional[str] = None
+    clean: Callable[[str], str] = str.strip
+    _keyword: Optional["re.Pattern"] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.keywords:
+            pattern = "|".join(f"({k})" for k, _ in self.keywords)
+            object.__setattr__(self, "_keyword", re.compile(pattern, re.I if self.ignore_case else 0))
+
+    def kind_of(self, action_text: str) -> Optional[str]:
+        m = _VERB.match(action_text)
+        if m:
+            verb = m.group(1)
+            kind = self.verbs.get(verb.lower() if self.ignore_case else verb)
+            if kind is not None:
+                return kind
+        if self._keyword is not None:
+            m = self._keyword.search(action_text)
+            if m:
+                return self.keywords[m.lastindex - 1][1]
+        return None
+
+    def text_of(self, action_text: str) -> Optional[str]:
+        text = _quoted(action_text, self.text_keys)
+        if text is None and self.bracket_text:
+            m = _BRACKET.search(action_text)
+            if m:
+                text = m.group(1).strip()
+        return text
+
+
+def _clean_call(action: str) -> str:
+    """沿用 parse_agent_output 的清洗：去掉模型常见的多余引号、换行与双括号。"""
+    return (action.strip().replace("'='", "").replace("'\n'", "").replace("'\n", "")
+            .replace("((", "(").replace("))", ")").replace("\n", "").strip())
+
+
+# Thought: ... Action: click(start_box='(500,300)') 形式（UI-TARS、Qwen-VL、GPT-4o、DeepSeek-VL2、InternVL2）
+# 与原 parse_agent_output 一致：必须有 Thought:，动作区分大小写（wait / open 除外）
+CALL = Grammar(
+    name="call",
+    section=re.compile(r"Action:\s*(.*)", re.S),
+    thought_marker="Thought:",
+    require_thought=True,
+    ignore_case=False,
+    verbs={
+        "click": "click", "left_click": "click", "double_click": "click",
+        "type": "type",
+        "scroll": "scroll", "swipe": "scroll",
+        "press_back": "back", "navigate_back": "back",
+        "press_home": "home", "navigate_home": "home",
+        "wait": "wait",
+        "finished": "terminate",
+        "open": "open", "open_app": "open",
+    },
+    keywords=(("click", "click"), ("type", "type"), ("scroll", "scroll"), ("swipe", "scroll"),
+              ("navigate_back", "back"), ("press_back", "back"),
+              ("navigate_home", "home"), ("press_home", "home"),
+              ("(?i:wait)", "wait"), ("finished", "terminate"), ("completed", "terminate"), ("(?i:open)", "open")),
+    text_keys=("content", "app_name"),
+    clean=_clean_call,
+)
+
+# UGround 原先只取 Action: 所在的一行并转小写匹配，不要求 Thought:
+UGROUND = replace(CALL, name="uground", section=re.compile(r"Action:\s*(.*)"), require_thought=False,
+                  ignore_case=True)
+
+# actions:\nCLICK <point>[[x,y]]</point> / TYPE [..] / SCROLL [UP] 形式（OS-Atlas）
+BRACKET = Grammar(
+    name="bracket",
+    section=re.compile(r"actions:\s*(.+)", re.I | re.S),
+    verbs={"click": "click", "type": "type", "scroll": "scroll", "press_back": "back",
+           "press_home": "home", "wait": "wait", "complete": "terminate", "end": "terminate"},
+    text_keys=(),
+    bracket_text=True,
+)
+
+# Grounded Operation: CLICK(box=[[x1,y1,x2,y2]]) / TYPE(text='..') / SCROLL_DOWN 形式（CogAgent）
+GROUNDED = Grammar(
+    name="grounded",
+    section=re.compile(r"Grounded Operation:\s*(.*)"),
+    verbs={"click": "click", "type": "type",
+           "scroll_up": "scroll", "scroll_down": "scroll", "scroll_left": "scroll", "scroll_right": "scroll",
+           "end": "terminate"},
+    text_keys=("text", "content"),
+    box_center=True,
+    terminate_keyword="finished",
+    clean=lambda s: s.strip().lstrip("#").lstrip(),
+)
+
+
+# ---------- 模型家族 ----------
+
+# 只有方向、以屏幕中心为起点的滑动：方向 → 终点相对中心的偏移
+CENTER_OFFSETS = {"UP": (0.0, -0.2), "DOWN": (0.0, 0.2), "LEFT": (-0.2, 0.0), "RIGHT": (0.2, 0.0)}
+
+
+@dataclass(frozen=True)
+class Family:
+    """
+    Args:
+        coords: "relative" 模型输出 0~1000 的相对坐标；"pixel" 输出发送图片上的像素坐标。
+        scroll: "points" 起止两点 → swipe；"direction" 起点 + 方向 → scroll；
+                "center" 只有方向 → 以屏幕中心为起点的 swipe。
+        digits: normalized_params 中坐标保留的小数位，None 表示不取整。
+        center_offsets: scroll="center" 时各方向的终点偏移。
+        empty: 空回复视为的动作类型，None 表示按解析失败处理。
+    """
+    grammar: Grammar
+    coords: str = "relative"
+    scroll: str = "points"
+    digits: Optional[int] = None
+    center_offsets: Dict[str, Tuple[float, float]] = field(default_factory=lambda: CENTER_OFFSETS)
+    empty: Optional[str] = None
+
+
+FAMILIES: Dict[str, Family] = {
+    "uitars": Family(CALL),
+    "qwen2vl": Family(CALL),
+    "uground": Family(UGROUND),
+    "uitars_1_5": Family(CALL, coords="pixel", scroll="direction", digits=2),
+    "qwen2_5vl": Family(CALL, coords="pixel", scroll="direction", digits=2),
+    "gpt4o": Family(CALL, coords="pixel", digits=2),
+    "deepseek_vl2": Family(CALL, scroll="direction", digits=2),
+    "intern_vl2": Family(CALL, scroll="direction", digits=2),
+    "os_altas": Family(BRACKET, scroll="center", empty="terminate"),
+    # CogAgent 的 SCROLL_UP 表示内容向上，手指向下滑
+    "cogagent": Family(GROUNDED, scroll="center",
+                       center_offsets={"UP": (0.0, 0.2), "DOWN": (0.0, -0.2),
+                                       "LEFT": (0.2, 0.0), "RIGHT": (-0.2, 0.0)}),
+}
+
+
+def parse(family: str, content: str) -> Tuple[Optional[Action], Optional[ParseError]]:
+    """解析一条模型回复，返回 (Action, None) 或 (None, ParseError)。"""
+    spec = FAMILIES[family]
+    grammar = spec.grammar
+    # 只有真正的空串视为 spec.empty（OS-Atlas 原先的判断）；只含空白的回复按解析失败处理
+    if not content and spec.empty is not None:
+        return Action(spec.empty), None
+    if not content or not content.strip():
+        return None, ParseError(EMPTY_RESPONSE)
+
+    m = grammar.section.search(content)
+    if not m:
+        return None, ParseError(MISSING_ACTION, f"回复中没有 {grammar.section.pattern.split(':')[0]}:")
+    thought = None
+    if grammar.thought_marker is not None:
+        start = content.find(grammar.thought_marker, 0, m.start())
+        if start != -1:
+            thought = content[start + len(grammar.thought_marker):m.start()].strip()
+        elif grammar.require_thought:
+            return None, ParseError(MISSING_ACTION, f"回复中没有 {grammar.thought_marker}")
+    text = grammar.clean(m.group(1))
+    if not text:
+        return None, ParseError(MISSING_ACTION, "动作段为空")
+
+    kind = grammar.kind_of(text)
+    if kind is None and grammar.terminate_keyword and grammar.terminate_keyword in text.lower():
+        kind = "terminate"
+    if kind is None:
+        return None, ParseError(UNKNOWN_ACTION, text[:80])
+
+    if kind == "click":
+        point = None
+        if grammar.box_center:
+            box = _BOX.search(text)
+            if box:
+                x1, y1, x2, y2 = map(int, box.groups())
+                point = ((x1 + x2) // 2, (y1 + y2) // 2)
+        if point is None:
+            point = _first_point(text)
+        if point is None:
+            return None, ParseError(BAD_ARGUMENTS, f"click 缺少坐标: {text[:80]}")
+        return Action(kind, point=point, thought=thought), None
+
+    if kind == "scroll":
+        direction = _DIRECTION.search(text)
+        direction = direction.group(1).lower() if direction else None
+        if spec.scroll == "points":
+            nums = _INT.findall(text)
+            if len(nums) < 4:
+                return None, ParseError(BAD_ARGUMENTS, f"swipe 需要起止两个点: {text[:80]}")
+            x1, y1, x2, y2 = map(int, nums[:4])
+            return Action(kind, point=(x1, y1), end_point=(x2, y2), thought=thought), None
+        if spec.scroll == "direction":
+            if direction is None:
+                # 没有方向但给了起止两点（swipe(start_point=.., end_point=..)），按两点滑动执行
+                nums = _INT.findall(text)
+                if len(nums) >= 4:
+                    x1, y1, x2, y2 = map(int, nums[:4])
+                    return Action(kind, point=(x1, y1), end_point=(x2, y2), thought=thought), None
+            point = _SCROLL_POINT.search(text)
+            if not point:
+                return None, ParseError(BAD_ARGUMENTS, f"scroll 缺少起点: {text[:80]}")
+            return Action(kind, point=(int(point.group(1)), int(point.group(2))),
+                          direction=direction, thought=thought), None
+        if direction is None:
+            return None, ParseError(BAD_ARGUMENTS, f"scroll 缺少方向: {text[:80]}")
+        return Action(kind, direction=direction, thought=thought), None
+
+    if kind in ("type", "terminate", "open"):
+        value = grammar.text_of(text)
+        if value is None and kind == "type":
+            return None, ParseError(BAD_ARGUMENTS, f"type 缺少文本: {text[:80]}")
+        if value is None and kind == "terminate" and not grammar.text_keys:
+            # OS-Atlas 的 COMPLETE / END() 不带文本，与原先一样 params 为空
+            return Action(kind, thought=thought), None
+        return Action(kind, text=value or "", thought=thought), None
+
+    return Action(kind, thought=thought), None
+
+
+def _convert(spec: Family, point: Tuple[int, int], width: int, height: int, to_device) -> tuple:
+    """模型坐标 → (设备像素, 归一化坐标)。"""
+    x, y = point
+    if spec.coords == "relative":
+        position = [int(x * width / 1000), int(y * height / 1000)]
+        normalized = [x / 1000, y / 1000]
+    else:
+        if to_device is not None:
+            x, y = to_device(x, y, width, height)
+        position = [int(x), int(y)]
+        normalized = [x / width, y / height]
+    if spec.digits is not None:
+        normalized = [round(v, spec.digits) for v in normalized]
+    return position, normalized
+
+
+def to_result(family: str, action: Optional[Action], error: Optional[ParseError], width: int, height: int,
+              to_device: Optional[Callable[[float, float, int, int], Tuple[int, int]]] = None) -> dict:
+    """
+    转成执行器 / 轨迹使用的 {"action", "params", "normalized_params"} 字典。
+    to_device 用于像素坐标家族：把发送图片（可能缩放过）上的坐标映射回设备像素。
+    """
+    if action is None:
+        return {"action": "invalid", "params": {}, "normalized_params": {}, "error": str(error)}
+    spec = FAMILIES[family]
+
+    def convert(point):
+        return _convert(spec, point, width, height, to_device)
+
+    kind = action.kind
+    if kind == "click":
+        position, normalized = convert(action.point)
+        return {"action": "click",
+                "params": {"position": position, "click_times": 1},
+                "normalized_params": {"position": normalized, "click_times": 1}}
+    if kind == "scroll":
+        if spec.scroll == "points" or action.end_point is not None:
+            start, start_normalized = convert(action.point)
+            end, end_normalized = convert(action.end_point)
+            return {"action": "swipe",
+                    "params": {"start_position": start, "end_position": end, "press_duration": -1},
+                    "normalized_params": {"start_position": start_normalized, "end_position": end_normalized,
+                                          "press_duration": -1}}
+        if spec.scroll == "direction":
+            position, normalized = convert(action.point)
+            return {"action": "scroll",
+                    "params": {"position": position, "direction": action.direction},
+                    "normalized_params": {"position": normalized, "direction": action.direction}}
+        dx, dy = spec.center_offsets[action.direction.upper()]
+        sx, sy, ex, ey = 0.5, 0.5, 0.5 + dx, 0.5 + dy
+        return {"action": "swipe",
+                "params": {"start_position": [int(width * sx), int(height * sy)],
+                           "end_position": [int(width * ex), int(height * ey)], "press_duration": -1},
+                "normalized_params": {"start_position": [sx, sy], "end_position": [ex, ey], "press_duration": -1}}
+    if kind == "terminate" and action.text is None:
+        return {"action": kind, "params": {}, "normalized_params": {}}
+    if kind in ("type", "terminate"):
+        return {"action": kind, "params": {"text": action.text}, "normalized_params": {"text": action.text}}
+    if kind == "open":
+        return {"action": "open", "params": {"app_name": action.text},
+                "normalized_params": {"app_name": action.text}}
+    return {"action": kind, "params": {}, "normalized_params": {}}
+
+
+def parse_to_result(family: str, content: str, width: int, height: int, to_device=None) -> dict:
+    """wrapper 的 process_response 直接使用：解析并转换，失败时 action 为 "invalid"。"""
+    action, error = parse(family, content)
+    return to_result(family, action, error, width, height, to_device)
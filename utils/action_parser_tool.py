@@ -1,22 +1,263 @@
 import math
+import os
 import base64
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from typing import List, Dict, Union, Optional, Tuple
 import re
 import requests
 import numpy as np
 from PIL import Image
 from io import BytesIO
+
+from utils import timing
+
+IMAGE_FACTOR = 28
+MIN_PIXELS = 100 * 28 * 28
+MAX_PIXELS = 16384 * 28 * 28
+MAX_RATIO = 200
+
+def round_by_factor(number: int, factor: int) -> int:
+    """Returns the closest integer to 'number' that is divisible by 'factor'."""
+    return round(number / factor) * factor
+
+def ceil_by_factor(number: int, factor: int) -> int:
+    """Returns the smallest integer greater than or equal to 'number' that is divisible by 'factor'."""
+    return math.ceil(number / factor) * factor
+
+def floor_by_factor(number: int, factor: int) -> int:
+    """Returns the largest integer less than or equal to 'number' that is divisible by 'factor'."""
+    return math.floor(number / factor) * factor
+
+def smart_resize(
+    height: int, width: int, factor: int = IMAGE_FACTOR, min_pixels: int = MIN_PIXELS, max_pixels: int = MAX_PIXELS
+) -> tuple[int, int]:
+    """
+    Rescales the image so that the following conditions are met:
+
+    1. Both dimensions (height and width) are divisible by 'factor'.
+
+    2. The total number of pixels is within the range ['min_pixels', 'max_pixels'].
+
+    3. The aspect ratio of the image is maintained as closely as possible.
+    """
+    if max(height, width) / min(height, width) > MAX_RATIO:
+        raise ValueError(
+            f"absolute aspect ratio must be smaller than {MAX_RATIO}, got {max(height, width) / min(height, width)}"
+        )
+    h_bar = max(factor, round_by_factor(height, factor))
+    w_bar = max(factor, round_by_factor(width, factor))
+    if h_bar * w_bar > max_pixels:
+        beta = math.sqrt((height * width) / max_pixels)
+        h_bar = floor_by_factor(height / beta, factor)
+        w_bar = floor_by_factor(width / beta, factor)
+    elif h_bar * w_bar < min_pixels:
+        beta = math.sqrt(min_pixels / (height * width))
+        h_bar = ceil_by_factor(height * beta, factor)
+        w_bar = ceil_by_factor(width * beta, factor)
+    return h_bar, w_bar
+
+
+@dataclass(frozen=True)
+class ImageTransport:
+    """
+    发送给模型的图片传输配置。
+
+    format: PNG / JPEG / WEBP
+    quality: 有损格式的压缩质量
+    max_pixels: 像素预算，None 表示保持设备原始分辨率；否则按 smart_resize 对齐到模型的 patch factor
+    """
+    format: str = "PNG"
+    quality: int = 90
+    max_pixels: Optional[int] = None
+    min_pixels: int = MIN_PIXELS
+    factor: int = IMAGE_FACTOR
+
+    @property
+    def mime(self) -> str:
+        return {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}[self.format.upper()]
+
+    def target_size(self, width: int, height: int) -> Tuple[int, int]:
+        """返回 (width, height)：该配置下实际发送给模型的图片尺寸。"""
+        if self.max_pixels is None:
+            return width, height
+        h_bar, w_bar = smart_resize(height, width, self.factor, self.min_pixels, self.max_pixels)
+        return w_bar, h_bar
+
+    def to_device(self, x: float, y: float, width: int, height: int) -> Tuple[int, int]:
+        """把模型输出的（发送图片坐标系下的）绝对坐标映射回设备像素。"""
+        sent_w, sent_h = self.target_size(width, height)
+        return int(round(x * width / sent_w)), int(round(y * height / sent_h))
+
+
+LOSSLESS = ImageTransport()
+
+# 预置的传输配置，wrapper 通过 transport 参数选择
+TRANSPORT_PROFILES: Dict[str, ImageTransport] = {
+    "lossless": LOSSLESS,
+    "jpeg": ImageTransport(format="JPEG", quality=85),
+    "webp": ImageTransport(format="WEBP", quality=80),
+    # Qwen2-VL / Qwen2.5-VL / UI-TARS 系列：14px patch + 2x2 merge => factor 28
+    "jpeg_qwen_1m": ImageTransport(format="JPEG", quality=85, max_pixels=1344 * 28 * 28),
+    "webp_qwen_1m": ImageTransport(format="WEBP", quality=80, max_pixels=1344 * 28 * 28),
+    "jpeg_qwen_2m": ImageTransport(format="JPEG", quality=90, max_pixels=2688 * 28 * 28),
+}
+
+
+def get_transport(transport: Union[None, str, ImageTransport]) -> ImageTransport:
+    if transport is None:
+        return LOSSLESS
+    if isinstance(transport, str):
+        return TRANSPORT_PROFILES[transport]
+    return transport
+
+
+class ImageURICache:
+    """
+    按内容寻址的 data URI LRU 缓存，所有 llm_core_* handler 共享同一个实例。
+
+    - 内存图片（PIL / ndarray）以像素哈希为 key；
+    - 本地路径先以 (路径, mtime, size) 找到像素哈希，命中时无需重新解码和编码；
+    - 总字节数超过 max_bytes 时按最近最少使用淘汰。
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, max_paths: int = 4096):
+        self.max_bytes = max_bytes
+        self.max_paths = max_paths
+        self._entries: "OrderedDict[tuple, str]" = OrderedDict()
+        self._path_index: "OrderedDict[tuple, str]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup_path(self, path_key: tuple) -> Optional[str]:
+        with self._lock:
+            digest = self._path_index.get(path_key)
+            if digest is not None:
+                self._path_index.move_to_end(path_key)
+            return digest
+
+    def remember_path(self, path_key: tuple, digest: str) -> None:
+        with self._lock:
+            self._path_index[path_key] = digest
+            self._path_index.move_to_end(path_key)
+            while len(self._path_index) > self.max_paths:
+                self._path_index.popitem(last=False)
+
+    def get(self, key: tuple, count_miss: bool = True) -> Optional[str]:
+        """count_miss=False 用于之后还会按像素哈希再查一次的快速路径，避免一次查找记两次未命中。"""
+        with self._lock:
+            uri = self._entries.get(key)
+            if uri is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return uri
+
+    def put(self, key: tuple, uri: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = uri
+            self._bytes += len(uri)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._path_index.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+IMAGE_URI_CACHE = ImageURICache()
+
+
+def image_uri_cache_stats() -> Dict[str, int]:
+    """返回共享 data URI 缓存的命中 / 未命中计数。"""
+    return IMAGE_URI_CACHE.stats()
+
+
+# 正在后台写盘的截图：path -> 内存中的 PIL.Image（见 artifact_writer.ArtifactWriter）
+_PENDING_IMAGES: Dict[str, Image.Image] = {}
+_PENDING_LOCK = threading.Lock()
+
+
+def register_pending_image(path: str, image: Image.Image) -> None:
+    with _PENDING_LOCK:
+        _PENDING_IMAGES[os.path.abspath(path)] = image
+
+
+def release_pending_image(path: str) -> None:
+    with _PENDING_LOCK:
+        _PENDING_IMAGES.pop(os.path.abspath(path), None)
+
+
+def pending_image(path: str) -> Optional[Image.Image]:
+    """文件尚未落盘时返回内存中的图片，否则返回 None。"""
+    with _PENDING_LOCK:
+        return _PENDING_IMAGES.get(os.path.abspath(path))
+
+
+def open_image(path: str) -> Image.Image:
+    """替代 Image.open(path)：截图仍在后台写盘时直接返回内存中的副本。"""
+    image = pending_image(path)
+    if image is not None:
+        return image.copy()
+    return Image.open(path)
+
+
+def _path_key(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def _pixel_digest(image: Image.Image) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{image.mode}:{image.width}x{image.height}".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
 def image_to_uri(
     source: Union[str, Image.Image],
     do_resize: bool = False,
+    transport: Union[None, str, ImageTransport] = None,
 ) -> Union[str, Tuple[str, Tuple[int, int], Tuple[int, int]]]:
     """
     将图片转为 data URI，可选择是否 resize。
+    transport 指定编码格式 / 质量 / 像素预算，缺省为无损 PNG 原图。
+    编码结果缓存在 IMAGE_URI_CACHE 中，同一张截图在整条轨迹里只编码一次。
     """
     # 1. 已是 data URI
     if isinstance(source, str) and source.startswith("data:image"):
         return source 
 
+    transport = get_transport(transport)
+    variant = (transport, do_resize)
+    path_key = None
+
     # 2. 读取 PIL.Image
     if isinstance(source, Image.Image):
         image = source
@@ -25,13 +266,21 @@ def image_to_uri(
     elif isinstance(source, str):
         if source.startswith("http://") or source.startswith("https://"):
             image = Image.open(requests.get(source, stream=True).raw)
-        elif source.startswith("file://"):
-            image = Image.open(source[7:])
         elif source.startswith("sample:image") and "base64," in source:
             _, b64_data = source.split("base64,", 1)
             image = Image.open(BytesIO(base64.b64decode(b64_data)))
         else:
-            image = Image.open(source)
+            local_path = source[7:] if source.startswith("file://") else source
+            image = pending_image(local_path)
+            if image is None:
+                path_key = _path_key(local_path)
+                if path_key is not None:
+                    digest = IMAGE_URI_CACHE.lookup_path(path_key)
+                    if digest is not None:
+                        cached = IMAGE_URI_CACHE.get((digest,) + variant, count_miss=False)
+                        if cached is not None:
+                            return cached
+                image = Image.open(local_path)
     else:
         raise ValueError("Unsupported image input")
 
@@ -39,25 +288,66 @@ def image_to_uri(
     image = image.convert("RGB")
     orig_size = (image.width, image.height)
 
-    # 4. Resize if needed
-    if do_resize:
-        max_pixels = 6000 * 28 * 28
-        pixels = image.width * image.height
-        if pixels > max_pixels:
-            max_pixels = 2700 * 28 * 28
+    digest = _pixel_digest(image)
+    if path_key is not None:
+        IMAGE_URI_CACHE.remember_path(path_key, digest)
+    cache_key = (digest,) + variant
+    cached = IMAGE_URI_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # 4~5 计入调用方活动计时器的 encode 阶段（缓存命中时不计）
+    with timing.phase("encode"):
+        # 4. Resize if needed
+        if do_resize:
+            max_pixels = 6000 * 28 * 28
+            pixels = image.width * image.height
+            if pixels > max_pixels:
+                max_pixels = 2700 * 28 * 28
+            else:
+                max_pixels = 1350 * 28 * 28
+            resize_factor = math.sqrt(max_pixels / pixels)
+            new_size = (int(image.width * resize_factor), int(image.height * resize_factor))
+            image = image.resize(new_size)
         else:
-            max_pixels = 1350 * 28 * 28
-        resize_factor = math.sqrt(max_pixels / pixels)
-        new_size = (int(image.width * resize_factor), int(image.height * resize_factor))
-        image = image.resize(new_size)
-    else:
-        new_size = orig_size
+            new_size = transport.target_size(*orig_size)
+            if new_size != orig_size:
+                image = image.resize(new_size, Image.BICUBIC)
+
+        # 5. 按 transport 编码为 base64
+        buffer = BytesIO()
+        if transport.format.upper() == "PNG":
+            image.save(buffer, format="PNG")
+        else:
+            image.save(buffer, format=transport.format.upper(), quality=transport.quality)
+        img_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
+        data_uri = f"data:{transport.mime};base64,{img_base64}"
+    IMAGE_URI_CACHE.put(cache_key, data_uri)
+    return data_uri
+
 
-    # 5. 编码为 base64 PNG
-    buffer = BytesIO()
-    image.save(buffer, format="PNG")
-    img_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
-    data_uri = f"data:image/png;base64,{img_base64}"
+def file_to_uri(path: str, mime: Optional[str] = None) -> str:
+    """
+    不重新编码，直接把本地图片文件的原始字节转成 data URI（同样走共享缓存）。
+    mime 缺省时按扩展名猜测。
+    """
+    if path.startswith("data:image"):
+        return path
+    image = pending_image(path)
+    if image is not None:
+        # 文件还在后台写入，直接编码内存中的图片
+        return image_to_uri(image)
+    mime = mime or mimetypes.guess_type(path)[0] or "image/png"
+    path_key = _path_key(path)
+    if path_key is None:
+        raise FileNotFoundError(f"File not found: {path}")
+    cache_key = ("file", mime) + path_key
+    cached = IMAGE_URI_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    with open(path, "rb") as f:
+        data_uri = f"data:{mime};base64," + base64.b64encode(f.read()).decode("utf-8")
+    IMAGE_URI_CACHE.put(cache_key, data_uri)
     return data_uri
 def extract_swipe_points(text: str) -> Optional[Tuple[Tuple[int, int], Tuple[int, int]]]:
     """
@@ -1,14 +1,21 @@
 
 import time
-import copy
+from concurrent.futures import ThreadPoolExecutor
 from utils import adb_executor
+from utils import settle
+from utils import artifact_writer
+from utils import hierarchy
+from utils import action_parser_tool
+from utils import timing
+from utils.timing import StepTimer
+from utils.history import HistoryView
 import numpy as np
 import json
 
 class base_agent():
 
 
-  def __init__( self, env, llm
+  def __init__( self, env, llm, settle_detector=None, writer=None, pipelined=False, hierarchy_source=None
   ):
 
     self.llm = llm
@@ -19,8 +26,27 @@ class base_agent():
     self.history_xml_string=[]
     self.history_action=[]
     self.summary=[]
+    # 每步截图 / XML 在 artifact_store 中的哈希，写盘完成后由 writer 填入
+    self.history_artifacts = []
     self.additional_guidelines = None
-    self.wait_after_action_seconds = 1
+    # 动作后轮询界面稳定，替代固定的 sleep
+    self.settle = settle_detector or settle.SettleDetector()
+    # 截图 / XML 后台落盘，轨迹结束时调用 flush()
+    self.writer = writer or artifact_writer.ArtifactWriter()
+    # 界面未变化时复用上一次的控件树
+    self.hierarchy = hierarchy_source or hierarchy.HierarchySource()
+    # 流水线模式：本步的控件树在推理期间后台 dump，推理期间预取历史图片
+    self.pipelined = False
+    self._pool = None
+    self.step_timings = []
+    self.step_timers = []
+    if pipelined:
+      self.enable_pipeline()
+
+  def enable_pipeline(self, workers: int = 4):
+    self.pipelined = True
+    if self._pool is None:
+      self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline")
 
   def set_task_guidelines(self, task_guidelines: list[str]) -> None:
     self.additional_guidelines = task_guidelines
@@ -28,45 +54,95 @@ class base_agent():
   def reset(self, go_home_on_reset: bool = False):
     pass
 
+  def flush(self):
+    """等待本条轨迹的截图 / XML 全部写盘，保存结果或评估前调用。"""
+    self.writer.flush()
+
   def clear(self):
+    self.writer.flush()
+    self.hierarchy.invalidate()
+    self.step_timings = []
+    self.step_timers = []
     self.history_image_path = []
     self.history_response = []
     self.history_xml_string=[]
     self.history_action=[]
     self.summary=[]
+    self.history_artifacts = []
+
+  def _transport(self):
+    handler = getattr(self.llm, "message_handler", None)
+    return getattr(handler, "transport", None)
+
+  def _observe(self, timer):
+    """
+    采集当前页面的截图与控件树。先截图：界面未变化时控件树直接复用上一次的结果。
+    流水线模式下控件树在后台 dump，返回的是 Future：本步的请求只用截图，
+    dump 与请求构造 / 推理同时进行（推理期间手机空闲），写入历史前再取结果。
+    """
+    pixels = timer.timed("screenshot", self.env.screenshot)
+    if not self.pipelined:
+      return pixels, timer.timed("dump_hierarchy", self.hierarchy.dump, self.env, pixels)
+    return pixels, self._pool.submit(timer.timed, "dump_hierarchy", self.hierarchy.dump, self.env, pixels)
+
+  def _prefetch_history(self, write_future, img_path):
+    """推理期间等当前截图落盘后按路径编码一次，下一次请求里它作为历史图片可直接命中缓存。"""
+    write_future.result()
+    action_parser_tool.image_to_uri(img_path, transport=self._transport())
+
+  def _finish_step(self, timer):
+    self.step_timers.append(timer)
+    self.step_timings.append(timer.report())
+
+  def export_timings(self, origin: float) -> list:
+    """各步的阶段耗时与相对 origin 的起止时间；flush() 之后调用，后台写盘的阶段才完整。"""
+    return [timer.export(origin) for timer in self.step_timers]
+
+  def history_view(self) -> HistoryView:
+    """当前历史的只读快照（不复制），历史列表只追加，之后的步骤不会改变该视图。"""
+    return HistoryView(
+      history_xml_string=self.history_xml_string,
+      history_image_path=self.history_image_path,
+      history_response=self.history_response,
+      history_action=self.history_action,
+      summary=self.summary,
+    )
 
   def step(self, goal: str,path="screenshot/") :
 
-    step_data={
-      'history_xml_string': self.history_xml_string,
-      "history_image_path": self.history_image_path,
-      "history_response": self.history_response,
-      "history_action": self.history_action,
-      "summary": self.summary,
-    }
-
     step_index = len(self.history_image_path) + 1
     step_prefix = f"{path}\\step_{step_index}"
     
-    # 保存截图
+    timer = StepTimer(step_index)
+    pixels, xml_string = self._observe(timer)
+
+    # 保存截图（后台写盘，请求构造直接使用内存中的图片）
+    artifacts = {}
     img_path = f"{step_prefix}.png"
-    pixels = self.env.screenshot()
-    pixels.save(img_path)
-    
-    # 保存XML
     xml_path = f"{step_prefix}.xml"
-    xml_string = self.env.dump_hierarchy()
-    with open(xml_path, 'w', encoding="utf-8") as f:
-        f.write(xml_string)
+    with timing.activate(timer):
+      write_future = self.writer.save_image(pixels, img_path, artifacts)
+    
+      # 保存XML（流水线模式下推理结束后再保存）
+      if not self.pipelined:
+        self.writer.save_text(xml_string, xml_path, artifacts)
         
 
     # pixels_array=np.asarray(pixels)
 
-    history = copy.deepcopy(step_data)
+    history = self.history_view()
 
-    response, action_output = self.llm.predict_mm(
-        goal,img_path,history
-    )
+    if self.pipelined:
+      self._pool.submit(timer.timed, "prefetch_history", self._prefetch_history, write_future, img_path)
+    # wrapper 内部的 request_build / encode / inference / parse 记为嵌套阶段，predict 只剩其余开销
+    with timing.activate(timer), timer.phase("predict"):
+      response, action_output = self.llm.predict_mm(
+          goal,img_path,history
+      )
+    if self.pipelined:
+      xml_string = xml_string.result()
+      with timing.activate(timer):
+        self.writer.save_text(xml_string, xml_path, artifacts)
 
 
 
@@ -75,6 +151,7 @@ class base_agent():
     self.history_image_path.append(img_path)
     self.history_response.append(response)
     self.history_action.append(action_output)
+    self.history_artifacts.append(artifacts)
 
 
 
@@ -86,7 +163,9 @@ class base_agent():
         "history_response": self.history_response,
         "history_action": self.history_action,
         "summary": self.summary,
+        "history_artifacts": self.history_artifacts,
       }
+      self._finish_step(timer)
       return (True,step_data)
 
     print("##########model_response#################\n")
@@ -97,8 +176,8 @@ class base_agent():
         print(action_output["action"])
         print(action_output["params"])
         print(action_output["normalized_params"])
-        adb_executor.execute_adb_action(action_output, self.env)
-        time.sleep(2.0)
+        with timer.phase("execute"):
+          adb_executor.execute_adb_action(action_output, self.env)
     except Exception as e:  
         print('Failed to execute action.')
         print(str(e))
@@ -110,10 +189,13 @@ class base_agent():
           "history_response": self.history_response,
           "history_action": self.history_action,
           "summary": self.summary,
+          "history_artifacts": self.history_artifacts,
         }
+        self._finish_step(timer)
         return (False,step_data)
 
-    time.sleep(self.wait_after_action_seconds)
+    with timer.phase("settle"):
+      self.settle.wait(self.env, action_output["action"])
 
     step_data={
       'history_xml_string': self.history_xml_string,
@@ -121,5 +203,7 @@ class base_agent():
       "history_response": self.history_response,
       "history_action": self.history_action,
       "summary": self.summary,
+      "history_artifacts": self.history_artifacts,
     }
+    self._finish_step(timer)
     return (False,step_data)
@@ -2,13 +2,19 @@
 import time
 import copy
 from utils import adb_executor
+from utils import settle
+from utils import artifact_writer
+from utils import hierarchy
+from utils.history import HistoryView
+from utils import timing
+from utils.timing import StepTimer
 import numpy as np
 import json
 
 class base_agent():
 
 
-  def __init__( self, env, llm
+  def __init__( self, env, llm, settle_detector=None, writer=None, hierarchy_source=None
   ):
 
     self.llm = llm
@@ -20,8 +26,16 @@ class base_agent():
     # self.history_xml_path = []
     self.history_action=[]
     self.summary=[]
+    self.history_artifacts = []
+    self.step_timings = []
+    self.step_timers = []
     self.additional_guidelines = None
-    self.wait_after_action_seconds = 2
+    # 动作后轮询界面稳定，替代固定的 sleep
+    self.settle = settle_detector or settle.SettleDetector()
+    # 截图 / XML 后台落盘，轨迹结束时调用 flush()
+    self.writer = writer or artifact_writer.ArtifactWriter()
+    # 界面未变化时复用上一次的控件树（reflect 与下一步 perceive 之间通常无变化）
+    self.hierarchy = hierarchy_source or hierarchy.HierarchySource()
 
   def set_task_guidelines(self, task_guidelines: list[str]) -> None:
     self.additional_guidelines = task_guidelines
@@ -29,55 +43,75 @@ class base_agent():
   def reset(self, go_home_on_reset: bool = False):
     pass
 
+  def flush(self):
+    """等待本条轨迹的截图 / XML 全部写盘，保存结果或评估前调用。"""
+    self.writer.flush()
+
   def clear(self):
+    self.writer.flush()
+    self.hierarchy.invalidate()
     self.history_image_path = []
     self.history_response = []
     self.history_xml_string=[]
     # self.history_xml_path = []
     self.history_action=[]
     self.summary=[]
+    self.history_artifacts = []
+    self.step_timings = []
+    self.step_timers = []
+
+  def export_timings(self, origin: float) -> list:
+      """各步的阶段耗时与相对 origin 的起止时间，见 utils/timing.py。"""
+      return [timer.export(origin) for timer in self.step_timers]
 
   def perceive(self, step_prefix):
       img_path = f"{step_prefix}.png"
       xml_path = f"{step_prefix}.xml"
+      artifacts = {}
+      self.history_artifacts.append(artifacts)
 
-      pixels = self.env.screenshot()
-      pixels.save(img_path)
+      with timing.phase("screenshot"):
+          pixels = self.env.screenshot()
+      self.writer.save_image(pixels, img_path, artifacts)
 
-      xml_string = self.env.dump_hierarchy()
-      with open(xml_path, 'w', encoding="utf-8") as f:
-          f.write(xml_string)
+      with timing.phase("dump_hierarchy"):
+          xml_string = self.hierarchy.dump(self.env, pixels)
+      self.writer.save_text(xml_string, xml_path, artifacts)
 
       return xml_string, img_path
+  def history_view(self) -> HistoryView:
+      """当前历史的只读快照（不复制）。"""
+      return HistoryView(
+          history_xml_string=self.history_xml_string,
+          history_image_path=self.history_image_path,
+          history_response=self.history_response,
+          history_action=self.history_action,
+          summary=self.summary,
+      )
   def think(self, goal, current_image_path,current_xml,step_prefix):
-      history = {
-          'history_xml_string': self.history_xml_string, 
-          "history_image_path": self.history_image_path,
-          "history_response": self.history_response,
-          "history_action": self.history_action,
-          "summary": self.summary,
-      }
-      response, action_output = self.llm.predict_nextstep(goal,current_image_path,current_xml,history,step_prefix)
+      history = self.history_view()
+      with timing.phase("predict"):
+          response, action_output = self.llm.predict_nextstep(goal,current_image_path,current_xml,history,step_prefix)
       return response, action_output
   def act(self, action_output):
       try:
           print("Executing:", action_output["action"])
-          adb_executor.execute_adb_action(action_output, self.env)
-          time.sleep(self.wait_after_action_seconds)
+          with timing.phase("execute"):
+              adb_executor.execute_adb_action(action_output, self.env)
+          with timing.phase("settle"):
+              self.settle.wait(self.env, action_output["action"])
           return True
       except Exception as e:
           print("Execution failed:", e)
           return False
   def reflect(self,goal):
-      history = {
-          'history_xml_string': self.history_xml_string, 
-          "history_image_path": self.history_image_path,
-          "history_response": self.history_response,
-          "history_action": self.history_action,
-          "summary": self.summary,
-      }
+      history = self.history_view()
+      with timing.phase("reflect"):
+          return self._reflect(goal, history)
+
+  def _reflect(self, goal, history):
       after_pixels = self.env.screenshot(format="opencv")
-      after_xml_string = self.env.dump_hierarchy()
+      after_xml_string = self.hierarchy.dump(self.env, after_pixels)
       summary = self.llm.summarize(history,after_pixels,after_xml_string,goal)
       return summary
 
@@ -86,6 +120,15 @@ class base_agent():
 
     step_index = len(self.history_image_path) + 1
     step_prefix = f"{path}\\step_{step_index}"
+    timer = StepTimer(step_index)
+    try:
+      with timing.activate(timer):
+        return self._step(goal, step_prefix, react)
+    finally:
+      self.step_timers.append(timer)
+      self.step_timings.append(timer.report())
+
+  def _step(self, goal, step_prefix, react):
 
     xml_string, img_path = self.perceive(step_prefix)
     response, action_output = self.think(goal, img_path, xml_string,step_prefix)
@@ -104,6 +147,7 @@ class base_agent():
           "history_response": self.history_response,
           "history_action": self.history_action,
           "summary": self.summary,
+          "history_artifacts": self.history_artifacts,
       }
       return (True,step_data)
     else: 
@@ -124,6 +168,7 @@ class base_agent():
         "history_response": self.history_response,
         "history_action": self.history_action,
         "summary": self.summary,
+        "history_artifacts": self.history_artifacts,
     }
     return False, step_data
 
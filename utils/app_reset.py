@@ -0,0 +1,262 @@
+"""
+任务开始前的 app 状态重置：把目标 app 恢复到固定的初始状态并确认已启动到前台，按 app 统计重置耗时。
+
+三种方式（--app_reset）：
+- relaunch：杀后台 + 回桌面 + am start，与原来的流程相同，只恢复进程状态，不恢复数据；
+- clear：在 relaunch 之前 pm clear 清空 app 数据；snapshots/<包名>.tar 存在时再推送并解包到 /data/data/<包名>
+  （需要 root，用 --capture 从已登录、已处理完首次启动弹窗的设备上制作），每个任务都从同一份数据开始；
+- snapshot：模拟器（emulator-xxxx）上加载 AVD 快照 <前缀><包名>，整机状态一次恢复，通常最快；
+  不是模拟器或快照不存在时退回 clear。
+
+启动是否就绪通过轮询当前焦点 activity 判断（焦点窗口属于目标包），确认后再按 launch_app 的最短等待与
+稳定次数做稳定检测（焦点切换时首屏往往还在加载）；超时未检测到时退回原来的 launch_app 稳定等待。
+杀后台之后与原流程一样做一次 clear_background 稳定等待。
+
+用法：
+    python -m utils.app_reset --serial emulator-5554 --capture tv.danmaku.bili --mode snapshot
+    python -m utils.app_reset --serial 12345678 --capture tv.danmaku.bili,com.taobao.taobao
+    python -m utils.app_reset --serial 12345678 --activity tv.danmaku.bili/tv.danmaku.bili.MainActivityV2 --mode clear --repeat 3
+"""
+
+import argparse
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from utils import settle, timing
+from utils.hierarchy import app_of
+
+RESET_MODES = ("relaunch", "clear", "snapshot")
+SNAPSHOT_DIR = "snapshots"
+EMULATOR_SNAPSHOT_PREFIX = "mb_"
+_REMOTE_TMP = "/data/local/tmp"
+
+
+class ResetStats:
+    """按 app 记录每次重置的各阶段耗时与是否检测到启动完成，线程安全，所有设备共享。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records: List[Tuple[str, str, Dict[str, float], bool]] = []
+
+    def record(self, app: str, mode: str, phases: Dict[str, float], ready: bool):
+        with self._lock:
+            self.records.append((app, mode, phases, ready))
+
+    def clear(self):
+        with self._lock:
+            self.records = []
+
+    def summary(self) -> Dict[str, Dict[str, object]]:
+        """按重置总耗时从高到低排序：次数、未检测到就绪的次数、平均 / p95 / 最大耗时、各阶段平均耗时。"""
+        with self._lock:
+            records = list(self.records)
+        result: Dict[str, Dict[str, object]] = {}
+        for app in {r[0] for r in records}:
+            rows = [r for r in records if r[0] == app]
+            totals = sorted(sum(r[2].values()) for r in rows)
+            phases: Dict[str, float] = {}
+            for _, _, row_phases, _ in rows:
+                for name, cost in row_phases.items():
+                    phases[name] = phases.get(name, 0.0) + cost
+            result[app] = {
+                "resets": len(rows),
+                "modes": sorted({r[1] for r in rows}),
+                "not_ready": sum(1 for r in rows if not r[3]),
+                "total": round(sum(totals), 3),
+                "mean": round(sum(totals) / len(totals), 3),
+                "p95": round(totals[min(len(totals) - 1, int(0.95 * len(totals)))], 3),
+                "max": round(totals[-1], 3),
+                "phases": {name: round(cost / len(rows), 3) for name, cost in phases.items()},
+            }
+        return dict(sorted(result.items(), key=lambda item: -item[1]["total"]))
+
+    def report(self):
+        for app, stats in self.summary().items():
+            phases = " ".join(f"{k} {v:.2f}" for k, v in stats["phases"].items())
+            print(f"[Reset] {app}: {stats['resets']} resets ({'/'.join(stats['modes'])}, {stats['not_ready']} not ready), "
+                  f"mean {stats['mean']:.2f}s, p95 {stats['p95']:.2f}s | {phases}")
+
+
+RESET_STATS = ResetStats()
+
+
+def wait_for_activity(d, package: str, timeout: float = 15.0, interval: float = 0.2) -> Optional[str]:
+    """轮询焦点窗口，直到属于 package；返回焦点（pkg/activity），超时返回 None。"""
+    deadline = time.monotonic() + timeout
+    while True:
+        focus = settle.current_focus(d)
+        if focus and app_of(focus) == package:
+            return focus
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(interval)
+
+
+def is_emulator(serial: str) -> bool:
+    return serial.startswith("emulator-")
+
+
+def _emu(serial: str, *command: str) -> bool:
+    """通过 adb emu 向模拟器控制台发命令，输出以 OK 结尾视为成功。"""
+    try:
+        result = subprocess.run(["adb", "-s", serial, "emu", *command], capture_output=True, text=True, timeout=120)
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"[Reset] adb emu {' '.join(command)} 失败: {e}")
+        return False
+    output = (result.stdout + result.stderr).strip()
+    if result.returncode != 0 or not output.endswith("OK"):
+        print(f"[Reset] adb emu {' '.join(command)} 失败: {output}")
+        return False
+    return True
+
+
+class AppResetter:
+    """
+    重置目标 app 并等待其启动到前台。每个设备 worker 一个实例（与 TaskExecutor 绑定）。
+
+    Args:
+        mode: RESET_MODES 之一
+        snapshot_dir: clear 模式下数据快照 <包名>.tar 所在目录
+        ready_timeout: 等待焦点 activity 的最长时间
+    """
+
+    def __init__(self, mode: str = "relaunch", snapshot_dir: str = SNAPSHOT_DIR,
+                 emulator_prefix: str = EMULATOR_SNAPSHOT_PREFIX, ready_timeout: float = 15.0,
+                 stats: Optional[ResetStats] = None):
+        if mode not in RESET_MODES:
+            raise ValueError(f"unknown reset mode {mode!r}, expected one of: {', '.join(RESET_MODES)}")
+        self.mode = mode
+        self.snapshot_dir = snapshot_dir
+        self.emulator_prefix = emulator_prefix
+        self.ready_timeout = ready_timeout
+        self.stats = stats if stats is not None else RESET_STATS
+        # 加载失败过的 (serial, 快照名)，之后直接退回 clear，不再每个任务都尝试
+        self._missing_snapshots = set()
+
+    @contextmanager
+    def _phase(self, phases: Dict[str, float], name: str):
+        start = time.perf_counter()
+        try:
+            with timing.phase(name):
+                yield
+        finally:
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+    # ---------- 重置方式 ----------
+
+    def _load_emulator_snapshot(self, device_mgr, package: str) -> bool:
+        name = f"{self.emulator_prefix}{package}"
+        key = (device_mgr.serial, name)
+        if not is_emulator(device_mgr.serial) or key in self._missing_snapshots:
+            return False
+        if not _emu(device_mgr.serial, "avd", "snapshot", "load", name):
+            self._missing_snapshots.add(key)
+            print(f"[Reset][{device_mgr.serial}] 快照 {name} 不可用，改用 pm clear")
+            return False
+        # 快照恢复后 u2 的连接可能失效，探测不到时重连
+        for _ in range(10):
+            try:
+                device_mgr.d.info
+                return True
+            except Exception:
+                time.sleep(0.5)
+        device_mgr.reconnect()
+        return True
+
+    def _clear_data(self, device_mgr, package: str):
+        d = device_mgr.d
+        output = d.shell(f"pm clear {package}").output.strip()
+        if "Success" not in output:
+            print(f"[Reset][{device_mgr.serial}] pm clear {package} 失败: {output}")
+            return
+        local = os.path.join(self.snapshot_dir, f"{package}.tar")
+        if not os.path.exists(local):
+            return
+        remote = f"{_REMOTE_TMP}/mobilebench_{package}.tar"
+        data_dir = f"/data/data/{package}"
+        d.push(local, remote)
+        result = d.shell(f"su -c 'tar -xf {remote} -C {data_dir} && "
+                         f"chown -R $(stat -c %u:%g {data_dir}) {data_dir} && restorecon -R {data_dir}'")
+        if result.exit_code != 0:
+            print(f"[Reset][{device_mgr.serial}] 恢复 {package} 数据快照失败（需要 root）: {result.output.strip()}")
+
+    def reset(self, device_mgr, activity: str, settle_detector: settle.SettleDetector) -> bool:
+        """重置并启动 activity（pkg/activity），返回是否检测到 app 已在前台。"""
+        package = app_of(activity)
+        phases: Dict[str, float] = {}
+        restored = False
+        if self.mode == "snapshot":
+            with self._phase(phases, "app_reset"):
+                restored = self._load_emulator_snapshot(device_mgr, package)
+        if not restored:
+            # 快照已恢复整机状态（包括进程），再杀后台会丢掉热启动的好处
+            with self._phase(phases, "clear_background"):
+                device_mgr.clear_background()
+                settle_detector.wait(device_mgr.d, "clear_background")
+        if self.mode == "clear" or (self.mode == "snapshot" and not restored):
+            with self._phase(phases, "app_reset"):
+                self._clear_data(device_mgr, package)
+        with self._phase(phases, "launch_app"):
+            device_mgr.launch_app(activity)
+            ready = wait_for_activity(device_mgr.d, package, self.ready_timeout) is not None
+            if ready:
+                settle_detector.wait(device_mgr.d, "app_ready")
+            else:
+                print(f"[Reset][{device_mgr.serial}] {self.ready_timeout:.0f}s 内未检测到 {package} 的界面，按原方式等待")
+                settle_detector.wait(device_mgr.d, "launch_app")
+        self.stats.record(package, self.mode, phases, ready)
+        return ready
+
+
+# ---------- 制作快照 ----------
+
+def capture(d, serial: str, package: str, mode: str, snapshot_dir: str = SNAPSHOT_DIR,
+            emulator_prefix: str = EMULATOR_SNAPSHOT_PREFIX) -> bool:
+    """把设备上 package 的当前状态保存为快照：模拟器保存 AVD 快照，其余设备打包 /data/data/<包名>（需要 root）。"""
+    if mode == "snapshot" and is_emulator(serial):
+        return _emu(serial, "avd", "snapshot", "save", f"{emulator_prefix}{package}")
+    os.makedirs(snapshot_dir, exist_ok=True)
+    remote = f"{_REMOTE_TMP}/mobilebench_{package}.tar"
+    d.app_stop(package)
+    result = d.shell(f"su -c 'tar -cf {remote} -C /data/data/{package} .'")
+    if result.exit_code != 0:
+        print(f"[Reset] 打包 {package} 数据失败（需要 root）: {result.output.strip()}")
+        return False
+    d.pull(remote, os.path.join(snapshot_dir, f"{package}.tar"))
+    d.shell(f"rm {remote}")
+    return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Capture app state snapshots and measure app reset latency")
+    parser.add_argument("--serial", type=str, required=True)
+    parser.add_argument("--mode", type=str, default="clear", choices=RESET_MODES)
+    parser.add_argument("--snapshot_dir", type=str, default=SNAPSHOT_DIR)
+    parser.add_argument("--capture", type=str, default=None, help="逗号分隔的包名：把当前状态保存为快照")
+    parser.add_argument("--activity", type=str, default=None, help="逗号分隔的 pkg/activity：重置并统计耗时")
+    parser.add_argument("--repeat", type=int, default=1)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    from main_task import DeviceManager
+    device_mgr = DeviceManager(args.serial)
+    for package in [p for p in (args.capture or "").split(",") if p]:
+        ok = capture(device_mgr.d, args.serial, package, args.mode, args.snapshot_dir)
+        print(f"[Reset] capture {package}: {'ok' if ok else 'failed'}")
+
+    resetter = AppResetter(args.mode, args.snapshot_dir)
+    detector = settle.SettleDetector()
+    for activity in [a for a in (args.activity or "").split(",") if a]:
+        for _ in range(args.repeat):
+            resetter.reset(device_mgr, activity, detector)
+    RESET_STATS.report()
+
+
+if __name__ == "__main__":
+    main()
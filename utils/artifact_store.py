@@ -0,0 +1,215 @@
+"""
+内容寻址的截图 / XML 存储：result/artifacts/objects/<hash 前两位>/<hash>.<ext>，同样的内容只存一份。
+
+- 截图按像素内容哈希（与 hierarchy.image_digest 相同），已存在则跳过 PNG 编码与写盘；
+  轨迹目录中的 step_N.png 是指向对象的硬链接（不支持时退回复制），按路径读图的代码不受影响；
+- XML 按 UTF-8 字节哈希，用 zstd 压缩存储（未安装 zstandard 时退回标准库 zlib），
+  不再写 step_N.xml，读取经 read_text(path, digest) 按哈希解压；
+- trajectory.json 中 history_artifacts 记录每一步 {"png": 哈希, "xml": 哈希}，artifact_root 记录存储目录。
+
+wait、无效点击、滑到底之后的截图与控件树往往逐字节相同，重试任务也会写出大量重复内容，这些都只保存一次。
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Optional
+
+from utils import hierarchy
+
+try:
+    import zstandard
+except ImportError:  # 未安装时 XML 用 zlib 压缩
+    zstandard = None
+
+ARTIFACTS_DIR = "artifacts"
+# 按优先级排列：读取时依次尝试，写入时使用第一个可用的
+_TEXT_CODECS = (".xml.zst", ".xml.z", ".xml")
+
+
+class ArtifactStore:
+    """root/objects 下的内容寻址对象；多个 worker 线程、多个进程可同时写同一目录。"""
+
+    def __init__(self, root: Path, zstd_level: int = 10):
+        self.root = Path(os.path.abspath(root))
+        self.objects = self.root / "objects"
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.zstd_level = zstd_level
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # 按哈希分段加锁：两个线程同时保存相同内容时只编码、写出一次
+        self._publish_locks = [threading.Lock() for _ in range(64)]
+        self.stats: Dict[str, int] = {"stored": 0, "deduplicated": 0, "bytes_written": 0, "bytes_saved": 0}
+
+    def path_of(self, digest: str, ext: str) -> Path:
+        return self.objects / digest[:2] / f"{digest}{ext}"
+
+    def _count(self, stored: bool, size: int):
+        with self._lock:
+            if stored:
+                self.stats["stored"] += 1
+                self.stats["bytes_written"] += size
+            else:
+                self.stats["deduplicated"] += 1
+                self.stats["bytes_saved"] += size
+
+    def _publish(self, target: Path, write) -> bool:
+        """
+        对象不存在时经临时文件写出后原子发布；返回是否新写入。
+        用 link 发布而非 replace：其他进程已写出同一对象时保留已有文件，指向它的硬链接不会失效。
+        """
+        with self._publish_locks[int(target.name[:2], 16) % len(self._publish_locks)]:
+            if target.exists():
+                return False
+            target.parent.mkdir(exist_ok=True)
+            tmp = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                write(tmp)
+                try:
+                    os.link(tmp, target)
+                except FileExistsError:
+                    return False
+                except OSError:
+                    os.replace(tmp, target)
+            finally:
+                if tmp.exists():
+                    tmp.unlink()
+            return True
+
+    @staticmethod
+    def _link(target: Path, path: str):
+        """在轨迹目录中放一个指向对象的硬链接；跨文件系统等情况退回复制。"""
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.link(target, path)
+        except OSError:
+            shutil.copyfile(target, path)
+
+    # ---------- 截图 ----------
+
+    def put_image(self, image, path: Optional[str] = None) -> str:
+        """保存截图（PIL.Image），返回哈希；给出 path 时在该路径放置对象的链接。"""
+        digest = hierarchy.image_digest(image)
+        target = self.path_of(digest, ".png")
+        stored = self._publish(target, lambda tmp: image.save(tmp, format="PNG"))
+        self._count(stored, target.stat().st_size)
+        if path is not None:
+            self._link(target, path)
+        return digest
+
+    def image_path(self, digest: str) -> Path:
+        return self.path_of(digest, ".png")
+
+    # ---------- XML ----------
+
+    def _compressor(self):
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.zstd_level)
+        return compressor
+
+    def put_text(self, text: str) -> str:
+        """保存文本（控件树 XML），返回哈希。"""
+        data = text.encode("utf-8")
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        for ext in _TEXT_CODECS:
+            if self.path_of(digest, ext).exists():
+                self._count(False, len(data))
+                return digest
+        if zstandard is not None:
+            ext, payload = ".xml.zst", self._compressor().compress(data)
+        else:
+            ext, payload = ".xml.z", zlib.compress(data, 6)
+        stored = self._publish(self.path_of(digest, ext), lambda tmp: tmp.write_bytes(payload))
+        self._count(stored, len(payload) if stored else len(data))
+        return digest
+
+    def read_text(self, digest: str) -> str:
+        for ext in _TEXT_CODECS:
+            target = self.path_of(digest, ext)
+            try:
+                data = target.read_bytes()
+            except FileNotFoundError:
+                continue
+            if ext == ".xml.zst":
+                if zstandard is None:
+                    raise RuntimeError(f"{target} 为 zstd 压缩，读取需要安装 zstandard")
+                data = zstandard.ZstdDecompressor().decompress(data)
+            elif ext == ".xml.z":
+                data = zlib.decompress(data)
+            return data.decode("utf-8")
+        raise FileNotFoundError(f"artifact {digest} not found under {self.objects}")
+
+    def text_path(self, digest: str) -> Optional[Path]:
+        for ext in _TEXT_CODECS:
+            target = self.path_of(digest, ext)
+            if target.exists():
+                return target
+        return None
+
+
+# 进程内的默认存储：main_task 启动时 configure，ArtifactWriter 与 SoM 截图保存使用它
+_default: Optional[ArtifactStore] = None
+_stores: Dict[str, ArtifactStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(root: Path) -> ArtifactStore:
+    key = os.path.abspath(root)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = ArtifactStore(root)
+        return store
+
+
+def configure(root: Optional[Path]) -> Optional[ArtifactStore]:
+    """设置默认存储；root 为 None 时恢复为直接写 step_N.png / step_N.xml。"""
+    global _default
+    _default = get_store(root) if root is not None else None
+    return _default
+
+
+def default_store() -> Optional[ArtifactStore]:
+    return _default
+
+
+def save_image(image, path: str) -> Optional[str]:
+    """配置了默认存储时经存储保存并链接到 path，否则直接写 path；返回哈希（未使用存储时为 None）。"""
+    if _default is None:
+        image.save(path, format="PNG")
+        return None
+    return _default.put_image(image, path)
+
+
+def resolve_root(data: dict, trajectory_dir: Optional[str] = None) -> Optional[Path]:
+    """
+    轨迹所用存储的目录：优先约定位置 result/artifacts（即 <run>/<task>/ 的上两级），
+    结果目录被整体移动、拷贝到别处时仍能找到；没有时使用 trajectory.json 中记录的 artifact_root。
+    """
+    if trajectory_dir:
+        conventional = Path(os.path.abspath(trajectory_dir)).parents[1] / ARTIFACTS_DIR
+        if conventional.is_dir():
+            return conventional
+    root = data.get("artifact_root")
+    return Path(root) if root else None
+
+
+def read_text(path: str, digest: Optional[str] = None, root: Optional[Path] = None) -> str:
+    """读取某一步的 XML：有哈希时从存储解压，否则按原路径读取旧格式的 step_N.xml。"""
+    if digest:
+        store = get_store(root) if root is not None else _default
+        if store is not None:
+            return store.read_text(digest)
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def stats() -> Dict[str, int]:
+    return dict(_default.stats) if _default is not None else {}
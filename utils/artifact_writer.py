@@ -0,0 +1,100 @@
+"""截图 / XML 的后台落盘：把 PNG 压缩与文件写入移出 agent.step 的关键路径。"""
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from utils import action_parser_tool
+from utils import artifact_store
+from utils import timing
+
+
+class ArtifactWriter:
+    """
+    后台写文件的线程池。
+
+    save_image 提交后立即返回，写盘期间该路径登记为 pending，
+    action_parser_tool.image_to_uri(path) 会直接使用内存中的图片，不必等文件落盘。
+    flush() 是轨迹结束时的屏障：返回后所有已提交的文件都已完整写出。
+
+    配置了 artifact_store（构造参数或进程默认存储）时内容去重保存：截图链接到存储中的对象，
+    XML 只存压缩后的对象；调用方传入的 ref 字典在写入完成后填入 {"png": 哈希} / {"xml": 哈希}。
+    """
+
+    def __init__(self, max_workers: int = 2, store: Optional[artifact_store.ArtifactStore] = None):
+        self.store = store
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="artifact-writer")
+        self._lock = threading.Lock()
+        self._pending: List[Future] = []
+
+    def _submit(self, fn, *args) -> Future:
+        # 提交方有活动计时器时，后台写盘记为该 step 的 write 阶段（在写盘线程上，与主流程重叠）
+        timer = timing.current()
+        if timer is not None:
+            future = self._pool.submit(timer.timed, "write", fn, *args)
+        else:
+            future = self._pool.submit(fn, *args)
+        with self._lock:
+            self._pending = [f for f in self._pending if not f.done()]
+            self._pending.append(future)
+        return future
+
+    def _store(self) -> Optional[artifact_store.ArtifactStore]:
+        return self.store or artifact_store.default_store()
+
+    def save_image(self, image, path: str, ref: Optional[Dict[str, str]] = None) -> Future:
+        # 写盘线程与请求构造线程共享同一张图，这里先复制一份，避免调用方后续修改
+        image = image.copy()
+        action_parser_tool.register_pending_image(path, image)
+        return self._submit(self._write_image, image, path, ref)
+
+    def save_text(self, text: str, path: str, ref: Optional[Dict[str, str]] = None) -> Future:
+        return self._submit(self._write_text, text, path, ref)
+
+    def _write_image(self, image, path: str, ref: Optional[Dict[str, str]]):
+        try:
+            store = self._store()
+            if store is None:
+                image.save(path)
+            else:
+                digest = store.put_image(image, path)
+                if ref is not None:
+                    ref[_kind(path)] = digest
+        finally:
+            action_parser_tool.release_pending_image(path)
+
+    def _write_text(self, text: str, path: str, ref: Optional[Dict[str, str]]):
+        store = self._store()
+        if store is None or ref is None:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        else:
+            ref[_kind(path)] = store.put_text(text)
+
+    def flush(self):
+        """等待所有已提交的写入完成；任一写入失败则抛出其异常。"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        errors = []
+        for future in pending:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            print(f"[ArtifactWriter] {len(errors)} 个文件写入失败: {errors[0]}")
+            raise errors[0]
+
+    def root(self) -> Optional[str]:
+        """当前使用的存储目录（写入 trajectory.json 的 artifact_root），未使用存储时为 None。"""
+        store = self._store()
+        return str(store.root) if store is not None else None
+
+    def close(self):
+        self.flush()
+        self._pool.shutdown(wait=True)
+
+
+def _kind(path: str) -> str:
+    return os.path.splitext(path)[1].lstrip(".")
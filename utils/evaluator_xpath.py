@@ -2,128 +2,27 @@ from __future__ import annotations
 
 
 
-from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
+import os
 import re
 import csv
 import json
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import lxml.etree as ET
 
 
-@dataclass
-class BoundingBox:
-
-    x_min: int | float
-    x_max: int | float
-    y_min: int | float
-    y_max: int | float
-
-    # ---- Derived ----
-    @property
-    def center(self) -> Tuple[float, float]:
-        return (self.x_min + self.x_max) / 2, (self.y_min + self.y_max) / 2
-
-    @property
-    def width(self) -> float | int:
-        return self.x_max - self.x_min
-
-    @property
-    def height(self) -> float | int:
-        return self.y_max - self.y_min
-
-    @property
-    def area(self) -> float | int:
-        return self.width * self.height
-
-
-@dataclass
-class UIElement:
-    text: Optional[str] = None
-    content_description: Optional[str] = None
-    class_name: Optional[str] = None
-    bbox: Optional[BoundingBox] = None
-    bbox_pixels: Optional[BoundingBox] = None
-    hint_text: Optional[str] = None
-
-    # state flags
-    is_checked: Optional[bool] = None
-    is_checkable: Optional[bool] = None
-    is_clickable: Optional[bool] = None
-    is_editable: Optional[bool] = None
-    is_enabled: Optional[bool] = None
-    is_focused: Optional[bool] = None
-    is_focusable: Optional[bool] = None
-    is_long_clickable: Optional[bool] = None
-    is_scrollable: Optional[bool] = None
-    is_selected: Optional[bool] = None
-    is_visible: Optional[bool] = None
-
-    # identifiers
-    package_name: Optional[str] = None
-    resource_name: Optional[str] = None
-    resource_id: Optional[str] = None
-
-    # tree relations
-    self_id: Optional[int] = None
-    parent_id: Optional[int] = None
-
-
-def _parse_ui_hierarchy(xml_string: str) -> Dict[str, Any]:
-    root = ET.fromstring(xml_string)
-
-    def _rec(node):
-        data = dict(node.attrib)
-        data["children"] = [_rec(child) for child in node]
-        return data
-
-    return _rec(root)
+# 控件树解析统一由 representation_utils 的列式元素表实现（NumPy 列、字符串驻留、父节点下标）
+from utils.representation_utils import BoundingBox, UIElement, UIElementTable
+from utils import artifact_store
 
 
 def xml_dump_to_ui_elements(xml_string: str) -> List[UIElement]:
-    """uiautomator dump → 列表[UIElement]，顺带记录 parent/self id。"""
-    parsed = _parse_ui_hierarchy(xml_string)
-    elements: List[UIElement] = []
-
-    def walk(node: Dict[str, Any], parent_idx: int | None):
-        nonlocal elements
-        bounds = node.get("bounds")
-        bbox = None
-        if bounds:
-            x_min, y_min, x_max, y_max = map(
-                int, bounds.strip("[]").replace("][", ",").split(",")
-            )
-            bbox = BoundingBox(x_min, x_max, y_min, y_max)
-
-        elem = UIElement(
-            text=node.get("text"),
-            content_description=node.get("content-desc"),
-            class_name=node.get("class"),
-            bbox=bbox,
-            bbox_pixels=bbox,
-            is_checked=node.get("checked") == "true",
-            is_checkable=node.get("checkable") == "true",
-            is_clickable=node.get("clickable") == "true",
-            is_enabled=node.get("enabled") == "true",
-            is_focused=node.get("focused") == "true",
-            is_focusable=node.get("focusable") == "true",
-            is_long_clickable=node.get("long-clickable") == "true",
-            is_scrollable=node.get("scrollable") == "true",
-            is_selected=node.get("selected") == "true",
-            package_name=node.get("package"),
-            resource_id=node.get("resource-id"),
-            is_visible=True,
-            self_id=len(elements),
-            parent_id=parent_idx,
-        )
-        cur_idx = elem.self_id  # type: ignore[arg-type]
-        elements.append(elem)
-
-        for child in node.get("children", []):
-            walk(child, cur_idx)
-
-    walk(parsed, None)
-    return elements
+    """uiautomator dump → 列表[UIElement 视图]，含根节点，self_id / parent_id 为先序下标。"""
+    return UIElementTable.from_xml(xml_string).to_ui_elements(include_root=True)
+
 
 def _regex_match(pattern: str, target: Optional[str]) -> bool:
     if target is None:
@@ -249,38 +148,97 @@ def bbox_contains_point(content, bounds, point):  # noqa: ANN001, D401
     return x1 <= x <= x2 and y1 <= y <= y2
 
 
-def evaluate_action_xml(xml: str, xpath: str, action_dict: Dict[str, Any]) -> Tuple[int, set[int]]:
-    """在单份 XML 与一次 action 上评估 XPath；返回 (1|0, visited_nodes)"""
-    visited_nodes: set[int] = set()
-    parser = ET.XMLParser(encoding="utf-8")
-    tree = ET.fromstring(xml.encode(), parser)
+# 自定义函数在模块导入时注册一次（全局命名空间，对所有 XPath 生效）
+ET.FunctionNamespace(None)["bbox_contains_point"] = bbox_contains_point
+
+# 编译后的 XPath 按线程缓存：lxml 的 XPath 对象不保证可跨线程并发求值
+_xpath_local = threading.local()
+
+
+def compile_xpath(xpath: str) -> ET.XPath:
+    """编译并缓存 XPath；$point 作为 XPath 变量在求值时传入。"""
+    cache = getattr(_xpath_local, "cache", None)
+    if cache is None:
+        cache = _xpath_local.cache = {}
+    compiled = cache.get(xpath)
+    if compiled is None:
+        compiled = cache[xpath] = ET.XPath(xpath)
+    return compiled
+
+
+def parse_xml(xml: str):
+    return ET.fromstring(xml.encode(), ET.XMLParser(encoding="utf-8"))
+
+
+def _action_point(action_dict: Dict[str, Any]) -> Optional[str]:
+    params = action_dict.get("params") if isinstance(action_dict, dict) else None
+    if not params or "position" not in params:
+        return None
+    x, y = params["position"]
+    return f"{x},{y}"
 
+
+def match_tree(tree, xpath: str, action_dict: Dict[str, Any]) -> bool:
+    """在已解析的页面树上评估单条 XPath。"""
     if not xpath:
-        return 0, visited_nodes
+        return False
+    if "$point" in xpath:
+        point = _action_point(action_dict)
+        if point is None:
+            # 缺少点击坐标，视为失败
+            return False
+        results = compile_xpath(xpath)(tree, point=point)
+    else:
+        results = compile_xpath(xpath)(tree)
+    return bool(results)
+
 
-    # 注册自定义函数
-    ns = ET.FunctionNamespace(None)
-    ns["bbox_contains_point"] = bbox_contains_point
+class TrajectoryXPathEvaluator:
+    """
+    一条轨迹上的 XPath 评估上下文：每一步的 XML 只在首次用到时解析一次，
+    之后所有规则 / 所有 XPath 都复用同一棵树；(步骤, XPath) 的结果也会缓存，
+    多条规则共用的 XPath 不会重复求值。
+    """
 
-    modified_xpath = xpath
-    if "$point" in xpath and "params" in action_dict and "position" in action_dict["params"]:
-        x, y = action_dict["params"]["position"]
-        modified_xpath = xpath.replace("$point", f"'{x},{y}'")
-    elif "$point" in xpath:
-        # 缺少点击坐标，视为失败
-        return 0, visited_nodes
+    def __init__(self, history_xml: List[str], history_action: List[Dict[str, Any]]):
+        self.history_xml = history_xml
+        self.history_action = history_action
+        self._trees: Dict[int, Any] = {}
+        self._trees_by_xml: Dict[str, Any] = {}   # 页面未变化的步骤（如 wait）共用同一棵树
+        self._results: Dict[Tuple[int, str], bool] = {}
+
+    def tree(self, step: int):
+        tree = self._trees.get(step)
+        if tree is None:
+            xml = self.history_xml[step]
+            tree = self._trees_by_xml.get(xml)
+            if tree is None:
+                tree = self._trees_by_xml[xml] = parse_xml(xml)
+            self._trees[step] = tree
+        return tree
+
+    def match(self, step: int, xpath: str) -> bool:
+        key = (step, xpath)
+        result = self._results.get(key)
+        if result is None:
+            result = self._results[key] = match_tree(self.tree(step), xpath, self.history_action[step])
+        return result
 
-    results = tree.xpath(modified_xpath)
 
-    node_id = hash(xpath)
-    if (isinstance(results, bool) and results) or (not isinstance(results, bool) and results):
-        visited_nodes.add(node_id)
+def evaluate_action_xml(xml: str, xpath: str, action_dict: Dict[str, Any]) -> Tuple[int, set[int]]:
+    """在单份 XML 与一次 action 上评估 XPath；返回 (1|0, visited_nodes)"""
+    visited_nodes: set[int] = set()
+    tree = parse_xml(xml)
+    if match_tree(tree, xpath, action_dict):
+        visited_nodes.add(hash(xpath))
         return 1, visited_nodes
     return 0, visited_nodes
 
-def evaluate(task, step_data):
+def evaluate(task, step_data, verbose: bool = True):
     # 解析规则列表 (格式: "规则1###规则2###规则3")
     rule_list = task.split("###")
+    # 每步 XML 在所有规则间只解析一次
+    engine = TrajectoryXPathEvaluator(step_data["history_xml_string"], step_data["history_action"])
     # 遍历每条规则进行验证
     for rule_index, rule_str in enumerate(rule_list, 1):
         # 提取规则中的所有XPath表达式 (格式: "文本'''XPath'''文本")
@@ -288,8 +246,9 @@ def evaluate(task, step_data):
         xpath_list = rule_parts[1::2]  # 奇数索引位置为XPath
         checked = [False] * len(xpath_list)
         
-        print(f"\n####### 检查规则 #{rule_index} #############")
-        print("目标XPath:", xpath_list)
+        if verbose:
+            print(f"\n####### 检查规则 #{rule_index} #############")
+            print("目标XPath:", xpath_list)
         
         # 验证历史交互数据完整性
         history_xml = step_data["history_xml_string"]
@@ -302,8 +261,6 @@ def evaluate(task, step_data):
         
         # 从最新到最旧遍历历史记录
         for i in range(len(history_xml)-1, -1, -1):
-            xml_string = history_xml[i]
-            action_dict = history_actions[i]
             image_path = step_data["history_image_path"][i]
             
             # 检查当前页面是否匹配任一XPath
@@ -311,11 +268,11 @@ def evaluate(task, step_data):
                 if checked[xpath_idx]:
                     continue  # 已匹配的XPath跳过检查
                     
-                match_flag, visited_nodes = evaluate_action_xml(xml_string, xpath, action_dict)
-                if match_flag == 1:
+                if engine.match(i, xpath):
                     checked[xpath_idx] = True
             
-            print(f"检查步骤 #{i+1} ({image_path}): {checked}")
+            if verbose:
+                print(f"检查步骤 #{i+1} ({image_path}): {checked}")
             
             # 若所有XPath均匹配成功，立即返回结果
             if all(checked):
@@ -323,19 +280,25 @@ def evaluate(task, step_data):
     
     # 所有规则遍历完成后，检查是否所有XPath均被匹配
     return all(checked)
-def evaluate_by_local(task_rule,path):
+def load_trajectory(path):
+    """读取 trajectory.json 及每一步的 XML，返回 (step_data, data)；trajectory.json 只读一次。"""
     with open(path+"trajectory.json",encoding='utf-8') as f:
         data = json.load(f)
     history_image_path=data['history_image_path']
-    print("history_image_path",history_image_path)
-    history_action=data['history_action']
+    # 新格式的 XML 只存在 artifact_store 中，按 history_artifacts 的哈希读取；旧格式读 step_N.xml
+    refs=data.get('history_artifacts') or []
+    root=artifact_store.resolve_root(data, path) if refs else None
     history_xml_string=[]
-    for image_path in history_image_path:
+    for i, image_path in enumerate(history_image_path):
         xml_path=image_path.replace("png","xml")
-        with open(xml_path,encoding='utf-8') as f:
-            xml_string=f.read()
-            history_xml_string.append(xml_string)
-    step_data={"history_xml_string":history_xml_string,"history_action":history_action,"history_image_path":history_image_path}
+        digest=refs[i].get("xml") if i < len(refs) else None
+        history_xml_string.append(artifact_store.read_text(xml_path, digest, root))
+    step_data={"history_xml_string":history_xml_string,"history_action":data['history_action'],"history_image_path":history_image_path}
+    return step_data, data
+
+def evaluate_by_local(task_rule,path):
+    step_data, _ = load_trajectory(path)
+    print("history_image_path",step_data["history_image_path"])
     flag=evaluate(task_rule,step_data)
     print("flag",flag)
     return flag
@@ -357,86 +320,127 @@ def evaluate_by_local_old(task_rule,path):
     print("flag",flag)
     return flag
 
-def re_evaluate_all(model_name, file_name, reset:bool):
+def categorize(flag: bool, finish_flag: bool) -> str:
+    if flag and finish_flag:
+        return "SR"
+    if flag:
+        return "Overdue"
+    if finish_flag:
+        return "Premature"
+    return "HardFail"
+
+# 轨迹缺失或无法读取：不是模型的失败，不计入 SR / HardFail 等分类的分母，单独报告
+ERROR_CATEGORY = "Error"
+
+def evaluate_task(model_name: str, task_id: str, task_rule: str) -> Dict[str, Any]:
     """
-    重新评估所有任务结果并计算成功率
-    
-    Args:
-        model_name: 模型名称
-        file_name: CSV文件名
-    
-    Returns:
-        None: 直接打印评估结果
+    评估单个任务（进程池 worker 入口，需为模块级函数）。
+    轨迹缺失或损坏时不抛异常，记为 Error 并写入 error 字段。
     """
-    # 初始化结果收集列表
-    result_list = []
-
-    if reset:
-        with open(file_name, 'r', encoding='utf-8-sig') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if len(row['reset_xpath']) > 1:
-                    eval_path = f"result/{model_name}/{row['task_identifier']}/"
-                    flag = evaluate_by_local(row["reset_xpath"], eval_path)
-
-                    json_file = f"{eval_path}trajectory.json"
-                    with open(json_file, encoding='utf-8') as f:
-                        data = json.load(f)
-                    last_action = data['history_action'][-1]["action"]
-                    finish_flag = (last_action == "terminate")
-
-                    # 直接记录完整信息
-                    result_list.append((row['task_identifier'], flag, finish_flag))
-    else:
-        with open(file_name, 'r', encoding='utf-8-sig') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if len(row['key_nodes']) > 1:
-                    eval_path = f"result/{model_name}/{row['task_identifier']}/"
-                    flag = evaluate_by_local(row["key_nodes"], eval_path)
-
-                    json_file = f"{eval_path}trajectory.json"
-                    with open(json_file, encoding='utf-8') as f:
-                        data = json.load(f)
-                    last_action = data['history_action'][-1]["action"]
-                    finish_flag = (last_action == "terminate")
-
-                    # 直接记录完整信息
-                    result_list.append((row['task_identifier'], flag, finish_flag))        
-
-    count_SR = 0                  # matched & finished
-    count_overdue = 0             # matched & not finished
-    count_premature = 0           # unmatched & finished
-    count_hard_fail = 0           # unmatched & not finished
-
-    category_dict = {}  # task_id -> label
-
-    for task_id, flag, finish_flag in result_list:
-        if flag and finish_flag:
-            count_SR += 1
-            category_dict[task_id] = "SR"
-        elif flag and not finish_flag:
-            count_overdue += 1
-            category_dict[task_id] = "Overdue"
-        elif not flag and finish_flag:
-            count_premature += 1
-            category_dict[task_id] = "Premature"
+    eval_path = f"result/{model_name}/{task_id}/"
+    record: Dict[str, Any] = {"model": model_name, "task_id": task_id}
+    start = time.perf_counter()
+    try:
+        step_data, data = load_trajectory(eval_path)
+        flag = evaluate(task_rule, step_data, verbose=False)
+        actions = data['history_action']
+        finish_flag = bool(actions) and actions[-1]["action"] == "terminate"
+        record.update(matched=flag, finished=finish_flag, steps=len(actions), error=None)
+        record["category"] = categorize(flag, finish_flag)
+    except Exception as e:
+        record.update(matched=False, finished=False, steps=0, error=f"{type(e).__name__}: {e}",
+                      category=ERROR_CATEGORY)
+    record["eval_seconds"] = round(time.perf_counter() - start, 4)
+    return record
+
+def _collect_tasks(file_name, reset: bool) -> List[Tuple[str, str]]:
+    column = 'reset_xpath' if reset else 'key_nodes'
+    tasks = []
+    with open(file_name, 'r', encoding='utf-8-sig') as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            if len(row[column]) > 1:
+                tasks.append((row['task_identifier'], row[column]))
+    return tasks
+
+SUMMARY_FIELDS = ["model", "task_id", "category", "matched", "finished", "steps", "eval_seconds", "error"]
+
+def batch_re_evaluate(model_names: List[str], file_name, reset: bool, workers: Optional[int] = None,
+                      output: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    多模型 × 多任务批量重评估：任务分发到进程池，结果按完成顺序流式写入 output（.jsonl 或 .csv）。
+    返回的记录按 (模型, CSV 行序) 排序。
+    """
+    tasks = _collect_tasks(file_name, reset)
+    jobs = [(model_name, task_id, rule) for model_name in model_names for task_id, rule in tasks]
+    order = {(m, t): i for i, (m, t, _) in enumerate(jobs)}
+    workers = workers or os.cpu_count() or 1
+
+    out_file = None
+    writer = None
+    if output:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        out_file = open(output, "w", encoding="utf-8", newline="")
+        if output.endswith(".csv"):
+            writer = csv.DictWriter(out_file, fieldnames=SUMMARY_FIELDS)
+            writer.writeheader()
+
+    def emit(record):
+        if out_file is None:
+            return
+        if writer is not None:
+            writer.writerow(record)
         else:
-            count_hard_fail += 1
-            category_dict[task_id] = "HardFail"
+            out_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out_file.flush()
+
+    records = []
+    start = time.perf_counter()
+    try:
+        if workers <= 1 or len(jobs) <= 1:
+            for job in jobs:
+                record = evaluate_task(*job)
+                emit(record)
+                records.append(record)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(evaluate_task, *job) for job in jobs]
+                for future in as_completed(futures):
+                    record = future.result()
+                    emit(record)
+                    records.append(record)
+    finally:
+        if out_file is not None:
+            out_file.close()
+
+    records.sort(key=lambda r: order[(r["model"], r["task_id"])])
+    print(f"[ReEval] {len(jobs)} tasks ({len(model_names)} models) in {time.perf_counter() - start:.2f}s with {workers} workers")
+    for record in records:
+        if record["error"]:
+            print(f"[ReEval] {record['model']}/{record['task_id']}: {record['error']}")
+    return records
+
+def print_summary(records: List[Dict[str, Any]]):
+    # 轨迹缺失 / 损坏的任务不参与百分比计算，只报告个数
+    errors = [r for r in records if r["category"] == ERROR_CATEGORY]
+    records = [r for r in records if r["category"] != ERROR_CATEGORY]
+    count_SR = sum(r["category"] == "SR" for r in records)                 # matched & finished
+    count_overdue = sum(r["category"] == "Overdue" for r in records)       # matched & not finished
+    count_premature = sum(r["category"] == "Premature" for r in records)   # unmatched & finished
+    count_hard_fail = sum(r["category"] == "HardFail" for r in records)    # unmatched & not finished
 
     # 组合统计字段
     count_matched = count_SR + count_overdue
     count_unmatched = count_premature + count_hard_fail
-    total = len(result_list)
+    total = len(records)
 
     # 百分比函数
-    def percentage(v): return f"{round(v * 100.0 / total, 2)}%"
+    def percentage(v): return f"{round(v * 100.0 / total, 2)}%" if total else "0.0%"
 
     # 输出每个任务分类（可选）
     print("\n任务分类结果:")
-    for task_id, category in category_dict.items():
-        print(f"{task_id}: {category}")
+    for record in records:
+        print(f"{record['task_id']}: {record['category']}")
 
     # 打印完整评估汇总
     print("\n评估汇总:")
@@ -447,11 +451,49 @@ def re_evaluate_all(model_name, file_name, reset:bool):
     print(f"HardFail (unmatched & unfinished): \033[1;36m{count_hard_fail} ({percentage(count_hard_fail)})\033[0m")
     print(f"Premature (unmatched & finished): \033[1;36m{count_premature} ({percentage(count_premature)})\033[0m")
     print(f"xpath_Fail (unmatched): \033[1;36m{count_unmatched} ({percentage(count_unmatched)})\033[0m")
+    if errors:
+        print(f"Error (trajectory missing or unreadable, excluded from the totals above): "
+              f"\033[1;31m{len(errors)}\033[0m")
+
+def re_evaluate_all(model_name, file_name, reset:bool, workers: Optional[int] = None, output: Optional[str] = None):
+    """
+    重新评估所有任务结果并计算成功率
+    
+    Args:
+        model_name: 模型名称
+        file_name: CSV文件名
+        workers: 进程数，默认 CPU 核数；1 表示在当前进程内串行评估
+        output: 逐任务结果文件（.jsonl / .csv），默认 result/{model_name}/re_evaluate.jsonl
+    
+    Returns:
+        List[dict]: 每个任务的评估记录
+    """
+    if output is None:
+        output = f"result/{model_name}/re_evaluate{'_reset' if reset else ''}.jsonl"
+    records = batch_re_evaluate([model_name], file_name, reset, workers=workers, output=output)
+    print_summary(records)
+    return records
 
 
 
 
 if __name__ == "__main__":
-    modelname="uitars_longtail_version0_7_21"
-    file_name = "longtail_version1.csv"
-    re_evaluate_all(modelname,file_name,False)
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Batch re-evaluate stored trajectories")
+    parser.add_argument("--models", type=str, default="uitars_longtail_version0_7_21", help="逗号分隔的结果目录名（result/ 下）")
+    parser.add_argument("--task_file", type=str, default="longtail_version1.csv")
+    parser.add_argument("--reset", action="store_true")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", type=str, default=None, help="汇总文件（.jsonl / .csv）")
+    args = parser.parse_args()
+
+    models = [m for m in args.models.split(",") if m]
+    if len(models) == 1:
+        re_evaluate_all(models[0], args.task_file, args.reset, workers=args.workers, output=args.output)
+    else:
+        records = batch_re_evaluate(models, args.task_file, args.reset, workers=args.workers,
+                                    output=args.output or "result/re_evaluate_all.jsonl")
+        for model_name in models:
+            print(f"\n========== {model_name} ==========")
+            print_summary([r for r in records if r["model"] == model_name])
@@ -0,0 +1,165 @@
+"""
+控件树获取层：界面未变化时复用上一次的 dump，并按 app 统计 dump 耗时。
+
+dump_hierarchy 在 bili、淘宝等重页面上单次 1~3 秒，而截图只要几百毫秒。
+每次 dump 前先计算廉价的界面签名（截图哈希 + 当前焦点窗口），签名与上次相同则直接复用上次的 XML。
+"""
+
+import hashlib
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from utils import settle
+
+
+def image_digest(image) -> str:
+    """
+    截图的内容哈希。PIL.Image 按 RGB 计算；numpy 数组视为 screenshot(format="opencv") 的 BGR，
+    先转成 RGB，使同一画面的两种截图格式得到相同的哈希。
+    """
+    if isinstance(image, np.ndarray):
+        data = np.ascontiguousarray(image[..., ::-1]).tobytes() if image.ndim == 3 else image.tobytes()
+    else:
+        data = (image if image.mode == "RGB" else image.convert("RGB")).tobytes()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def app_of(focus: Optional[str]) -> str:
+    """'pkg/activity' -> 'pkg'。"""
+    return focus.split("/", 1)[0] if focus else "unknown"
+
+
+class DumpStats:
+    """
+    按 app 累计 dump 的次数、复用次数与耗时，线程安全，所有设备共享。
+    p95 取自每个 app 最多 reservoir_size 个耗时的蓄水池抽样，长时间运行内存也不会增长。
+    """
+
+    def __init__(self, reservoir_size: int = 512):
+        self._lock = threading.Lock()
+        self.reservoir_size = reservoir_size
+        self._random = random.Random(0)
+        # app -> {"dumps", "reused", "total", "max", "samples"}
+        self._apps: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, app: str, latency: float, reused: bool):
+        with self._lock:
+            item = self._apps.setdefault(app, {"dumps": 0, "reused": 0, "total": 0.0, "max": 0.0, "samples": []})
+            if reused:
+                item["reused"] += 1
+                return
+            item["dumps"] += 1
+            item["total"] += latency
+            item["max"] = max(item["max"], latency)
+            samples = item["samples"]
+            if len(samples) < self.reservoir_size:
+                samples.append(latency)
+            else:
+                slot = self._random.randrange(item["dumps"])
+                if slot < self.reservoir_size:
+                    samples[slot] = latency
+
+    def clear(self):
+        with self._lock:
+            self._apps = {}
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """按真实 dump 总耗时从高到低排序：次数、复用次数、平均 / p95 / 最大耗时。"""
+        with self._lock:
+            apps = {app: dict(item, samples=sorted(item["samples"])) for app, item in self._apps.items()}
+        result: Dict[str, Dict[str, float]] = {}
+        for app, item in apps.items():
+            dumps, samples = item["dumps"], item["samples"]
+            result[app] = {
+                "dumps": dumps,
+                "reused": item["reused"],
+                "total": round(item["total"], 3),
+                "mean": round(item["total"] / dumps, 3) if dumps else 0.0,
+                "p95": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 3) if samples else 0.0,
+                "max": round(item["max"], 3),
+            }
+        return dict(sorted(result.items(), key=lambda item: -item[1]["total"]))
+
+    def report(self):
+        for app, stats in self.summary().items():
+            print(f"[Hierarchy] {app}: {stats['dumps']} dumps (+{stats['reused']} reused), "
+                  f"mean {stats['mean']:.2f}s, p95 {stats['p95']:.2f}s, total {stats['total']:.1f}s")
+
+
+DUMP_STATS = DumpStats()
+
+
+class HierarchySource:
+    """
+    带变化检测的 dump_hierarchy。
+
+    Args:
+        signals: 界面签名使用的信号，"screenshot"（截图内容哈希）与 / 或 "activity"（当前焦点窗口）。
+                 为空则不做复用，每次都 dump。
+        compressed: 透传给 u2 的 dump_hierarchy(compressed=True)，只保留重要节点，体积与耗时都更小；
+                    但会去掉部分容器节点，依赖完整层级的 XPath 规则可能受影响，默认关闭。
+        max_depth: 透传给 u2 的 dump 最大深度，None 表示不限制。
+        max_reuse: 连续复用的上限，达到后强制重新 dump，防止签名漏检导致 XML 长期过期。
+    """
+
+    def __init__(self, signals: Tuple[str, ...] = ("screenshot", "activity"), compressed: bool = False,
+                 max_depth: Optional[int] = None, max_reuse: int = 5, stats: DumpStats = DUMP_STATS):
+        self.signals = signals
+        self.compressed = compressed
+        self.max_depth = max_depth
+        self.max_reuse = max_reuse
+        self.stats = stats
+        self._lock = threading.Lock()
+        self._last: Optional[Tuple[Any, str]] = None
+        self._reused = 0
+
+    def _signature(self, d, pixels) -> Tuple[Optional[tuple], str]:
+        if not self.signals:
+            return None, "unknown"
+        focus = settle.current_focus(d) if "activity" in self.signals else None
+        signature = [focus]
+        if "screenshot" in self.signals:
+            signature.append(image_digest(pixels if pixels is not None else d.screenshot()))
+        return tuple(signature), app_of(focus)
+
+    def _dump(self, d) -> str:
+        kwargs = {}
+        if self.compressed:
+            kwargs["compressed"] = True
+        if self.max_depth is not None:
+            kwargs["max_depth"] = self.max_depth
+        return d.dump_hierarchy(**kwargs)
+
+    def dump(self, d, pixels=None) -> str:
+        """
+        返回当前界面的控件树 XML。pixels 为同一时刻已经拿到的截图，传入可省去一次截图。
+        签名与上一次相同时直接返回上一次的 XML。
+        """
+        start = time.perf_counter()
+        signature, app = self._signature(d, pixels)
+        with self._lock:
+            last = self._last
+            if signature is not None and last is not None and last[0] == signature and self._reused < self.max_reuse:
+                self._reused += 1
+                self.stats.record(app, time.perf_counter() - start, reused=True)
+                return last[1]
+        xml_string = self._dump(d)
+        self.stats.record(app, time.perf_counter() - start, reused=False)
+        with self._lock:
+            self._last = (signature, xml_string)
+            self._reused = 0
+        return xml_string
+
+    def invalidate(self):
+        """丢弃缓存的 XML（如切换任务、重连设备后）。"""
+        with self._lock:
+            self._last = None
+            self._reused = 0
+
+
+def dump_stats() -> Dict[str, Dict[str, float]]:
+    return DUMP_STATS.summary()
@@ -0,0 +1,70 @@
+"""轨迹历史的只读视图：传给 predict_mm 时不再整体 deepcopy。"""
+
+from collections.abc import Mapping, Sequence
+from itertools import islice
+from typing import Any, Dict, List
+
+HISTORY_KEYS = ("history_xml_string", "history_image_path", "history_response", "history_action", "summary")
+
+
+class ReadOnlySequence(Sequence):
+    """
+    底层 list 前 length 个元素的只读视图。
+
+    agent 的历史列表只会追加，视图创建时记下长度，之后的追加对视图不可见，
+    因此无需复制即可得到一份"快照"。元素本身按引用共享（XML / 路径 / 回复是不可变的 str）。
+    """
+
+    __slots__ = ("_data", "_len")
+
+    def __init__(self, data: List[Any], length: int = None):
+        self._data = data
+        self._len = len(data) if length is None else length
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._data[i] for i in range(*index.indices(self._len))]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("history index out of range")
+        return self._data[index]
+
+    def __iter__(self):
+        return islice(self._data, self._len)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, ReadOnlySequence)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ReadOnlySequence({list(self)!r})"
+
+
+class HistoryView(Mapping):
+    """
+    与原先 step_data 字典同样的键，值为 ReadOnlySequence。
+    支持 history["history_response"]、history.get(...)、切片、zip、len 等只读用法。
+    """
+
+    __slots__ = ("_views",)
+
+    def __init__(self, **lists: List[Any]):
+        self._views = {key: ReadOnlySequence(value) for key, value in lists.items()}
+
+    def __getitem__(self, key: str) -> ReadOnlySequence:
+        return self._views[key]
+
+    def __iter__(self):
+        return iter(self._views)
+
+    def __len__(self) -> int:
+        return len(self._views)
+
+    def to_dict(self) -> Dict[str, List[Any]]:
+        """导出为可 JSON 序列化的普通 list 字典。"""
+        return {key: list(view) for key, view in self._views.items()}
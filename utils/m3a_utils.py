@@ -17,12 +17,17 @@
 import ast
 import base64
 import json
+import collections
+import hashlib
 import math
 import re
-from typing import Any, Optional
+import threading
+from typing import Any, Optional, Sequence
+from utils import action_parser_tool
 from utils import representation_utils
 import cv2
 import numpy as np
+from PIL import Image
 
 TRIGGER_SAFETY_CLASSIFIER = 'Triggered LLM safety classifier.'
 
@@ -216,6 +221,280 @@ def add_ui_element_mark(
     )
 
 
+def _element_bounds(
+    ui_elements: Sequence[representation_utils.UIElement]
+    | representation_utils.UIElementTable,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+  """Returns (bounds [x_min, x_max, y_min, y_max], has_bbox, is_visible) arrays.
+
+  A UIElementTable is read column-wise with the root row skipped, matching the
+  enumeration order of xml_dump_to_ui_elements.
+  """
+  if isinstance(ui_elements, representation_utils.UIElementTable):
+    n = len(ui_elements) - 1
+    return (
+        ui_elements.bounds[1:].astype(np.float64),
+        ui_elements.has_bounds[1:],
+        np.ones(n, dtype=bool),
+    )
+  n = len(ui_elements)
+  bounds = np.zeros((n, 4), dtype=np.float64)
+  has_bbox = np.zeros(n, dtype=bool)
+  visible = np.zeros(n, dtype=bool)
+  for i, ui_element in enumerate(ui_elements):
+    bbox = ui_element.bbox_pixels
+    if bbox:
+      bounds[i] = (bbox.x_min, bbox.x_max, bbox.y_min, bbox.y_max)
+      has_bbox[i] = True
+    visible[i] = bool(ui_element.is_visible)
+  return bounds, has_bbox, visible
+
+
+def _logical_to_physical_batch(
+    x: np.ndarray,
+    y: np.ndarray,
+    logical_screen_size: tuple[int, int],
+    physical_frame_boundary: tuple[int, int, int, int],
+    orientation: int,
+) -> tuple[np.ndarray, np.ndarray]:
+  """Vectorized _logical_to_physical (same truncation semantics)."""
+  px0, py0, px1, py1 = physical_frame_boundary
+  px, py = px1 - px0, py1 - py0
+  lx, ly = logical_screen_size
+  if orientation == 0:
+    return np.trunc(x * px / lx) + px0, np.trunc(y * py / ly) + py0
+  if orientation == 1:
+    return px - np.trunc(y * px / ly) + px0, np.trunc(x * py / lx) + py0
+  if orientation == 2:
+    return px - np.trunc(x * px / lx) + px0, py - np.trunc(y * py / ly) + py0
+  if orientation == 3:
+    return np.trunc(y * px / ly) + px0, py - np.trunc(x * py / lx) + py0
+  raise ValueError('Unsupported orientation.')
+
+
+def ui_element_mark_boxes(
+    ui_elements: Sequence[representation_utils.UIElement]
+    | representation_utils.UIElementTable,
+    logical_screen_size: tuple[int, int],
+    physical_frame_boundary: tuple[int, int, int, int],
+    orientation: int,
+    image_shape: tuple[int, ...],
+    screen_width_height_px: Optional[tuple[int, int]] = None,
+) -> tuple[np.ndarray, np.ndarray]:
+  """Computes all SoM boxes at once.
+
+  Applies validate_ui_element, the orientation-dependent corner selection,
+  the logical-to-physical transform and the screenshot scaling to every
+  element in one NumPy pass.
+
+  Args:
+    ui_elements: UI elements, or a whole UIElementTable.
+    logical_screen_size: The logical screen size.
+    physical_frame_boundary: The physical frame boundary.
+    orientation: The current screen orientation.
+    image_shape: Shape of the screenshot the marks are drawn on.
+    screen_width_height_px: Size used for validation, defaults to
+      logical_screen_size.
+
+  Returns:
+    (indices, boxes): element indices to mark and int64 boxes (k, 4) as
+    [x1, y1, x2, y2] in screenshot pixels.
+  """
+  bounds, has_bbox, visible = _element_bounds(ui_elements)
+  width, height = screen_width_height_px or logical_screen_size
+  x_min, x_max, y_min, y_max = np.trunc(bounds).T
+  valid = (
+      visible
+      & has_bbox
+      & (x_min < x_max)
+      & (x_min < width)
+      & (x_max > 0)
+      & (y_min < y_max)
+      & (y_min < height)
+      & (y_max > 0)
+  )
+  indices = np.flatnonzero(valid)
+  x_min, x_max, y_min, y_max = (v[indices] for v in (x_min, x_max, y_min, y_max))
+  corners = {
+      0: ((x_min, y_min), (x_max, y_max)),
+      1: ((x_min, y_max), (x_max, y_min)),
+      2: ((x_max, y_max), (x_min, y_min)),
+      3: ((x_max, y_min), (x_min, y_max)),
+  }
+  if orientation not in corners:
+    raise ValueError('Unsupported orientation.')
+  (ux, uy), (lx, ly) = corners[orientation]
+  ux, uy = _logical_to_physical_batch(
+      ux, uy, logical_screen_size, physical_frame_boundary, orientation
+  )
+  lx, ly = _logical_to_physical_batch(
+      lx, ly, logical_screen_size, physical_frame_boundary, orientation
+  )
+  x_scale = image_shape[1] / physical_frame_boundary[2]
+  y_scale = image_shape[0] / physical_frame_boundary[3]
+  boxes = np.stack(
+      [ux * x_scale, uy * y_scale, lx * x_scale, ly * y_scale], axis=1
+  )
+  return indices, np.trunc(boxes).astype(np.int64)
+
+
+def draw_ui_element_marks(
+    screenshot: np.ndarray,
+    indices: np.ndarray,
+    boxes: np.ndarray,
+    physical_frame_boundary: tuple[int, int, int, int],
+):
+  """Draws precomputed SoM boxes in place; same marks as add_ui_element_mark."""
+  x_scale = screenshot.shape[1] / physical_frame_boundary[2]
+  y_scale = screenshot.shape[0] / physical_frame_boundary[3]
+  iso_scale = math.sqrt(x_scale * x_scale + y_scale * y_scale)
+  thickness = int(2 * iso_scale)
+  font_scale = 0.7 * iso_scale
+  dx0, dx1 = int(1 * x_scale), int(35 * x_scale)
+  dy0, dy1, dy_text = int(1 * y_scale), int(25 * y_scale), int(20 * y_scale)
+  for index, (x1, y1, x2, y2) in zip(indices.tolist(), boxes.tolist()):
+    cv2.rectangle(screenshot, (x1, y1), (x2, y2), (0, 255, 0), thickness)
+    screenshot[y1 + dy0 : y1 + dy1, x1 + dx0 : x1 + dx1, :] = (255, 255, 255)
+    cv2.putText(
+        screenshot,
+        str(index),
+        (x1 + dx0, y1 + dy_text),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        font_scale,
+        (0, 0, 0),
+        thickness=thickness,
+    )
+
+
+class SoMCache:
+  """LRU cache of rendered set-of-marks screenshots.
+
+  Keyed by screenshot identity (path + mtime + size for files on disk, pixel
+  hash otherwise) and a hash of the computed mark boxes, so the same frame
+  with the same elements is rendered once per trajectory no matter how many
+  prompts (SoM step, summary before / after) use it.
+  """
+
+  def __init__(self, max_entries: int = 8):
+    self.max_entries = max_entries
+    self._entries: collections.OrderedDict[tuple, np.ndarray] = (
+        collections.OrderedDict()
+    )
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key: tuple) -> Optional[np.ndarray]:
+    with self._lock:
+      image = self._entries.get(key)
+      if image is None:
+        self.misses += 1
+        return None
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return image
+
+  def put(self, key: tuple, image: np.ndarray):
+    image.flags.writeable = False
+    with self._lock:
+      self._entries[key] = image
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self.hits = 0
+      self.misses = 0
+
+
+SOM_CACHE = SoMCache()
+
+
+def _screenshot_source(
+    screenshot: str | Image.Image | np.ndarray,
+) -> tuple[Any, tuple[int, ...], tuple]:
+  """Returns (pixels or loader, image shape, identity key) without decoding files.
+
+  Files already on disk are keyed by (path, mtime, size) and only decoded on a
+  cache miss; in-memory images (including screenshots still being written by
+  ArtifactWriter) are keyed by a pixel hash.
+  """
+  if isinstance(screenshot, str):
+    path_key = None
+    if action_parser_tool.pending_image(screenshot) is None:
+      path_key = action_parser_tool._path_key(screenshot)
+    if path_key is not None:
+      with Image.open(screenshot) as image:
+        width, height = image.size
+      loader = lambda: np.asarray(Image.open(screenshot).convert('RGB'))
+      return loader, (height, width, 3), ('path',) + path_key
+    screenshot = action_parser_tool.open_image(screenshot).convert('RGB')
+  pixels = np.asarray(screenshot)
+  return pixels, pixels.shape, ('pixels', _array_digest(pixels))
+
+
+def _array_digest(pixels: np.ndarray) -> str:
+  h = hashlib.blake2b(digest_size=16)
+  h.update(f'{pixels.shape}:{pixels.dtype}'.encode())
+  h.update(np.ascontiguousarray(pixels).tobytes())
+  return h.hexdigest()
+
+
+def render_som(
+    screenshot: str | Image.Image | np.ndarray,
+    ui_elements: Sequence[representation_utils.UIElement]
+    | representation_utils.UIElementTable,
+    logical_screen_size: tuple[int, int],
+    physical_frame_boundary: tuple[int, int, int, int],
+    orientation: int = 0,
+    screen_width_height_px: Optional[tuple[int, int]] = None,
+    cache: Optional[SoMCache] = SOM_CACHE,
+) -> np.ndarray:
+  """Batched replacement for the validate_ui_element + add_ui_element_mark loop.
+
+  Args:
+    screenshot: Screenshot path, PIL image or RGB array; never modified.
+    ui_elements: UI elements (index = position in the sequence) or a
+      UIElementTable.
+    logical_screen_size: The logical screen size.
+    physical_frame_boundary: The physical frame boundary.
+    orientation: The current screen orientation.
+    screen_width_height_px: Size used for validation, defaults to
+      logical_screen_size.
+    cache: Rendered-image cache; None disables caching.
+
+  Returns:
+    The marked screenshot as a read-only array shared with the cache. Copy it
+    before drawing on it (e.g. add_screenshot_label).
+  """
+  pixels, shape, image_key = _screenshot_source(screenshot)
+  indices, boxes = ui_element_mark_boxes(
+      ui_elements,
+      logical_screen_size,
+      physical_frame_boundary,
+      orientation,
+      shape,
+      screen_width_height_px,
+  )
+  marks_key = hashlib.blake2b(
+      indices.tobytes() + boxes.tobytes(), digest_size=16
+  ).hexdigest()
+  key = (image_key, marks_key, tuple(physical_frame_boundary))
+  if cache is not None:
+    cached = cache.get(key)
+    if cached is not None:
+      return cached
+  if callable(pixels):
+    pixels = pixels()
+  marked = np.array(pixels, dtype=np.uint8, copy=True)
+  draw_ui_element_marks(marked, indices, boxes, physical_frame_boundary)
+  if cache is not None:
+    cache.put(key, marked)
+  return marked
+
+
 def add_screenshot_label(screenshot: np.ndarray, label: str):
   """Add a text label to the right bottom of the screenshot.
 
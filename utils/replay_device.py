@@ -0,0 +1,263 @@
+"""
+离线回放设备：用已保存的 result/ 轨迹模拟一台手机，实现评测框架用到的 uiautomator2 子集
+（screenshot、dump_hierarchy、click、swipe、press、send_keys、app_stop_all、shell 等），
+各操作按配置注入延迟，使 base_agent / TaskExecutor / llm_core 的完整流程可以在没有手机的机器上跑通、做性能测试。
+
+回放规则：
+- 每个 trajectory.json 是一段录像（episode），帧为各步的 step_N.png 与对应 XML（经 artifact_store 的哈希或旧格式 step_N.xml）；
+- shell("am start -n pkg/activity") 启动 app 时，按包名轮流选取该 app 的录像（没有则轮流选取任意录像），从第一帧开始；
+- 截图之后的第一个输入操作（点击、滑动、按键、输入）前进一帧，同一步内的多次输入（输入文字后回车）只前进一次，
+  到最后一帧后停住；
+- 回放的内容与模型输出无关，只用于衡量框架本身的开销，评估结果没有意义。
+
+在 main_task / bench_run 中把设备序列号写成 replay:<结果目录> 即可使用，可附带延迟配置（秒）；
+多台回放设备以 #名称 区分（调度器按序列号区分设备）：
+    python main_task.py --serial replay:result/round1 --model_name uitars_1_5
+    python main_task.py --serial "replay:result/round1#a,replay:result/round1#b" --model_name uitars_1_5
+    python bench_run.py --serial "replay:result/round1?scale=0.5&dump_hierarchy=2.0" --sample 20
+配合 llm_core/mock_openai_server.py（endpoints.json 指向本地 mock 服务）即可在 CI 中端到端压测。
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import numpy as np
+from PIL import Image
+
+from utils import artifact_store, hierarchy
+
+SERIAL_PREFIX = "replay:"
+
+# 操作 -> 注入的延迟（秒），取值接近真机上的典型耗时；scale 整体缩放，0 表示不注入
+DEFAULT_LATENCY: Dict[str, float] = {
+    "screenshot": 0.3,
+    "dump_hierarchy": 1.0,
+    "click": 0.1,
+    "swipe": 0.6,
+    "press": 0.1,
+    "send_keys": 0.3,
+    "app_stop_all": 1.0,
+    "app_start": 1.0,
+    "shell": 0.05,
+}
+
+HOME_FOCUS = "com.android.launcher3/com.android.launcher3.uioverride.QuickstepLauncher"
+
+# 与 uiautomator2 的 ShellResponse 相同的字段
+ShellResponse = namedtuple("ShellResponse", ["output", "exit_code"])
+
+
+class Episode:
+    """一条已保存轨迹的帧序列：[(截图路径, XML 路径, XML 哈希)]。"""
+
+    def __init__(self, task_dir: str, data: dict):
+        self.task_dir = task_dir
+        self.task_id = data.get("task_id") or os.path.basename(task_dir)
+        self.app = data.get("app") or "unknown"
+        refs = data.get("history_artifacts") or []
+        root = artifact_store.resolve_root(data, task_dir) if refs else None
+        store = artifact_store.get_store(root) if root is not None else None
+        self.frames: List[Tuple[str, str, Optional[str]]] = []
+        for i, recorded in enumerate(data.get("history_image_path") or []):
+            ref = refs[i] if i < len(refs) else {}
+            # agent 记录的路径带 Windows 分隔符（在 Linux 上是文件名的一部分），依次尝试；都缺失时直接读存储中的对象
+            candidates = [os.path.join(task_dir, f"step_{i + 1}.png"), recorded, recorded.replace("\\", os.sep)]
+            if store is not None and ref.get("png"):
+                candidates.append(str(store.image_path(ref["png"])))
+            image_path = next((p for p in candidates if os.path.exists(p)), candidates[-1])
+            xml_path = image_path[:-len(".png")] + ".xml"
+            self.frames.append((image_path, xml_path, ref.get("xml")))
+        self.root = root
+
+
+# 解码后的整屏 RGB 约 8MB 一帧，只缓存最近几帧：同一帧在一步内会被截图多次（settle 检测、观察），跨步复用很少
+@lru_cache(maxsize=4)
+def _load_image(path: str) -> Image.Image:
+    with Image.open(path) as image:
+        return image.convert("RGB")
+
+
+class ReplayDevice:
+    """
+    回放设备。同一结果目录可以同时开多个实例（多个设备 worker），各自独立推进。
+
+    Args:
+        result_dir: 结果目录（result/<run>）或单个任务目录
+        latency: 覆盖 DEFAULT_LATENCY 中的部分操作
+        scale: 所有注入延迟的倍数
+    """
+
+    def __init__(self, result_dir: str, latency: Optional[Dict[str, float]] = None, scale: float = 1.0,
+                 serial: Optional[str] = None):
+        self.serial = serial or f"{SERIAL_PREFIX}{result_dir}"
+        self.latency = dict(DEFAULT_LATENCY, **(latency or {}))
+        self.scale = scale
+        self.episodes = load_episodes(result_dir)
+        if not self.episodes:
+            raise RuntimeError(f"{result_dir} 下没有可回放的轨迹")
+        self._by_app: Dict[str, List[Episode]] = {}
+        for episode in self.episodes:
+            self._by_app.setdefault(episode.app, []).append(episode)
+        self._cursor: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.episode: Optional[Episode] = None
+        self.frame = 0
+        self.focus = HOME_FOCUS
+        self._observed = False
+        # 最近收到的操作，便于检查 agent 实际执行了什么
+        self.actions: "deque[tuple]" = deque(maxlen=1000)
+
+    # ---------- 回放状态 ----------
+
+    def _sleep(self, op: str):
+        cost = self.latency.get(op, 0.0) * self.scale
+        if cost > 0:
+            time.sleep(cost)
+
+    def _next_episode(self, package: str) -> Episode:
+        key = package if package in self._by_app else ""
+        pool = self._by_app[key] if key else self.episodes
+        index = self._cursor.get(key, 0)
+        self._cursor[key] = index + 1
+        return pool[index % len(pool)]
+
+    def _current_frame(self) -> Tuple[str, str, Optional[str]]:
+        episode = self.episode or self.episodes[0]
+        return episode.frames[min(self.frame, len(episode.frames) - 1)]
+
+    def _input(self, *action):
+        with self._lock:
+            self.actions.append(action)
+            # 截图之后的第一个输入前进一帧
+            if self._observed and self.episode is not None:
+                self.frame = min(self.frame + 1, len(self.episode.frames) - 1)
+                self._observed = False
+
+    # ---------- uiautomator2 子集 ----------
+
+    @property
+    def info(self) -> dict:
+        return {"serial": self.serial, "replay": True, "episodes": len(self.episodes)}
+
+    def screenshot(self, format: str = "pillow"):
+        self._sleep("screenshot")
+        with self._lock:
+            image_path = self._current_frame()[0]
+            self._observed = True
+        image = _load_image(image_path).copy()
+        if format == "opencv":
+            return np.asarray(image)[..., ::-1].copy()
+        return image
+
+    def dump_hierarchy(self, compressed: bool = False, pretty: bool = False, max_depth: Optional[int] = None) -> str:
+        self._sleep("dump_hierarchy")
+        with self._lock:
+            _, xml_path, digest = self._current_frame()
+            root = (self.episode or self.episodes[0]).root
+        return artifact_store.read_text(xml_path, digest, root)
+
+    def click(self, x, y):
+        self._sleep("click")
+        self._input("click", x, y)
+
+    def double_click(self, x, y, duration: float = 0.1):
+        self._sleep("click")
+        self._input("double_click", x, y)
+
+    def long_click(self, x, y, duration: float = 0.5):
+        self._sleep("click")
+        self._input("long_click", x, y)
+
+    def swipe(self, fx, fy, tx, ty, duration: Optional[float] = None, steps: Optional[int] = None):
+        self._sleep("swipe")
+        self._input("swipe", fx, fy, tx, ty)
+
+    def press(self, key):
+        self._sleep("press")
+        self._input("press", key)
+
+    def send_keys(self, text: str, clear: bool = False):
+        self._sleep("send_keys")
+        self._input("send_keys", text)
+
+    def set_input_ime(self, enable: bool = True):
+        pass
+
+    def app_stop_all(self, excludes: Optional[List[str]] = None) -> List[str]:
+        self._sleep("app_stop_all")
+        with self._lock:
+            self.actions.append(("app_stop_all",))
+            self.episode, self.frame, self.focus = None, 0, HOME_FOCUS
+        return []
+
+    def app_stop(self, package: str):
+        self.app_stop_all()
+
+    def push(self, src, dst: str, mode: int = 0o644):
+        # app_reset 推送数据快照；回放设备没有 app 数据，只记录
+        with self._lock:
+            self.actions.append(("push", str(src), dst))
+
+    def shell(self, cmdargs, timeout: float = 60) -> ShellResponse:
+        command = cmdargs if isinstance(cmdargs, str) else " ".join(cmdargs)
+        if command.startswith("am start"):
+            self._sleep("app_start")
+            activity = command.split()[-1]
+            with self._lock:
+                self.actions.append(("app_start", activity))
+                self.episode = self._next_episode(hierarchy.app_of(activity))
+                self.frame, self._observed = 0, False
+                self.focus = activity if "/" in activity else f"{self.episode.app}/.MainActivity"
+            return ShellResponse(f"Starting: Intent {{ cmp={activity} }}\n", 0)
+        self._sleep("shell")
+        if command.startswith("pm clear"):
+            return ShellResponse("Success\n", 0)
+        if "mCurrentFocus" in command:
+            with self._lock:
+                focus = self.focus
+            return ShellResponse(f"  mCurrentFocus=Window{{1a2b3c u0 {focus}}}\n", 0)
+        return ShellResponse("", 0)
+
+
+def load_episodes(result_dir: str) -> List[Episode]:
+    """读取结果目录（或单个任务目录）下有截图的轨迹，按任务目录排序。"""
+    paths = [os.path.join(result_dir, "trajectory.json")]
+    if not os.path.exists(paths[0]):
+        paths = sorted(glob.glob(os.path.join(result_dir, "*", "trajectory.json")))
+    episodes = []
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[Replay] 跳过无法读取的轨迹 {path}: {e}")
+            continue
+        episode = Episode(os.path.dirname(path), data)
+        if episode.frames and os.path.exists(episode.frames[0][0]):
+            episodes.append(episode)
+    return episodes
+
+
+def is_replay(serial: str) -> bool:
+    return serial.startswith(SERIAL_PREFIX)
+
+
+def connect(serial: str) -> ReplayDevice:
+    """按 replay:<结果目录>[?操作=秒&scale=倍数][#名称] 创建回放设备。"""
+    spec = serial[len(SERIAL_PREFIX):].partition("#")[0]
+    result_dir, _, query = spec.partition("?")
+    options = {key: float(value) for key, value in parse_qsl(query)}
+    scale = options.pop("scale", 1.0)
+    unknown = set(options) - set(DEFAULT_LATENCY)
+    if unknown:
+        raise ValueError(f"unknown replay latency {sorted(unknown)}, expected: {', '.join(DEFAULT_LATENCY)}")
+    device = ReplayDevice(result_dir, latency=options, scale=scale, serial=serial)
+    print(f"[Replay] {result_dir}: {len(device.episodes)} 条轨迹，延迟倍数 {scale}")
+    return device
@@ -15,8 +15,11 @@
 """Tools for processing and representing accessibility trees."""
 
 import dataclasses
-from typing import Any, Optional
-import xml.etree.ElementTree as ET
+import sys
+from typing import Any, Iterator, Optional
+
+import lxml.etree
+import numpy as np
 #from android_env.proto.a11y import android_accessibility_forest_pb2
 
 
@@ -75,6 +78,9 @@ class UIElement:
   tooltip: Optional[str] = None
   resource_id: Optional[str] = None
   metadata: Optional[dict[str, Any]] = None
+  # Pre-order index of the node in the dump and of its parent (None for root).
+  self_id: Optional[int] = None
+  parent_id: Optional[int] = None
 
 
 def accessibility_node_to_ui_element(
@@ -169,57 +175,233 @@ def forest_to_ui_elements(
   return elements
 
 
-def _parse_ui_hierarchy(xml_string: str) -> dict[str, Any]:
-  """Parses the UI hierarchy XML into a dictionary structure."""
-  root = ET.fromstring(xml_string)
+# uiautomator boolean attributes, in UIElementTable.flags column order.
+_FLAG_ATTRIBUTES = (
+    ('is_checked', 'checked'),
+    ('is_checkable', 'checkable'),
+    ('is_clickable', 'clickable'),
+    ('is_enabled', 'enabled'),
+    ('is_focused', 'focused'),
+    ('is_focusable', 'focusable'),
+    ('is_long_clickable', 'long-clickable'),
+    ('is_scrollable', 'scrollable'),
+    ('is_selected', 'selected'),
+)
+FLAG_COLUMNS = {name: column for column, (name, _) in enumerate(_FLAG_ATTRIBUTES)}
+
+
+class _StringPool:
+  """Interns repeated strings (class, package, resource-id) as int32 codes."""
+
+  def __init__(self):
+    self.values: list[str] = []
+    self._codes: dict[str, int] = {}
+
+  def code(self, value: Optional[str]) -> int:
+    if value is None:
+      return -1
+    code = self._codes.get(value)
+    if code is None:
+      code = self._codes[value] = len(self.values)
+      self.values.append(sys.intern(value))
+    return code
+
+  def get(self, code: int) -> Optional[str]:
+    return None if code < 0 else self.values[code]
+
+
+class _TableBuilder:
+  """lxml parser target collecting one row per start tag."""
+
+  _FLAG_NAMES = tuple(attribute for _, attribute in _FLAG_ATTRIBUTES)
+
+  def __init__(self):
+    self.classes, self.packages, self.resource_ids = _StringPool(), _StringPool(), _StringPool()
+    self.parent, self.class_codes, self.package_codes, self.resource_id_codes = [], [], [], []
+    self.texts, self.content_descriptions, self.bounds, self.flags = [], [], [], []
+    self._stack = []
+
+  def start(self, tag, attrib):
+    get = attrib.get
+    self.parent.append(self._stack[-1] if self._stack else -1)
+    self._stack.append(len(self.texts))
+    self.texts.append(get('text'))
+    self.content_descriptions.append(get('content-desc'))
+    self.class_codes.append(self.classes.code(get('class')))
+    self.package_codes.append(self.packages.code(get('package')))
+    self.resource_id_codes.append(self.resource_ids.code(get('resource-id')))
+    self.bounds.append(get('bounds') or '')
+    self.flags.extend(map(get, self._FLAG_NAMES))
+
+  def end(self, tag):
+    self._stack.pop()
+
+  def data(self, data):
+    pass
+
+  def close(self):
+    return None
+
+
+class UIElementTable:
+  """Columnar table of all nodes in a uiautomator dump.
+
+  Rows are nodes in document (pre-order) order; row 0 is the <hierarchy> root.
+  Bounds, flags and parent links are NumPy arrays; class / package /
+  resource-id are interned and stored as codes; text and content-desc stay
+  plain lists. Individual rows are exposed as UIElementView objects, which
+  read like UIElement.
+
+  Attributes:
+    bounds: int32 array (n, 4) as [x_min, x_max, y_min, y_max].
+    has_bounds: bool array (n,), False where the node has no bounds attribute.
+    flags: bool array (n, len(FLAG_COLUMNS)).
+    parent: int32 array (n,), -1 for the root.
+  """
+
+  def __init__(self, xml_string: str | bytes):
+    data = xml_string.encode('utf-8') if isinstance(xml_string, str) else xml_string
+    builder = _TableBuilder()
+    # Streaming parse: the target receives each start tag's attributes; no
+    # element tree is built.
+    lxml.etree.fromstring(data, lxml.etree.XMLParser(target=builder, huge_tree=True))
+
+    n = len(builder.texts)
+    self.parent = np.array(builder.parent, dtype=np.int32)
+    self.class_codes = np.array(builder.class_codes, dtype=np.int32)
+    self.package_codes = np.array(builder.package_codes, dtype=np.int32)
+    self.resource_id_codes = np.array(builder.resource_id_codes, dtype=np.int32)
+    self.flags = (np.array(builder.flags, dtype=object).reshape(n, len(_FLAG_ATTRIBUTES)) == 'true')
+    bounds = builder.bounds
+    self.has_bounds = np.array([bool(b) for b in bounds], dtype=bool)
+    # "[x1,y1][x2,y2]" for all nodes parsed in one go.
+    joined = ','.join(b[1:-1].replace('][', ',') if b else '0,0,0,0' for b in bounds)
+    corners = np.array(joined.split(','), dtype=np.int32).reshape(n, 4) if n else np.zeros((0, 4), np.int32)
+    self.bounds = corners[:, [0, 2, 1, 3]]
+    self.texts = builder.texts
+    self.content_descriptions = builder.content_descriptions
+    self.classes = builder.classes
+    self.packages = builder.packages
+    self.resource_ids = builder.resource_ids
+    # lxml may keep the parser target referenced; drop the per-attribute scratch lists.
+    builder.flags = builder.bounds = None
+
+  @classmethod
+  def from_xml(cls, xml_string: str | bytes) -> 'UIElementTable':
+    return cls(xml_string)
+
+  def __len__(self) -> int:
+    return len(self.texts)
+
+  def __getitem__(self, index: int) -> 'UIElementView':
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise IndexError('element index out of range')
+    return UIElementView(self, index)
+
+  def __iter__(self) -> Iterator['UIElementView']:
+    return (UIElementView(self, i) for i in range(len(self)))
+
+  def flag(self, name: str) -> np.ndarray:
+    """Boolean column for a UIElement flag name, e.g. 'is_clickable'."""
+    return self.flags[:, FLAG_COLUMNS[name]]
+
+  def children(self, index: int) -> np.ndarray:
+    return np.flatnonzero(self.parent == index)
+
+  def contains_point(self, x: float, y: float) -> np.ndarray:
+    """Mask of nodes whose bounds contain (x, y)."""
+    b = self.bounds
+    return self.has_bounds & (b[:, 0] <= x) & (x <= b[:, 1]) & (b[:, 2] <= y) & (y <= b[:, 3])
+
+  def to_ui_elements(self, include_root: bool = False) -> list['UIElementView']:
+    start = 0 if include_root else 1
+    return [UIElementView(self, i) for i in range(start, len(self))]
+
+
+def _flag_property(name: str) -> property:
+  column = FLAG_COLUMNS[name]
+  return property(lambda self: bool(self._table.flags[self.index, column]))
+
+
+class UIElementView:
+  """Read-only UIElement-compatible view of one UIElementTable row."""
+
+  __slots__ = ('_table', 'index', '_bbox')
+
+  # Fields never present in a uiautomator dump.
+  hint_text = None
+  is_editable = None
+  resource_name = None
+  tooltip = None
+  metadata = None
+  is_visible = True
+
+  def __init__(self, table: UIElementTable, index: int):
+    self._table = table
+    self.index = index
+    self._bbox = None
+
+  @property
+  def text(self) -> Optional[str]:
+    return self._table.texts[self.index]
+
+  @property
+  def content_description(self) -> Optional[str]:
+    return self._table.content_descriptions[self.index]
+
+  @property
+  def class_name(self) -> Optional[str]:
+    return self._table.classes.get(self._table.class_codes[self.index])
 
-  def parse_node(node):
-    result = node.attrib
-    result['children'] = [parse_node(child) for child in node]
-    return result
+  @property
+  def package_name(self) -> Optional[str]:
+    return self._table.packages.get(self._table.package_codes[self.index])
 
-  return parse_node(root)
+  @property
+  def resource_id(self) -> Optional[str]:
+    return self._table.resource_ids.get(self._table.resource_id_codes[self.index])
+
+  @property
+  def bbox(self) -> Optional[BoundingBox]:
+    if self._bbox is None and self._table.has_bounds[self.index]:
+      self._bbox = BoundingBox(*(int(v) for v in self._table.bounds[self.index]))
+    return self._bbox
+
+  bbox_pixels = bbox
+
+  @property
+  def self_id(self) -> int:
+    return self.index
+
+  @property
+  def parent_id(self) -> Optional[int]:
+    parent = int(self._table.parent[self.index])
+    return None if parent < 0 else parent
+
+  is_checked = _flag_property('is_checked')
+  is_checkable = _flag_property('is_checkable')
+  is_clickable = _flag_property('is_clickable')
+  is_enabled = _flag_property('is_enabled')
+  is_focused = _flag_property('is_focused')
+  is_focusable = _flag_property('is_focusable')
+  is_long_clickable = _flag_property('is_long_clickable')
+  is_scrollable = _flag_property('is_scrollable')
+  is_selected = _flag_property('is_selected')
+
+  def to_element(self) -> UIElement:
+    """Materializes a standalone (mutable) UIElement."""
+    return UIElement(**{f.name: getattr(self, f.name) for f in dataclasses.fields(UIElement)})
+
+  def __repr__(self) -> str:
+    return f'UIElementView({self.index}, class_name={self.class_name!r}, text={self.text!r})'
 
 
 def xml_dump_to_ui_elements(xml_string: str) -> list[UIElement]:
-  """Converts a UI hierarchy XML dump from uiautomator dump to UIElements."""
-  parsed_hierarchy = _parse_ui_hierarchy(xml_string)
-  ui_elements = []
-
-  def process_node(node, is_root):
-    bounds = node.get('bounds')
-    if bounds:
-      x_min, y_min, x_max, y_max = map(
-          int, bounds.strip('[]').replace('][', ',').split(',')
-      )
-      bbox = BoundingBox(x_min, x_max, y_min, y_max)
-    else:
-      bbox = None
-
-    ui_element = UIElement(
-        text=node.get('text'),
-        content_description=node.get('content-desc'),
-        class_name=node.get('class'),
-        bbox=bbox,
-        bbox_pixels=bbox,
-        is_checked=node.get('checked') == 'true',
-        is_checkable=node.get('checkable') == 'true',
-        is_clickable=node.get('clickable') == 'true',
-        is_enabled=node.get('enabled') == 'true',
-        is_focused=node.get('focused') == 'true',
-        is_focusable=node.get('focusable') == 'true',
-        is_long_clickable=node.get('long-clickable') == 'true',
-        is_scrollable=node.get('scrollable') == 'true',
-        is_selected=node.get('selected') == 'true',
-        package_name=node.get('package'),
-        resource_id=node.get('resource-id'),
-        is_visible=True,
-    )
-    if not is_root:
-      ui_elements.append(ui_element)
-
-    for child in node.get('children', []):
-      process_node(child, is_root=False)
-
-  process_node(parsed_hierarchy, is_root=True)
-  return ui_elements
+  """Converts a UI hierarchy XML dump from uiautomator dump to UIElements.
+
+  Returns UIElementView rows of a UIElementTable (root excluded); they expose
+  the same attributes as UIElement.
+  """
+  return UIElementTable.from_xml(xml_string).to_ui_elements()
@@ -0,0 +1,216 @@
+"""
+评测结果日志：追加写入的 results.jsonl，替代每保存一个任务就整体重写一次的 result_list.txt。
+
+- 每条结果一行 JSON（task_id / success / attempt / model / timings ...），一次 O_APPEND 写入，O(1)；
+- 多线程由锁串行，多进程共享同一目录时在支持 fcntl 的系统上加文件锁，行与行不会交错；
+- 崩溃时最多留下最后一行不完整，加载时跳过；同一任务多条记录以最后一条为准；
+- 续跑只需要每个任务的 task_id / success：它们总是每行的前两个字段，用一个预编译正则整块扫出，
+  不做逐行 json 解析；完整记录（latest / history）按需解析。之后按文件偏移增量读取其他进程追加的记录；
+- 目录中只有旧的 result_list.txt 时，首次打开自动迁移。
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows：只有进程内的锁
+    fcntl = None
+
+RESULTS_FILE = "results.jsonl"
+LEGACY_FILE = "result_list.txt"
+
+# append() 写出的每一行都以这两个字段开头
+_HEAD = re.compile(rb'^\{"task_id": "((?:[^"\\\n]|\\.)*)", "success": (true|false)', re.M)
+
+
+@dataclass
+class ResultRecord:
+    task_id: str
+    success: bool
+    attempt: Optional[int] = None
+    model: Optional[str] = None
+    steps: Optional[int] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    written_at: float = field(default_factory=time.time)
+    migrated: bool = False
+
+
+def read_legacy_result_list(path: Path) -> Dict[str, bool]:
+    """旧格式：空格分隔的 "task_id,True" 列表。"""
+    text = path.read_text(encoding="utf-8").strip()
+    results = {}
+    for item in text.split(" "):
+        if not item:
+            continue
+        task_id, _, flag = item.rpartition(",")
+        results[task_id] = flag.lower() == "true"
+    return results
+
+
+def _unescape(task_id: bytes) -> str:
+    return json.loads(b'"' + task_id + b'"') if b"\\" in task_id else task_id.decode("utf-8")
+
+
+class ResultStore:
+    """base_dir/results.jsonl 的读写；被同一进程的所有设备 worker 共享。"""
+
+    def __init__(self, base_dir: Path, model: Optional[str] = None, fsync: bool = True):
+        self.base_dir = Path(base_dir)
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.base_dir / RESULTS_FILE
+        self.model = model
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._success: Dict[str, bool] = {}
+        self._offset = 0
+        self._partial = b""
+        if not self.path.exists() and (self.base_dir / LEGACY_FILE).exists():
+            self._migrate_legacy()
+        self.refresh()
+
+    # ---------- 读 ----------
+
+    def refresh(self) -> int:
+        """读取上次之后追加的记录（含其他进程写入的），返回新读到的条数。"""
+        with self._lock:
+            return self._read_new()
+
+    def _read_new(self) -> int:
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return 0
+        if size <= self._offset:
+            return 0
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = self._partial + f.read(size - self._offset)
+        self._offset = size
+        # 最后一段没有换行：可能是另一个进程正在写的行，留到下次再读
+        end = data.rfind(b"\n") + 1
+        data, self._partial = data[:end], data[end:]
+        heads = _HEAD.findall(data)
+        if len(heads) == data.count(b"\n") - data.count(b"\n\n"):
+            for task_id, success in heads:
+                self._success[_unescape(task_id)] = success == b"true"
+            return len(heads)
+        # 有手工编辑或损坏的行：逐行解析
+        count = 0
+        for line in data.split(b"\n"):
+            record = self._decode(line)
+            if record is not None:
+                self._success[record.task_id] = record.success
+                count += 1
+        return count
+
+    @staticmethod
+    def _decode(line: bytes) -> Optional[ResultRecord]:
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            raw = json.loads(line)
+            return ResultRecord(**{k: v for k, v in raw.items() if k in ResultRecord.__dataclass_fields__})
+        except (ValueError, TypeError):
+            print(f"[ResultStore] 跳过损坏的记录: {line[:80]!r}")
+            return None
+
+    def __contains__(self, task_id: str) -> bool:
+        with self._lock:
+            if task_id not in self._success:
+                self._read_new()
+            return task_id in self._success
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._success)
+
+    def results(self) -> Dict[str, bool]:
+        """task_id -> 最后一次的 success。"""
+        with self._lock:
+            self._read_new()
+            return dict(self._success)
+
+    def latest(self) -> Dict[str, ResultRecord]:
+        """每个任务的最后一条完整记录（解析整个文件）。"""
+        return {record.task_id: record for record in self.history()}
+
+    def history(self) -> Iterator[ResultRecord]:
+        """按写入顺序遍历全部记录（包括同一任务的多次尝试）。"""
+        if not self.path.exists():
+            return
+        with open(self.path, "rb") as f:
+            for line in f:
+                record = self._decode(line) if line.endswith(b"\n") else None
+                if record is not None:
+                    yield record
+
+    # ---------- 写 ----------
+
+    def append(self, record: ResultRecord):
+        if record.model is None:
+            record.model = self.model
+        data = (json.dumps(asdict(record), ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    # 上一次写入中途崩溃留下的半行：另起一行，不把本条拼接进去
+                    if os.lseek(fd, 0, os.SEEK_END) > 0:
+                        os.lseek(fd, -1, os.SEEK_END)
+                        if os.read(fd, 1) != b"\n":
+                            data = b"\n" + data
+                    os.write(fd, data)
+                    if self.fsync:
+                        os.fsync(fd)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(fd, fcntl.LOCK_UN)
+            finally:
+                os.close(fd)
+            # 先读入其他进程在此之前追加的记录，本条随后也会被读到
+            self._read_new()
+
+    def record(self, task_id: str, success: bool, **fields: Any) -> ResultRecord:
+        record = ResultRecord(task_id=task_id, success=success, **fields)
+        self.append(record)
+        return record
+
+    def _migrate_legacy(self):
+        legacy = self.base_dir / LEGACY_FILE
+        results = read_legacy_result_list(legacy)
+        lines = [json.dumps(asdict(ResultRecord(task_id, success, migrated=True)), ensure_ascii=False)
+                 for task_id, success in results.items()]
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+        try:
+            # link 在目标已存在时失败：另一个进程先迁移完成则保留它的结果
+            os.link(tmp, self.path)
+            print(f"[ResultStore] 已从 {legacy} 迁移 {len(lines)} 条结果到 {self.path}")
+        except FileExistsError:
+            pass
+        finally:
+            tmp.unlink()
+
+    # ---------- 统计 ----------
+
+    def pass_rate(self) -> float:
+        results = self.results()
+        if not results:
+            return 0.0
+        return sum(results.values()) * 100 / len(results)
+
+    def attempts(self) -> Dict[str, List[ResultRecord]]:
+        grouped: Dict[str, List[ResultRecord]] = {}
+        for record in self.history():
+            grouped.setdefault(record.task_id, []).append(record)
+        return grouped
@@ -0,0 +1,150 @@
+"""界面稳定检测：轮询廉价信号直到屏幕稳定或超时，替代固定的 time.sleep。"""
+
+import hashlib
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+@dataclass
+class SettleProfile:
+    timeout: float = 3.0       # 最长等待时间（即原来的固定 sleep 上限）
+    min_wait: float = 0.3      # 动作后至少等待的时间，避免动画尚未开始就判定稳定
+    stable_polls: int = 2      # 连续多少次采样信号不变视为稳定
+    interval: float = 0.25     # 采样间隔
+
+
+# 动作类型 -> 等待配置；未配置的动作使用 "default"
+DEFAULT_PROFILES: Dict[str, SettleProfile] = {
+    "default": SettleProfile(),
+    "clear_background": SettleProfile(timeout=5.0),
+    "launch_app": SettleProfile(timeout=8.0, min_wait=1.5, stable_polls=3),
+    # 已通过焦点 activity 确认 app 在前台；焦点切换早于首屏加载完成，仍按 launch_app 的最短等待与稳定次数
+    "app_ready": SettleProfile(timeout=8.0, min_wait=1.5, stable_polls=3),
+    "before_evaluate": SettleProfile(timeout=3.0, min_wait=0.0),
+    "type": SettleProfile(timeout=3.0, min_wait=0.5),
+    "swipe": SettleProfile(timeout=3.0, min_wait=0.5),
+    "scroll": SettleProfile(timeout=3.0, min_wait=0.5),
+    "wait": SettleProfile(timeout=2.0, min_wait=0.0),
+}
+
+_FOCUS_PATTERN = re.compile(r"mCurrentFocus=Window\{[^}]*\s(\S+)\}")
+
+
+def current_focus(d) -> Optional[str]:
+    """通过 dumpsys window 获取当前焦点窗口（形如 pkg/activity），失败返回 None。"""
+    try:
+        output = d.shell("dumpsys window | grep mCurrentFocus").output
+    except Exception:
+        return None
+    match = _FOCUS_PATTERN.search(output)
+    return match.group(1) if match else None
+
+
+def screenshot_thumbnail(d, scale: int = 8) -> Optional[np.ndarray]:
+    """截图并缩小为灰度小图，用于廉价的画面差异比较。"""
+    try:
+        image = d.screenshot()
+    except Exception:
+        return None
+    small = image.convert("L").resize((max(1, image.width // scale), max(1, image.height // scale)))
+    return np.asarray(small, dtype=np.int16)
+
+
+class SettleDetector:
+    """
+    轮询 activity / 截图差异 / 控件树哈希，连续 stable_polls 次不变即认为界面已稳定。
+
+    Args:
+        profiles: 覆盖默认的 {动作类型: SettleProfile}，也可以直接传秒数作为 timeout。
+        signals: 参与判断的信号，可选 "activity"、"screenshot"、"hierarchy"（dump 较慢，默认关闭）。
+        diff_threshold: 缩略图平均像素差小于该值视为画面未变化（0~255）。
+    """
+
+    def __init__(
+        self,
+        profiles: Optional[Dict[str, "SettleProfile | float"]] = None,
+        signals: Tuple[str, ...] = ("activity", "screenshot"),
+        diff_threshold: float = 2.0,
+    ):
+        self.profiles: Dict[str, SettleProfile] = dict(DEFAULT_PROFILES)
+        for name, value in (profiles or {}).items():
+            if isinstance(value, SettleProfile):
+                self.profiles[name] = value
+            else:
+                base = self.profiles.get(name, self.profiles["default"])
+                self.profiles[name] = SettleProfile(float(value), base.min_wait, base.stable_polls, base.interval)
+        self.signals = signals
+        self.diff_threshold = diff_threshold
+        # 按动作类型累计的等待次数 / 总耗时 / 超时次数，进程内一直运行也不会增长
+        self._stats: Dict[str, Dict[str, float]] = {}
+        # 最近的 (label, 实际等待秒数, 是否稳定) 记录，便于调参
+        self.records: "deque[Tuple[str, float, bool]]" = deque(maxlen=256)
+
+    def profile(self, label: str) -> SettleProfile:
+        return self.profiles.get(label, self.profiles["default"])
+
+    def _sample(self, d):
+        signature = []
+        thumb = None
+        if "activity" in self.signals:
+            signature.append(current_focus(d))
+        if "hierarchy" in self.signals:
+            try:
+                signature.append(hashlib.md5(d.dump_hierarchy().encode("utf-8")).hexdigest())
+            except Exception:
+                signature.append(None)
+        if "screenshot" in self.signals:
+            thumb = screenshot_thumbnail(d)
+        return tuple(signature), thumb
+
+    def _same(self, prev, cur) -> bool:
+        prev_sig, prev_thumb = prev
+        cur_sig, cur_thumb = cur
+        if prev_sig != cur_sig:
+            return False
+        if prev_thumb is None or cur_thumb is None:
+            return prev_thumb is None and cur_thumb is None
+        if prev_thumb.shape != cur_thumb.shape:
+            return False
+        return float(np.abs(prev_thumb - cur_thumb).mean()) < self.diff_threshold
+
+    def wait(self, d, label: str = "default") -> float:
+        """阻塞直到界面稳定或达到该动作的超时时间，返回实际等待秒数。"""
+        profile = self.profile(label)
+        start = time.monotonic()
+        deadline = start + profile.timeout
+        if profile.min_wait > 0:
+            time.sleep(min(profile.min_wait, profile.timeout))
+
+        stable = False
+        prev = self._sample(d)
+        unchanged = 1
+        while time.monotonic() < deadline:
+            time.sleep(max(0.0, min(profile.interval, deadline - time.monotonic())))
+            cur = self._sample(d)
+            if self._same(prev, cur):
+                unchanged += 1
+                if unchanged >= profile.stable_polls:
+                    stable = True
+                    break
+            else:
+                unchanged = 1
+            prev = cur
+
+        elapsed = time.monotonic() - start
+        self.records.append((label, elapsed, stable))
+        item = self._stats.setdefault(label, {"count": 0, "total": 0.0, "timeouts": 0})
+        item["count"] += 1
+        item["total"] += elapsed
+        item["timeouts"] += 0 if stable else 1
+        print(f"[Settle] {label}: {elapsed:.2f}s ({'stable' if stable else 'timeout'}, limit {profile.timeout:.1f}s)")
+        return elapsed
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """按动作类型汇总等待次数、平均耗时与超时次数。"""
+        return {label: dict(item, mean=item["total"] / item["count"]) for label, item in self._stats.items()}
@@ -0,0 +1,124 @@
+"""
+单步各阶段耗时记录：记录每个阶段的起止时间，用于统计流水线的重叠程度。
+
+agent 在 activate(timer) 期间调用的下层代码（wrapper 的请求构造 / 推理 / 解析、图片编码、后台写盘）
+用模块级的 phase(name) 把耗时记到当前线程的活动计时器上，没有活动计时器时不做任何记录。
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class StepTimer:
+    """
+    记录一个 step 内各阶段的 (名称, 开始, 结束, 线程名)。
+
+    阶段可能在多个线程里并行执行：busy 为各阶段耗时之和，wall 为最早开始到最晚结束的跨度，
+    overlapped = busy - wall 即被并行掉的时间。
+    同一线程内嵌套的阶段（如 request_build 中的 encode）只计入最内层，外层阶段扣除嵌套部分。
+    """
+
+    def __init__(self, step: int):
+        self.step = step
+        self.spans: List[Tuple[str, float, float, str]] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, end: float):
+        with self._lock:
+            self.spans.append((name, start, end, threading.current_thread().name))
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter())
+
+    def timed(self, name: str, fn: Callable, *args, **kwargs) -> Any:
+        """执行 fn 并记为一个阶段，便于直接提交到线程池。"""
+        with self.phase(name):
+            return fn(*args, **kwargs)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = list(self.spans)
+        phases: Dict[str, float] = {}
+        for (name, _, _, _), cost in zip(spans, _exclusive(spans)):
+            phases[name] = phases.get(name, 0.0) + cost
+        wall = max(s[2] for s in spans) - min(s[1] for s in spans) if spans else 0.0
+        busy = sum(phases.values())
+        return {
+            "step": self.step,
+            "wall": round(wall, 4),
+            "busy": round(busy, 4),
+            "overlapped": round(max(0.0, busy - wall), 4),
+            "phases": {k: round(v, 4) for k, v in phases.items()},
+        }
+
+    def export(self, origin: float) -> Dict[str, Any]:
+        """summary() 加上各阶段相对 origin（任务开始时刻）的 [名称, 开始, 结束, 线程]，写入 Trajectory.step_timings。"""
+        info = self.summary()
+        with self._lock:
+            info["spans"] = [[name, round(start - origin, 6), round(end - origin, 6), thread]
+                             for name, start, end, thread in self.spans]
+        return info
+
+    def report(self) -> Dict[str, Any]:
+        info = self.summary()
+        phases = " ".join(f"{k} {v:.2f}" for k, v in info["phases"].items())
+        ratio = info["overlapped"] / info["busy"] * 100 if info["busy"] else 0.0
+        print(f"[Timing] step {info['step']}: wall {info['wall']:.2f}s, busy {info['busy']:.2f}s, "
+              f"overlapped {info['overlapped']:.2f}s ({ratio:.0f}%) | {phases}")
+        return info
+
+
+def _exclusive(spans: List[Tuple[str, float, float, str]]) -> List[float]:
+    """每个阶段扣除同一线程内直接嵌套在其中的阶段后的耗时，顺序与 spans 相同。"""
+    costs = [end - start for _, start, end, _ in spans]
+    by_thread: Dict[str, List[int]] = {}
+    for i, span in enumerate(spans):
+        by_thread.setdefault(span[3], []).append(i)
+    for indices in by_thread.values():
+        indices.sort(key=lambda i: (spans[i][1], -spans[i][2]))
+        stack: List[int] = []
+        for i in indices:
+            while stack and spans[stack[-1]][2] <= spans[i][1]:
+                stack.pop()
+            if stack:
+                costs[stack[-1]] -= spans[i][2] - spans[i][1]
+            stack.append(i)
+    return [max(0.0, cost) for cost in costs]
+
+
+_active = threading.local()
+
+
+def current() -> Optional[StepTimer]:
+    """当前线程的活动计时器。"""
+    return getattr(_active, "timer", None)
+
+
+@contextmanager
+def activate(timer: StepTimer):
+    """在当前线程内把 timer 设为活动计时器，期间的 phase() 记录到它上面。"""
+    previous = current()
+    _active.timer = timer
+    try:
+        yield timer
+    finally:
+        _active.timer = previous
+
+
+@contextmanager
+def phase(name: str):
+    """记到当前线程的活动计时器上；没有活动计时器时只执行代码块。"""
+    timer = current()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timer is not None:
+            timer.add(name, start, time.perf_counter())
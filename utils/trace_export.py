@@ -0,0 +1,129 @@
+"""
+把轨迹中记录的各步阶段耗时（Trajectory.step_timings）导出为 Chrome trace（Trace Event Format）JSON，
+可在 chrome://tracing 或 https://ui.perfetto.dev 打开；同时按 app / 模型汇总各阶段的总耗时。
+
+时间线：每台设备一个进程（pid），每个线程一条轨道（agent 主线程、流水线线程、写盘线程……），
+每个任务、每一步各有一段覆盖其全部阶段的父区间。
+
+用法：
+    python -m utils.trace_export --result_dir result/round1,result/round2 --output result/trace.json
+    python -m utils.trace_export --result_dir result/round1 --by app
+"""
+
+import argparse
+import glob
+import json
+import os
+from typing import Any, Dict, Iterable, List, Tuple
+
+# 不是阶段的汇总字段
+_NON_PHASE = ("total",)
+
+
+def load_trajectories(result_dirs: Iterable[str]) -> List[Tuple[str, Dict[str, Any]]]:
+    """读取若干结果目录下的 trajectory.json，返回 [(run, data)]；没有阶段耗时的旧轨迹跳过。"""
+    loaded = []
+    for result_dir in result_dirs:
+        run = os.path.basename(os.path.normpath(result_dir))
+        for path in sorted(glob.glob(os.path.join(result_dir, "*", "trajectory.json"))):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[Trace] 跳过无法读取的轨迹 {path}: {e}")
+                continue
+            if data.get("step_timings") and data.get("started_at") is not None:
+                loaded.append((run, data))
+    return loaded
+
+
+def _us(seconds: float) -> float:
+    return round(seconds * 1e6, 1)
+
+
+def build_trace(trajectories: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+    events: List[Dict[str, Any]] = []
+    pids: Dict[str, int] = {}
+    tids: Dict[Tuple[int, str], int] = {}
+
+    def track(pid: int, thread: str) -> int:
+        key = (pid, thread)
+        if key not in tids:
+            tids[key] = len([k for k in tids if k[0] == pid]) + 1
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tids[key], "args": {"name": thread}})
+        return tids[key]
+
+    for run, data in trajectories:
+        process = f"{run} @ {data.get('device') or '-'}"
+        if process not in pids:
+            pids[process] = len(pids) + 1
+            events.append({"name": "process_name", "ph": "M", "pid": pids[process], "args": {"name": process}})
+        pid = pids[process]
+        base = data["started_at"]
+        args = {"run": run, "task_id": data["task_id"], "app": data.get("app"), "success": data.get("success")}
+        task_tid = track(pid, "tasks")
+        total = (data.get("timings") or {}).get("total")
+        if total is None:
+            total = max(span[2] for step in data["step_timings"] for span in step["spans"])
+        events.append({"name": data["task_id"], "cat": "task", "ph": "X", "pid": pid, "tid": task_tid,
+                       "ts": _us(base), "dur": _us(total), "args": args})
+        for step in data["step_timings"]:
+            spans = step.get("spans") or []
+            if not spans:
+                continue
+            if step["step"] > 0:
+                first, last = min(s[1] for s in spans), max(s[2] for s in spans)
+                events.append({"name": f"step {step['step']}", "cat": "step", "ph": "X", "pid": pid,
+                               "tid": track(pid, "steps"), "ts": _us(base + first), "dur": _us(last - first),
+                               "args": dict(args, step=step["step"], wall=step.get("wall"),
+                                            overlapped=step.get("overlapped"))})
+            for name, start, end, thread in spans:
+                events.append({"name": name, "cat": "phase", "ph": "X", "pid": pid, "tid": track(pid, thread),
+                               "ts": _us(base + start), "dur": _us(end - start),
+                               "args": dict(args, step=step["step"])})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def phase_breakdown(trajectories: List[Tuple[str, Dict[str, Any]]], by: str = "app") -> Dict[str, Dict[str, float]]:
+    """{app 或 run: {阶段: 总秒数, "total": 任务总耗时之和, "tasks": 任务数}}。"""
+    breakdown: Dict[str, Dict[str, float]] = {}
+    for run, data in trajectories:
+        key = run if by == "run" else (data.get("app") or "-")
+        row = breakdown.setdefault(key, {"tasks": 0, "total": 0.0})
+        row["tasks"] += 1
+        for name, cost in (data.get("timings") or {}).items():
+            row[name] = round(row.get(name, 0.0) + cost, 3)
+    return breakdown
+
+
+def print_breakdown(breakdown: Dict[str, Dict[str, float]], top: int = 6):
+    for key, row in sorted(breakdown.items(), key=lambda item: -item[1]["total"]):
+        phases = sorted(((k, v) for k, v in row.items() if k not in _NON_PHASE + ("tasks",)), key=lambda kv: -kv[1])
+        share = ", ".join(f"{k} {v:.1f}s ({v / row['total'] * 100:.0f}%)" for k, v in phases[:top]) if row["total"] else ""
+        print(f"[Trace] {key:<32} tasks={int(row['tasks']):<4} total={row['total']:.1f}s | {share}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export per-step phase timings as a Chrome trace")
+    parser.add_argument("--result_dir", type=str, required=True, help="逗号分隔的结果目录，如 result/round1")
+    parser.add_argument("--output", type=str, default=None, help="trace JSON 输出路径")
+    parser.add_argument("--by", type=str, default="app", choices=["app", "run"], help="耗时汇总的分组")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    trajectories = load_trajectories([d for d in args.result_dir.split(",") if d])
+    if not trajectories:
+        print(f"[Trace] {args.result_dir} 下没有带阶段耗时的轨迹")
+        return
+    if args.output:
+        trace = build_trace(trajectories)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(trace, f, ensure_ascii=False)
+        print(f"[Trace] {len(trajectories)} 条轨迹，{len(trace['traceEvents'])} 个事件 -> {args.output}")
+    print_breakdown(phase_breakdown(trajectories, by=args.by))
+
+
+if __name__ == "__main__":
+    main()
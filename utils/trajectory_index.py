@@ -0,0 +1,297 @@
+"""
+轨迹索引：result/trajectory_index.db（SQLite，WAL 模式），跨运行、跨模型的结果目录汇总在一处。
+
+ResultSink.save 每保存一条轨迹就写入一行，查询（如"某 app 在所有模型上的 Premature 失败"）
+只读索引，不再遍历、解析 result/<run>/<task>/trajectory.json 与每一步的 PNG / XML。
+
+表结构：
+    trajectories  每个 (run, task_id) 一行：模型、app、目标、结果分类、步数、尝试次数、耗时、轨迹路径
+    steps         每步一行：动作类型、参数、截图 / XML 路径与大小、该步耗时与各阶段耗时
+
+已有的结果目录可用命令行回填：
+    python -m utils.trajectory_index --build result/round1,result/round2 --task_file top12.csv
+    python -m utils.trajectory_index --category Premature --app com.taobao.taobao
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils import artifact_store
+from utils.evaluator_xpath import categorize
+
+DEFAULT_INDEX_PATH = Path("result") / "trajectory_index.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trajectories (
+    run TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    model TEXT,
+    app TEXT,
+    goal TEXT,
+    success INTEGER NOT NULL,
+    finished INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    steps INTEGER NOT NULL,
+    attempt INTEGER,
+    total_seconds REAL,
+    timings TEXT,
+    path TEXT,
+    indexed_at REAL NOT NULL,
+    PRIMARY KEY (run, task_id)
+);
+CREATE TABLE IF NOT EXISTS steps (
+    run TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    step INTEGER NOT NULL,
+    action TEXT,
+    params TEXT,
+    image_path TEXT,
+    image_bytes INTEGER,
+    xml_path TEXT,
+    xml_bytes INTEGER,
+    wall REAL,
+    phases TEXT,
+    PRIMARY KEY (run, task_id, step)
+);
+CREATE INDEX IF NOT EXISTS idx_traj_app_category ON trajectories (app, category);
+CREATE INDEX IF NOT EXISTS idx_traj_model_category ON trajectories (model, category);
+CREATE INDEX IF NOT EXISTS idx_traj_task ON trajectories (task_id);
+CREATE INDEX IF NOT EXISTS idx_steps_action ON steps (action);
+"""
+
+# 旧版本建的库缺少的列：打开时补上
+_STEP_COLUMNS_ADDED = (("wall", "REAL"), ("phases", "TEXT"))
+
+_TRAJECTORY_COLUMNS = ("run", "task_id", "model", "app", "goal", "success", "finished", "category", "steps",
+                       "attempt", "total_seconds", "timings", "path", "indexed_at")
+
+
+def _file_size(path: str) -> Optional[int]:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+class TrajectoryIndex:
+    """索引的读写；一个进程内共享一个连接，多进程通过 WAL + busy_timeout 并发写。"""
+
+    def __init__(self, path: Path = DEFAULT_INDEX_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(steps)")}
+        for column, kind in _STEP_COLUMNS_ADDED:
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE steps ADD COLUMN {column} {kind}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---------- 写 ----------
+
+    def add(self, run: str, data: Dict[str, Any], model: Optional[str] = None, app: Optional[str] = None,
+            path: Optional[str] = None):
+        """
+        写入一条轨迹（trajectory.json 的内容），同一 (run, task_id) 覆盖旧记录。
+
+        Args:
+            run: 结果目录名（result/ 下的子目录）
+            data: Trajectory.__dict__ 或读出的 trajectory.json
+            model / app: 缺省时取 data 中的同名字段
+            path: trajectory.json 的路径
+        """
+        actions = data.get("history_action") or []
+        images = data.get("history_image_path") or []
+        success = bool(data.get("success"))
+        finished = bool(actions) and isinstance(actions[-1], dict) and actions[-1].get("action") == "terminate"
+        timings = data.get("timings") or {}
+        refs = data.get("history_artifacts") or []
+        # step_timings 的第 0 项是任务级阶段，其余按步号对应
+        step_timings = {t["step"]: t for t in data.get("step_timings") or [] if t.get("step")}
+        store = None
+        if refs:
+            root = artifact_store.resolve_root(data, os.path.dirname(path) if path else None)
+            store = artifact_store.get_store(root) if root is not None and root.is_dir() else None
+        row = (run, data["task_id"], model or data.get("model"), app or data.get("app"), data.get("task_goal"),
+               int(success), int(finished), categorize(success, finished), len(actions), data.get("attempt"),
+               timings.get("total"), json.dumps(timings, ensure_ascii=False) if timings else None,
+               path, time.time())
+        step_rows = []
+        for step, action in enumerate(actions):
+            image_path = images[step] if step < len(images) else None
+            xml_path = image_path.replace("png", "xml") if image_path else None
+            # 新格式的 XML 只在内容寻址存储中，记录对象路径
+            digest = refs[step].get("xml") if step < len(refs) else None
+            if digest and store is not None:
+                xml_path = str(store.text_path(digest) or xml_path)
+            if isinstance(action, dict):
+                kind, params = action.get("action"), json.dumps(action.get("params"), ensure_ascii=False)
+            else:
+                kind, params = str(action), None
+            timing = step_timings.get(step + 1) or {}
+            step_rows.append((run, data["task_id"], step, kind, params,
+                              image_path, _file_size(image_path) if image_path else None,
+                              xml_path, _file_size(xml_path) if xml_path else None,
+                              timing.get("wall"), json.dumps(timing["phases"]) if timing.get("phases") else None))
+        with self._lock, self._conn:
+            self._conn.execute(f"INSERT OR REPLACE INTO trajectories ({', '.join(_TRAJECTORY_COLUMNS)}) "
+                               f"VALUES ({', '.join('?' * len(_TRAJECTORY_COLUMNS))})", row)
+            self._conn.execute("DELETE FROM steps WHERE run = ? AND task_id = ?", (run, data["task_id"]))
+            self._conn.executemany("INSERT INTO steps (run, task_id, step, action, params, image_path, image_bytes, "
+                                   "xml_path, xml_bytes, wall, phases) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   step_rows)
+
+    def build(self, run_dir: Path, model: Optional[str] = None, apps: Optional[Dict[str, str]] = None) -> int:
+        """回填一个已有的结果目录，返回写入的轨迹数。apps 为 task_id -> app（来自任务 CSV）。"""
+        run_dir = Path(run_dir)
+        count = 0
+        for path in sorted(glob.glob(str(run_dir / "*" / "trajectory.json"))):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[TrajIndex] 跳过无法读取的轨迹 {path}: {e}")
+                continue
+            app = (apps or {}).get(data.get("task_id"))
+            self.add(run_dir.name, data, model=model or data.get("model") or run_dir.name, app=app, path=path)
+            count += 1
+        return count
+
+    # ---------- 查询 ----------
+
+    def _select(self, sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, tuple(params))]
+
+    @staticmethod
+    def _where(**filters: Any):
+        clauses, params = [], []
+        for column, value in filters.items():
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple, set)):
+                clauses.append(f"t.{column} IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                clauses.append(f"t.{column} = ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, category=None, app=None, model=None, run=None, task_id=None, success=None,
+              action: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        按条件筛选轨迹，每个参数可为单值或列表。action 表示轨迹中至少有一步是该动作类型。
+        例：query(category="Premature", app="com.taobao.taobao") 返回该 app 在所有模型上的 Premature 失败。
+        """
+        where, params = self._where(category=category, app=app, model=model, run=run, task_id=task_id,
+                                    success=None if success is None else int(success))
+        if action is not None:
+            where += (" AND " if where else " WHERE ") + \
+                "EXISTS (SELECT 1 FROM steps s WHERE s.run = t.run AND s.task_id = t.task_id AND s.action = ?)"
+            params.append(action)
+        sql = f"SELECT * FROM trajectories t{where} ORDER BY t.run, t.task_id"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return self._select(sql, params)
+
+    def steps(self, run: str, task_id: str) -> List[Dict[str, Any]]:
+        return self._select("SELECT * FROM steps WHERE run = ? AND task_id = ? ORDER BY step", (run, task_id))
+
+    def category_counts(self, by: str = "model", **filters: Any) -> Dict[str, Dict[str, int]]:
+        """{by 的取值: {"SR": n, "Overdue": n, "Premature": n, "HardFail": n}}，by 为 model / app / run。"""
+        if by not in ("model", "app", "run"):
+            raise ValueError(f"unsupported group: {by}")
+        where, params = self._where(**filters)
+        result: Dict[str, Dict[str, int]] = {}
+        for row in self._select(f"SELECT t.{by} AS key, t.category AS category, COUNT(*) AS n "
+                                f"FROM trajectories t{where} GROUP BY t.{by}, t.category", params):
+            result.setdefault(row["key"], {})[row["category"]] = row["n"]
+        return result
+
+    def action_counts(self, **filters: Any) -> Dict[str, int]:
+        where, params = self._where(**filters)
+        rows = self._select(f"SELECT s.action AS action, COUNT(*) AS n FROM steps s "
+                            f"JOIN trajectories t ON s.run = t.run AND s.task_id = t.task_id{where} "
+                            f"GROUP BY s.action ORDER BY n DESC", params)
+        return {row["action"]: row["n"] for row in rows}
+
+
+_indexes: Dict[str, TrajectoryIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(path: Path = DEFAULT_INDEX_PATH) -> TrajectoryIndex:
+    """同一路径在进程内只打开一次，所有设备 worker 共享。"""
+    key = os.path.abspath(path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = TrajectoryIndex(path)
+        return index
+
+
+def load_task_apps(task_file: str) -> Dict[str, str]:
+    """任务 CSV 中 task_identifier -> app 包名（adb_home_page 的 "pkg/activity" 前半段）。"""
+    apps = {}
+    with open(task_file, encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            home = row.get("adb_home_page") or ""
+            if row.get("task_identifier") and home:
+                apps[row["task_identifier"]] = home.split("/", 1)[0]
+    return apps
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build or query the trajectory index")
+    parser.add_argument("--index", type=str, default=str(DEFAULT_INDEX_PATH))
+    parser.add_argument("--build", type=str, default=None, help="逗号分隔的结果目录（如 result/round1），回填到索引")
+    parser.add_argument("--task_file", type=str, default=None, help="回填时用于补全 app 的任务 CSV")
+    parser.add_argument("--category", type=str, default=None, help="SR / Overdue / Premature / HardFail")
+    parser.add_argument("--app", type=str, default=None)
+    parser.add_argument("--model", type=str, default=None)
+    parser.add_argument("--run", type=str, default=None)
+    parser.add_argument("--action", type=str, default=None, help="轨迹中出现过的动作类型，如 swipe")
+    parser.add_argument("--limit", type=int, default=50)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    index = TrajectoryIndex(Path(args.index))
+    if args.build:
+        apps = load_task_apps(args.task_file) if args.task_file else None
+        for run_dir in [d for d in args.build.split(",") if d]:
+            start = time.perf_counter()
+            count = index.build(Path(run_dir), apps=apps)
+            print(f"[TrajIndex] {run_dir}: {count} 条轨迹，耗时 {time.perf_counter() - start:.2f}s")
+        return
+
+    start = time.perf_counter()
+    rows = index.query(category=args.category, app=args.app, model=args.model, run=args.run,
+                       action=args.action, limit=args.limit)
+    elapsed = (time.perf_counter() - start) * 1000
+    for row in rows:
+        print(f"{row['run']:<28}{row['task_id']:<32}{row['app'] or '-':<28}{row['category']:<10}"
+              f"steps={row['steps']:<3} {row['path'] or ''}")
+    print(f"[TrajIndex] {len(rows)} 条，查询耗时 {elapsed:.1f}ms")
+    for key, counts in index.category_counts(by="model", app=args.app, run=args.run).items():
+        print(f"[TrajIndex] {key}: {counts}")
+
+
+if __name__ == "__main__":
+    main()
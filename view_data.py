@@ -3,6 +3,7 @@ from datetime import datetime
 import time
 
 import streamlit as st
+import hashlib
 import json
 import os
 from pathlib import Path
@@ -21,6 +22,12 @@ except ImportError:
     HAS_FCNTL = False
 
 PAGE_URL = os.getenv("PAGE_URL", "http://10.189.149.105:18000")
+# 缩略图与标注图的磁盘缓存目录，多个会话 / 多次启动共用
+VIEWER_CACHE_DIR = os.getenv("VIEWER_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "mobilebench_viewer"))
+THUMB_WIDTH = 480
+PAGE_SIZES = [10, 20, 50, 100]
+# 列表页只需要任务级字段，逐步历史在选中任务后再读
+_HEAVY_FIELDS = ("history_action", "history_image_path", "history_response", "summary")
 
 
 def load_manual_check_results(base_dir):
@@ -546,8 +553,6 @@ def load_jsonl_data(file_path):
     return data
 
 
-import json
-
 def load_json_file(file_path):
     """读取JSON文件并返回内容"""
     try:
@@ -559,6 +564,113 @@ def load_json_file(file_path):
         return None
 
 
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+@st.cache_data(show_spinner=False)
+def list_task_dirs(model_dir, mtime):
+    """模型目录下的 task_* 子目录；mtime 只用作缓存键，目录有新任务时失效。"""
+    import re
+
+    def sort_key(dir_name):
+        match = re.search(r'_(\d+)$', dir_name)  # 匹配最后的数字
+        if match:
+            return int(match.group(1))
+        else:
+            print(f"[WARN] 未找到数字部分: {dir_name}")
+            return float('inf')
+
+    return [os.path.join(model_dir, name) for name in sorted(os.listdir(model_dir), key=sort_key)
+            if name.startswith("task_") and os.path.isdir(os.path.join(model_dir, name))]
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def load_trajectory(traj_path, mtime):
+    """完整的 trajectory.json，只在查看某个任务时读取。"""
+    return load_json_file(traj_path)
+
+
+@st.cache_data(show_spinner=False, max_entries=10000)
+def load_episode_summary(traj_path, mtime):
+    """列表、筛选与统计用的任务级字段（不含逐步历史），按文件 mtime 缓存。"""
+    chain = load_json_file(traj_path)
+    if chain is None:
+        return None
+    summary = {k: v for k, v in chain.items() if k not in _HEAVY_FIELDS}
+    summary["steps"] = len(chain.get("history_action") or [])
+    summary["path"] = traj_path
+    return summary
+
+
+class ImageCache:
+    """
+    截图的磁盘缓存：标注后的缩略图与标注后的原图各生成一次。
+    文件名由源图路径、mtime、大小与标注参数哈希得到，源图被覆盖后自动失效；
+    先写临时文件再 os.replace，多个会话同时生成同一张图也不会读到半个文件。
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _target(self, image_path, annotation, kind, ext):
+        stat = os.stat(image_path)
+        key = json.dumps([os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size, annotation, kind],
+                         sort_keys=True, default=str)
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.{ext}")
+
+    @staticmethod
+    def _render(image_path, annotation):
+        img = Image.open(image_path)
+        img.load()
+        if annotation:
+            func, params = annotation
+            img = process_image_with_action(img, func, params, normed_pos=False)
+        return img
+
+    @staticmethod
+    def _save(img, target, **kwargs):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        img.save(tmp, **kwargs)
+        os.replace(tmp, target)
+
+    def thumbnail(self, image_path, annotation=None, width=THUMB_WIDTH):
+        target = self._target(image_path, annotation, f"thumb{width}", "jpg")
+        if not os.path.exists(target):
+            img = self._render(image_path, annotation).convert("RGB")
+            img.thumbnail((width, width * 4))
+            self._save(img, target, format="JPEG", quality=85)
+        return target
+
+    def full(self, image_path, annotation=None):
+        if not annotation:
+            return image_path
+        target = self._target(image_path, annotation, "full", "png")
+        if not os.path.exists(target):
+            self._save(self._render(image_path, annotation), target, format="PNG", compress_level=1)
+        return target
+
+
+@st.cache_resource
+def get_image_cache(cache_dir=VIEWER_CACHE_DIR):
+    return ImageCache(cache_dir)
+
+
+def step_annotation(action):
+    """需要在截图上标注的动作参数；没有可标注内容时返回 None。"""
+    func = action["action"]
+    if func.lower() in ['click', 'tap']:
+        position = action["params"]["position"]
+        return func, {"x": position[0], "y": position[1]}
+    return None
+
+
 def normalize_path(path_str, base_dir):
     """Normalize path to handle Windows/Linux path formats"""
     if not path_str:
@@ -623,32 +735,25 @@ def filter_data(data, app_filter, task_filter, success_filter, task_id_filter, r
     return filtered_data
 
 
-def display_step_data(step_data, base_dir):
+def display_step_data(step_data, base_dir, image_cache=None):
     """Display a single step's data with image and annotations"""
+    image_cache = image_cache or get_image_cache()
     col1, col2 = st.columns([1, 2])
 
     with col1:
-        # Display screenshot
+        # Display screenshot：默认显示缓存的标注缩略图，勾选后才加载原图
         screenshot_path = step_data.get('screenshot')
         if screenshot_path:
             normalized_path = screenshot_path
             if normalized_path and os.path.exists(normalized_path):
                 try:
-                    func = step_data["action"]["action"]
-                    params = {}
-                    if func.lower() in ['click', 'tap']:
-                        params['x'] = step_data["action"]["params"]["position"][0]
-                        params['y'] = step_data["action"]["params"]["position"][1]
-
-                    if params:
-                        annotated_image = process_image_with_action(normalized_path, func, params, normed_pos=False)
-                        if annotated_image:
-                            st.image(annotated_image, caption=normalized_path, use_container_width=True)
-                        else:
-                            # Fallback to original image
-                            st.image(normalized_path, caption=normalized_path, use_container_width=True)
+                    annotation = step_annotation(step_data["action"])
+                    if st.checkbox("查看原图", key=f"full_{normalized_path}"):
+                        st.image(image_cache.full(normalized_path, annotation), caption=normalized_path,
+                                 use_container_width=True)
                     else:
-                        st.image(normalized_path, caption=normalized_path, use_container_width=True)
+                        st.image(image_cache.thumbnail(normalized_path, annotation), caption=normalized_path,
+                                 use_container_width=True)
 
                 except Exception as e:
                     st.error(f"Error loading image: {e}")
@@ -683,48 +788,23 @@ def main():
 
     if not uploaded_file:
 
-        def get_subdirectories(folder_path):
-            subdirectories = []
-            for item in os.listdir(folder_path):
-                item_path = os.path.join(folder_path, item)
-                if os.path.isdir(item_path):
-                    subdirectories.append(item_path)
-            return subdirectories
         prefix = r"C:\\Users\\leonic\\Desktop\\GUI-exe\\result"
         models = ["internvl"]
         selected_model = st.sidebar.selectbox("选择模型:", models)
-        model_task_folder = {
-            selected_model: []
-        }
-        import re
-        def sort_key(dir_name):
-            match = re.search(r'_(\d+)$', dir_name)  # 匹配最后的数字
-            if match:
-                return int(match.group(1))
-            else:
-                print(f"[WARN] 未找到数字部分: {dir_name}")
-                return float('inf')
 
-        # for model in models:
+        # 只读任务级字段（按文件 mtime 缓存），逐步历史与截图在选中任务后再加载
         model_dir = os.path.join(prefix, selected_model)
-        all_task_dirs = sorted(os.listdir(model_dir), key=sort_key)
-        for sub_folder in all_task_dirs:
-            sub_folder_path = os.path.join(model_dir, sub_folder)
-            if sub_folder.startswith("task_"):
-                model_task_folder[selected_model].append(sub_folder_path)
-
-
         data = []
-        target_model_dir = model_task_folder[selected_model]
-        for task in target_model_dir:
+        for task in list_task_dirs(model_dir, _mtime(model_dir)):
             repeat_data = []
             for repeat_n in range(repeat_nums):
                # target_model_repeat_dir = os.path.join(task, f"repeat_{repeat_n + 1}")
-                target_model_repeat_task_path = os.path.join(target_model_dir, "trajectory.json")
-                with open(target_model_repeat_task_path, 'r', encoding='utf-8') as file:
-                    chain = json.load(file)
-                repeat_data.append(chain)
-            data.extend(repeat_data)
+                target_model_repeat_task_path = os.path.join(task, "trajectory.json")
+                chain = load_episode_summary(target_model_repeat_task_path, _mtime(target_model_repeat_task_path))
+                if chain is not None:
+                    repeat_data.append(chain)
+            if len(repeat_data) == repeat_nums:
+                data.extend(repeat_data)
 
 
     else:
@@ -821,17 +901,30 @@ def main():
         st.session_state.selected_repeat_n = selected_repeat_n
         st.rerun()
 
-    selected_index = st.sidebar.number_input(
-        "选择任务ID索引:",
-        min_value=0,
-        max_value=len(filtered_data)-1,
-        value=0,
+    # 分页：只为当前页列出任务
+    page_size = st.sidebar.selectbox("每页任务数:", PAGE_SIZES, index=1)
+    page_count = (len(filtered_data) + page_size - 1) // page_size
+    page = st.sidebar.number_input(
+        f"页码 (共 {page_count} 页):",
+        min_value=1,
+        max_value=page_count,
+        value=1,
         step=1
     )
+    page_start = (page - 1) * page_size
+    page_items = filtered_data[page_start:page_start + page_size]
+    selected_index = page_start + st.sidebar.selectbox(
+        "选择任务:",
+        range(len(page_items)),
+        format_func=lambda i: f"{page_start + i}: {page_items[i][0].get('task_id')}"
+                              f"{' ✅' if page_items[i][0].get('success') else ' ❌'}",
+    )
 
 
     if selected_index < len(filtered_data):
         selected_item = filtered_data[selected_index][selected_repeat_n]
+        if "path" in selected_item:
+            selected_item = dict(load_trajectory(selected_item["path"], _mtime(selected_item["path"])))
         st.header(f"任务ID {selected_index + 1}: {selected_item.get('query', 'Unknown')}")
 
         # # 人工标注部分
@@ -944,8 +1037,9 @@ def main():
         if 'data' in selected_item and selected_item['data']:
             st.header("Steps")
 
+            image_cache = get_image_cache()
             for i, step_data in enumerate(selected_item['data']):
-                display_step_data(step_data, os.path.join(prefix, selected_model))
+                display_step_data(step_data, os.path.join(prefix, selected_model), image_cache)
                 st.divider()
         else:
             st.warning("No step data found for this episode.")